@@ -4,16 +4,24 @@
 # Copyright 2019-2021 André-Abush Clause, Sof and other contributors. Released under GPL.
 # <https://github.com/aaclause/nvda-markdownForever>
 
-import codecs
+import os
 import os.path as osp
+import queue
 import re
+import stat
 import threading
 import time
 import urllib.parse as urlParse
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import zlib
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import addonHandler
 import config
 from logHandler import log
+from . import fileLoader
+from . import includeCache
+from . import renderCache
+from . import renderer
 from .common import *
 
 addonHandler.initTranslation()
@@ -44,6 +52,12 @@ def mergeHTMLTemplate(
 	)
 
 
+eventsPath = "/__events__"
+liveReloadScript = """<script>
+new EventSource("%s?path=" + encodeURIComponent(location.pathname)).addEventListener("reload", function () { location.reload(); });
+</script>""" % eventsPath
+
+
 def indexOf(path):
 	ls = os.listdir(path)
 	out = "<h1>%s</h1><ul>" % _("Index of {path}").format(path=path)
@@ -57,12 +71,78 @@ def indexOf(path):
 	return out
 
 
-def getFile(path, params=None, baseDir=None):
+servedFilesCache = renderCache.RenderCache()
+# Key of the render settings, time it last changed, and configuration generation and live reload state it was computed for
+renderSettings = [None, 0, None]
+# Full path of the rendered Markdown files: (signature of the file, paths of the files it includes,
+# whether its content depends on the time of the render), see recordDependencies
+servedDependencies = {}
+# Window bits of zlib for each content coding: gzip container, zlib container.
+contentCodings = {"gzip": 31, "deflate": 15}
+# Smaller bodies are not worth compressing.
+minCompressSize = 1024
+
+
+def getFullPath(path, baseDir=None):
 	if not baseDir:
 		baseDir = config.conf["markdownForever"]["defaultPath"]
 	fullPath = realpath(baseDir) + path.replace('/', r'\\')
 	while "\\\\" in fullPath:
 		fullPath = fullPath.replace("\\\\", '\\')
+	return fullPath
+
+
+def getRenderSettingsKey():
+	"""Returns a key of the settings used to render files and the time they last changed.
+	The key is only computed again once the configuration may have changed, see renderer.onConfigChanged."""
+	state = (renderer.configGeneration, bool(liveReload))
+	if renderSettings[2] == state:
+		return renderSettings[:2]
+	conf = config.conf["markdownForever"]
+	key = renderCache.getKey(
+		[conf[k] for k in ("markdown2Extras", "HTMLTemplate", "toc", "toc-back", "autonumber-headings", "extratags", "extratags-back")],
+		conf["HTTPServer"]["defaultEncoding"], getHTMLTemplate()["content"], addonVersion, state[1])
+	if key != renderSettings[0]:
+		renderSettings[:2] = [key, time.time()]
+	renderSettings[2] = state
+	return renderSettings[:2]
+
+
+def recordDependencies(fullPath, dependencies, timeDependent):
+	"""Records what the last render of the Markdown file at fullPath depended on.
+	dependencies are the (path, signature) of the file and of the files it includes, see includeCache.IncludeCache.including."""
+	servedDependencies[fullPath] = (dependencies[0][1], tuple(path for path, signature in dependencies[1:]), timeDependent)
+
+
+def getValidators(fullPath):
+	"""Returns the ETag and the Last-Modified time of the file at fullPath, the files it included when last rendered included.
+	Returns None for directories, missing files and documents with extra tags whose value depends on the time."""
+	try:
+		st = os.stat(fullPath)
+	except OSError:
+		return None
+	if stat.S_ISDIR(st.st_mode):
+		return None
+	dependencies = []
+	record = servedDependencies.get(fullPath)
+	if record and record[0] == (st.st_mtime_ns, st.st_size):
+		if record[2]:
+			return None
+		dependencies = [includeCache.getSignature(path) for path in record[1]]
+	settingsKey, settingsTime = getRenderSettingsKey()
+	etag = '"%s"' % renderCache.getKey(fullPath, st.st_mtime_ns, st.st_size, dependencies, settingsKey)[:32]
+	mtimes = [signature[0] / 1e9 for signature in dependencies if signature]
+	return etag, max([st.st_mtime, settingsTime] + mtimes)
+
+
+def hasTimeExtraTags(metadata, *parts):
+	"""Whether the extra tags of a document whose metadata and text parts are given depend on the time."""
+	return bool(metadata["extratags"]) and any(
+		tag in part for part in parts if '%' in part for tag in renderer.timeExtraTags)
+
+
+def getFile(path, params=None, baseDir=None):
+	fullPath = getFullPath(path, baseDir)
 	status_code = 200
 	body = None
 	if not osp.exists(fullPath):
@@ -81,30 +161,272 @@ def getFile(path, params=None, baseDir=None):
 				title=_("Index of {path}").format(path=path),
 				body=body
 			)
+	encoding = config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"]
 	if not body:
-		f = codecs.open(
-			fullPath, encoding=config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"])
-		text = f.read()
 		if fullPath.endswith(".html") or fullPath.endswith(".htm"):
-			body = text
+			body = fileLoader.readText(fullPath, encoding)
 		else:
-			metadata, text = extractMetadata(text)
-			body = convertToHTML(text, metadata, display=False)
-			body = mergeHTMLTemplate(title=metadata["title"], body=body)
-			f.close()
-	return status_code, body.encode(config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"])
+			after = liveReloadScript if liveReload else ''
+			metadataBlock, text = fileLoader.loadMarkdown(fullPath, encoding)
+			with renderer.includedFiles.including(fullPath) as dependencies:
+				metadata, text = extractMetadata(text, metadataBlock)
+			recordDependencies(fullPath, dependencies, hasTimeExtraTags(metadata, metadataBlock or '', text))
+			if canStreamHTML(metadata):
+				ok, chunks = iterHTML(text, metadata, document=fullPath)
+				if ok:
+					return status_code, iterFile(chunks, metadata, encoding, after)
+				status_code = 500
+				body = mergeHTMLTemplate(title=_("Error 500"), body="<p>%s</p>" % escapeHTML(chunks))
+			else:
+				body = convertToHTML(text, metadata, display=False, document=fullPath)
+				body = mergeHTMLTemplate(title=metadata["title"], body=body + after)
+	return status_code, body.encode(encoding)
+
+
+def iterFile(chunks, metadata, encoding, after=''):
+	head, sep, tail = mergeHTMLTemplate(title=metadata["title"], body="{body}").partition("{body}")
+	yield head.encode(encoding)
+	for chunk in chunks:
+		yield chunk.encode(encoding)
+	yield (after + tail).encode(encoding)
+
+
+def getRootDirs():
+	rootDirs = [config.conf["markdownForever"]["defaultPath"]]
+	rootDirs += list(config.conf["markdownForever"]["HTTPServer"]["rootDirs"].copy().values())
+	return [osp.normcase(osp.join(realpath(rootDir), '')) for rootDir in rootDirs]
+
+
+def negotiateContentCoding(acceptEncoding):
+	"""Returns the content coding to use given an Accept-Encoding header, None for identity."""
+	accepted = {}
+	for item in (acceptEncoding or '').lower().split(','):
+		coding, sep, params = item.partition(';')
+		q = 1.0
+		for param in params.split(';'):
+			name, sep, value = param.strip().partition('=')
+			if name == 'q':
+				try:
+					q = float(value)
+				except ValueError:
+					q = 0.0
+		accepted[coding.strip()] = q
+	for coding in contentCodings:
+		if accepted.get(coding, accepted.get('*', 0)) > 0:
+			return coding
+	return None
+
+
+def compress(body, coding):
+	compressor = zlib.compressobj(6, zlib.DEFLATED, contentCodings[coding])
+	return compressor.compress(body) + compressor.flush()
+
+
+def getCodingETag(etag, coding):
+	"""Each content coding is a different representation, so it gets its own ETag."""
+	return etag[:-1] + '-%s"' % coding if coding else etag
+
+
+def cacheFile(fullPath, etag, body, compressed=None):
+	"""Stores a rendered body and its compressed versions ({coding: bytes}) in servedFilesCache."""
+	compressed = compressed or {}
+	size = len(body) + sum(len(e) for e in compressed.values())
+	servedFilesCache.set(fullPath, (etag, body, compressed), size)
+
+
+def renderToCache(path, fullPath):
+	"""Renders a file and stores the result in servedFilesCache, ready for the next GET.
+	Only the blocks that changed since the file was last rendered are rendered again."""
+	validators = getValidators(fullPath)
+	if not validators:
+		return
+	status_code, body = getFile(path)
+	if not isinstance(body, bytes):
+		body = b''.join(body)
+	# The render tells which files are included, and whether the document depends on the time
+	validators = getValidators(fullPath)
+	if validators and status_code == 200:
+		cacheFile(fullPath, validators[0], body)
+
+
+class LiveReload(threading.Thread):
+	"""Watches the files displayed by open pages.
+	When one changes, renders it again and sends a reload event to its pages."""
+
+	interval = 0.5
+
+	def __init__(self):
+		super().__init__(daemon=True)
+		self._stopEvent = threading.Event()
+		self._lock = threading.Lock()
+		# Full path: [URL path, modification time, set of event queues]
+		self._watched = {}
+
+	def subscribe(self, path):
+		"""Returns a queue receiving the events of the file at path, or None if the file is not served."""
+		fullPath = getFullPath(path)
+		if not osp.normcase(osp.abspath(fullPath)).startswith(tuple(getRootDirs())):
+			return None
+		try:
+			mtime = os.stat(fullPath).st_mtime_ns
+		except OSError:
+			return None
+		events = queue.Queue()
+		with self._lock:
+			entry = self._watched.setdefault(fullPath, [path, mtime, set()])
+			entry[2].add(events)
+		return events
+
+	def unsubscribe(self, events):
+		with self._lock:
+			for fullPath, entry in list(self._watched.items()):
+				entry[2].discard(events)
+				if not entry[2]:
+					del self._watched[fullPath]
+
+	def stop(self):
+		self._stopEvent.set()
+		with self._lock:
+			for path, mtime, subscribers in self._watched.values():
+				for events in subscribers:
+					events.put(None)
+
+	def isStopped(self):
+		return self._stopEvent.is_set()
+
+	def run(self):
+		while not self._stopEvent.wait(self.interval):
+			with self._lock:
+				watched = [(fullPath, entry[0], entry[1]) for fullPath, entry in self._watched.items()]
+			for fullPath, path, mtime in watched:
+				try:
+					newMtime = os.stat(fullPath).st_mtime_ns
+				except OSError:
+					continue
+				if newMtime == mtime:
+					continue
+				try:
+					renderToCache(path, fullPath)
+				except Exception as err:
+					log.error(err)
+				with self._lock:
+					entry = self._watched.get(fullPath)
+					if entry:
+						entry[1] = newMtime
+						for events in entry[2]:
+							events.put("reload")
 
 
 class Server(BaseHTTPRequestHandler):
 
+	protocol_version = "HTTP/1.1"
+	# Idle keep-alive connections are closed after this many seconds.
+	timeout = 60
+	# Headers and body are written separately: without this, Nagle's algorithm
+	# delays the body of responses on kept-alive connections.
+	disable_nagle_algorithm = True
+
 	def log_request(code='-', size='-'): pass
 
-	def _set_response(self, status_code=200):
+	def _set_response(self, status_code=200, content_length=None, validators=None, coding=None):
 		self.send_response(status_code)
 		self.send_header("Content-type", "text/html; charset=%s" %
 						 config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"])
+		if validators:
+			etag, lastModified = validators
+			self.send_header("ETag", getCodingETag(etag, coding))
+			self.send_header("Last-Modified", self.date_time_string(lastModified))
+			self.send_header("Cache-Control", "no-cache")
+		if validators or coding:
+			self.send_header("Vary", "Accept-Encoding")
+		if coding:
+			self.send_header("Content-Encoding", coding)
+		if content_length is None:
+			self.send_header("Transfer-Encoding", "chunked")
+		else:
+			self.send_header("Content-Length", str(content_length))
 		self.end_headers()
 
+	def _write_chunks(self, chunks, coding=None):
+		"""Sends chunks with the chunked transfer encoding, compressing them on the fly if a coding is given.
+		Returns the whole body and its compressed version, or None on error."""
+		body = []
+		compressed = []
+		compressor = zlib.compressobj(6, zlib.DEFLATED, contentCodings[coding]) if coding else None
+		try:
+			for chunk in chunks:
+				if not chunk:
+					continue
+				body.append(chunk)
+				if compressor:
+					# Sync flushes let the browser render each block as it comes.
+					chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+					compressed.append(chunk)
+				self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+			if compressor:
+				chunk = compressor.flush()
+				compressed.append(chunk)
+				self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+		except Exception as err:
+			log.error(err)
+			# Without the last chunk, the client knows that the body is incomplete
+			self.close_connection = True
+			return None, None
+		self.wfile.write(b"0\r\n\r\n")
+		return b''.join(body), b''.join(compressed)
+
+	def _is_not_modified(self, validators, coding=None):
+		"""Returns the ETag to send with a 304 response if the client has the current version of the file, None otherwise.
+		The version the client has may be in another coding than the negotiated one:
+		bodies too small to be compressed are sent as they are, with the ETag of the identity coding."""
+		etag, lastModified = validators
+		codingETag = getCodingETag(etag, coding)
+		ifNoneMatch = self.headers.get("If-None-Match")
+		if ifNoneMatch:
+			if ifNoneMatch.strip() == '*':
+				return codingETag
+			etags = [e.strip() for e in ifNoneMatch.split(',')]
+			for candidate in [codingETag, etag] + [getCodingETag(etag, other) for other in contentCodings]:
+				if candidate in etags:
+					return candidate
+			return None
+		ifModifiedSince = self.headers.get("If-Modified-Since")
+		if ifModifiedSince:
+			try:
+				if int(lastModified) <= parsedate_to_datetime(ifModifiedSince).timestamp():
+					return codingETag
+			except (TypeError, ValueError):
+				pass
+		return None
+
+	def _send_events(self, path):
+		"""Streams the reload events of the file at path (Server-Sent Events)."""
+		watcher = liveReload
+		events = watcher.subscribe(path) if watcher else None
+		if not events:
+			self.send_error(404)
+			return
+		self.close_connection = True
+		try:
+			self.send_response(200)
+			self.send_header("Content-type", "text/event-stream")
+			self.send_header("Cache-Control", "no-cache")
+			self.send_header("Connection", "close")
+			self.end_headers()
+			self.wfile.write(b"retry: 1000\n\n")
+			while not watcher.isStopped():
+				try:
+					event = events.get(timeout=15)
+				except queue.Empty:
+					self.wfile.write(b": keep-alive\n\n")
+					continue
+				if event:
+					self.wfile.write(b"event: %s\ndata:\n\n" % event.encode())
+		except OSError:
+			pass
+		finally:
+			watcher.unsubscribe(events)
+
 	def do_GET(self):
 		path = urlParse.unquote(self.path)
 		params = {}
@@ -112,17 +434,62 @@ class Server(BaseHTTPRequestHandler):
 			splitPath = path.split('?')
 			params = dict(urlParse.parse_qsl(''.join(splitPath[1:])))
 			path = splitPath[0]
+		if path == eventsPath:
+			return self._send_events(params.get("path", ''))
+		fullPath = getFullPath(path)
+		validators = getValidators(fullPath)
+		coding = negotiateContentCoding(self.headers.get("Accept-Encoding"))
+		notModifiedETag = self._is_not_modified(validators, coding) if validators else None
+		if notModifiedETag:
+			self.send_response(304)
+			self.send_header("ETag", notModifiedETag)
+			self.send_header("Last-Modified", self.date_time_string(validators[1]))
+			self.send_header("Vary", "Accept-Encoding")
+			self.end_headers()
+			return
+		cached = servedFilesCache.get(fullPath) if validators else None
+		if cached and cached[0] == validators[0]:
+			etag, body, compressed = cached
+			if coding and len(body) >= minCompressSize:
+				if coding not in compressed:
+					compressed = dict(compressed)
+					compressed[coding] = compress(body, coding)
+					cacheFile(fullPath, etag, body, compressed)
+				body = compressed[coding]
+			else:
+				coding = None
+			self._set_response(200, len(body), validators, coding)
+			self.wfile.write(body)
+			return
 		satus_code, body = getFile(path, params)
-		self._set_response(satus_code)
-		self.wfile.write(body)
+		if validators:
+			# The render tells which files are included, and whether the document depends on the time
+			validators = getValidators(fullPath)
+		compressed = {}
+		if isinstance(body, bytes):
+			if coding and len(body) >= minCompressSize:
+				compressed[coding] = compress(body, coding)
+				self._set_response(satus_code, len(compressed[coding]), validators, coding)
+				self.wfile.write(compressed[coding])
+			else:
+				self._set_response(satus_code, len(body), validators)
+				self.wfile.write(body)
+		else:
+			self._set_response(satus_code, validators=validators, coding=coding)
+			body, compressedBody = self._write_chunks(body, coding)
+			if coding:
+				compressed[coding] = compressedBody
+		if validators and satus_code == 200 and body is not None:
+			cacheFile(fullPath, validators[0], body, compressed)
 
 	def do_POST(self):
 		# <--- Gets the size of data
 		content_length = int(self.headers["Content-Length"])
 		# <--- Gets the data itself
 		post_data = self.rfile.read(content_length)
-		self._set_response()
-		self.wfile.write(f"POST request for {self.path}".encode("utf-8"))
+		body = f"POST request for {self.path}".encode("utf-8")
+		self._set_response(content_length=len(body))
+		self.wfile.write(body)
 
 
 class CreateHTTPServer(threading.Thread):
@@ -130,7 +497,7 @@ class CreateHTTPServer(threading.Thread):
 	httpd = None
 
 	def run(self):
-		server_class = HTTPServer
+		server_class = ThreadingHTTPServer
 		handler_class = Server
 		host = config.conf["markdownForever"]["HTTPServer"]["host"]
 		port = config.conf["markdownForever"]["HTTPServer"]["port"]
@@ -140,20 +507,28 @@ class CreateHTTPServer(threading.Thread):
 
 
 httpdThread = None
+liveReload = None
 
 
 def run():
-	global httpdThread
+	global httpdThread, liveReload
 	if httpdThread:
 		return
+	if config.conf["markdownForever"]["HTTPServer"]["liveReload"]:
+		liveReload = LiveReload()
+		liveReload.start()
 	httpdThread = CreateHTTPServer()
 	httpdThread.start()
 
 
 def stop():
-	global httpdThread
+	global httpdThread, liveReload
 	if not httpdThread:
 		return
+	if liveReload:
+		liveReload.stop()
+		liveReload.join()
+		liveReload = None
 	httpdThread.httpd.shutdown()
 	httpdThread.httpd.socket.close()
 	httpdThread.join()
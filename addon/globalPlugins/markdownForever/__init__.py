@@ -4,12 +4,12 @@
 # Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
 # <https://github.com/aaclause/nvda-markdownForever>
 
-import codecs
 import json
 import os
 import os.path
 import re
 import sys
+import threading
 
 import gui
 import wx
@@ -23,12 +23,14 @@ import scriptHandler
 import ui
 from logHandler import log
 
+from . import fileLoader
 from . import updatecheck
-from . import settings
-from . import HTTPServer
+from .virtualDocuments import isVirtualDocument
+from .conversionWorker import ConversionWorker, callAfter
 from .common import (
 	convertToHTML, convertToMD, copyToClipAsHTML,
-	getText, extractMetadata, getMetadataAndTextForMarkDown,
+	getText, getSelectedText, loadText,
+	extractMetadata, getMetadataAndTextForMarkDown, onConfigChanged,
 	addonSummary, addonVersion,
 	addonPath, baseDir, configDir,
 	defaultLanguage
@@ -61,7 +63,12 @@ confSpecs = {
 		"host": 'string(default="127.0.0.1")',
 		"port": "integer(min=1, max=65535, default=8794)",
 		"defaultEncoding": 'string(default="UTF-8")',
+		"liveReload": 'boolean(default=True)',
 		"rootDirs": {}
+	},
+	"virtualDocuments": {
+		"maxNodes": "integer(min=0, default=100000)",
+		"maxTime": "integer(min=0, default=30)",
 	}
 }
 config.conf.spec["markdownForever"] = confSpecs
@@ -77,6 +84,12 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
 	def __init__(self):
 		self.createMenu()
+		config.post_configProfileSwitch.register(onConfigChanged)
+		config.post_configReset.register(onConfigChanged)
+		self.conversionWorker = ConversionWorker()
+		# Cancel events of the virtual documents being captured, by script name
+		self.captures = {}
+		self.conversionWorker.start()
 		self.updatecheckThread = updatecheck.UpdateCheck()
 		self.updatecheckThread.start()
 		if not self.updatecheckThread.is_alive():
@@ -95,12 +108,7 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 				wx.EVT_MENU, lambda evt, lang=lang: self.onDoc(evt, lang), item)
 		item = self.submenu.Append(wx.ID_ANY, "%s..." %
 								   _("Settings"), _("Add-on settings"))
-		gui.mainFrame.sysTrayIcon.Bind(
-			wx.EVT_MENU,
-			lambda event: wx.CallAfter(
-				gui.mainFrame._popupSettingsDialog, settings.AddonSettingsDialog),
-			item
-		)
+		gui.mainFrame.sysTrayIcon.Bind(wx.EVT_MENU, self.onSettings, item)
 		item = self.submenu.Append(
 			wx.ID_ANY, _("&HTTP server"), _("Start HTTP server"))
 		gui.mainFrame.sysTrayIcon.Bind(wx.EVT_MENU, self.onHTTPServer, item)
@@ -129,16 +137,30 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		gui.mainFrame.sysTrayIcon.menu.DestroyItem(self.submenu_item)
 
 	def terminate(self):
-		HTTPServer.stop()
+		# The HTTP server module is only imported once the server is started from the menu
+		HTTPServer = sys.modules.get(f"{__name__}.HTTPServer")
+		if HTTPServer:
+			HTTPServer.stop()
 		self.removeMenu()
+		config.post_configProfileSwitch.unregister(onConfigChanged)
+		config.post_configReset.unregister(onConfigChanged)
+		for cancelEvent in self.captures.values():
+			cancelEvent.set()
+		self.conversionWorker.stop()
 		self.updatecheckThread.stop()
 		self.updatecheckThread.join()
 		if self.updatecheckThread.is_alive():
 			log.debug("Update check system stopped")
 		super().terminate()
 
+	@staticmethod
+	def onSettings(evt):
+		from . import settings
+		wx.CallAfter(gui.mainFrame._popupSettingsDialog, settings.AddonSettingsDialog)
+
 	@staticmethod
 	def onHTTPServer(evt):
+		from . import HTTPServer
 		if not HTTPServer.isRun():
 			HTTPServer.run()
 		host = config.conf["markdownForever"]["HTTPServer"]["host"]
@@ -150,11 +172,8 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		MDLocation = os.path.join(addonPath, "doc", lang + ".md")
 		if not os.path.exists(MDLocation):
 			MDLocation = os.path.join(addonPath, "doc", "en"+".md")
-		f = codecs.open(MDLocation, "rb")
-		raw = f.read()
-		if raw.startswith(codecs.BOM_UTF8):
-			raw = raw[3:]
-		metadata, text = extractMetadata(raw.decode("UTF-8"))
+		metadataBlock, text = fileLoader.loadMarkdown(MDLocation)
+		metadata, text = extractMetadata(text, metadataBlock)
 		HTMLLocation = MDLocation.replace(".md", ".html")
 		convertToHTML(
 			text, metadata,
@@ -171,23 +190,77 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	def onWebsite(evt):
 		return os.startfile("https://github.com/aaclause/nvda-markdownForever")
 
-	def script_md2htmlSrcInNVDA(self, gesture):
-		text, err = getText()
-		if err:
-			return ui.message(err)
+	def cancelConversion(self, name):
+		"""Cancels the conversion started by the script name if it is not finished. Returns True if so."""
+		capture = self.captures.pop(name, None)
+		if capture:
+			capture.set()
+		if capture or self.conversionWorker.cancel(name):
+			ui.message(_("Conversion cancelled"))
+			return True
+		return False
+
+	def convertMarkdown(self, name, convert):
+		"""Gets the selected text, then calls convert(text, metadata, cancelEvent) in the conversion worker.
+		If the text is a path or a URL, the document is loaded by the worker too.
+		Running the script name again before the conversion is finished cancels it."""
+		if self.cancelConversion(name):
+			return
+		text = getSelectedText()
 		if not text:
 			return ui.message(_("No text"))
-		metadata, text = extractMetadata(text)
-		convertToHTML(text, metadata, save=False,
-					  src=True, useTemplateHTML=False)
+
+		def job(cancelEvent):
+			content, err = loadText(text)
+			if err:
+				return callAfter(cancelEvent, ui.message, err)
+			if not content:
+				return callAfter(cancelEvent, ui.message, _("No text"))
+			metadata, body = extractMetadata(content)
+			convert(body, metadata, cancelEvent)
+		self.conversionWorker.submit(name, job)
+
+	def convertHTML(self, name, convert):
+		"""Like convertMarkdown, except that the HTML of virtual documents (web pages) is captured first."""
+		if not isVirtualDocument():
+			return self.convertMarkdown(name, convert)
+		if self.cancelConversion(name):
+			return
+		# Created before the capture, which can be cancelled too
+		cancelEvent = threading.Event()
+		self.captures[name] = cancelEvent
+
+		def onCaptured(metadata, text):
+			if self.captures.get(name) is cancelEvent:
+				del self.captures[name]
+			if not metadata or cancelEvent.is_set():
+				return
+			if not text:
+				return ui.message(_("No text"))
+			self.conversionWorker.submit(name, lambda cancelEvent: convert(text, metadata, cancelEvent), cancelEvent)
+
+		getMetadataAndTextForMarkDown(onCaptured, cancelEvent)
+
+	@staticmethod
+	def copyToClip(content, msg):
+		api.copyToClip(content)
+		ui.message(msg)
+
+	@staticmethod
+	def copyFormattedHTML(content):
+		if copyToClipAsHTML(content):
+			ui.message(_("Formatted HTML copied to clipboard"))
+		else:
+			ui.message(_("An error occured"))
+
+	def script_md2htmlSrcInNVDA(self, gesture):
+		self.convertMarkdown("md2htmlSrcInNVDA", lambda text, metadata, cancelEvent: convertToHTML(
+			text, metadata, save=False, src=True, useTemplateHTML=False, cancelEvent=cancelEvent))
 	script_md2htmlSrcInNVDA.__doc__ = _("Show the HTML source from Markdown")
 
 	def script_html2md(self, gesture):
-		metadata, text = getMetadataAndTextForMarkDown()
-		if not text:
-			return ui.message(_("No text"))
-		if metadata:
-			convertToMD(text, metadata)
+		self.convertHTML("html2md", lambda text, metadata, cancelEvent: convertToMD(
+			text, metadata, cancelEvent=cancelEvent))
 	script_html2md.__doc__ = _("HTML to Markdown conversion")
 
 	def extractMetadata(self, text):
@@ -197,63 +270,40 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		return convertToMD(text, metadata)
 
 	def script_md2htmlInNVDA(self, gesture):
-		text, err = getText()
-		if err:
-			return ui.message(err)
-		if not text:
-			return ui.message(_("No text"))
-		metadata, text = extractMetadata(text)
-		convertToHTML(text, metadata)
+		self.convertMarkdown("md2htmlInNVDA", lambda text, metadata, cancelEvent: convertToHTML(
+			text, metadata, cancelEvent=cancelEvent))
 	script_md2htmlInNVDA.__doc__ = _("Markdown to HTML conversion. The result is displayed in a virtual buffer of NVDA")
 
 	def script_md2htmlInBrowser(self, gesture):
-		text, err = getText()
-		if err:
-			return ui.message(err)
-		if not text:
-			return ui.message(_("No text"))
-		metadata, text = extractMetadata(text)
-		convertToHTML(text, metadata, save=True)
+		self.convertMarkdown("md2htmlInBrowser", lambda text, metadata, cancelEvent: convertToHTML(
+			text, metadata, save=True, cancelEvent=cancelEvent))
 	script_md2htmlInBrowser.__doc__ = _("Markdown to HTML conversion. The result is displayed in your default browser")
 
 	def script_copyHTMLSrcToClip(self, gesture):
-		text, err = getText()
-		if err:
-			return ui.message(err)
-		if not text:
-			return ui.message(_("No text"))
-		metadata, text = extractMetadata(text)
-		api.copyToClip(convertToHTML(text, metadata, src=True,
-									 display=False, useTemplateHTML=False))
-		ui.message(_("HTML source copied to clipboard"))
+		def convert(text, metadata, cancelEvent):
+			content = convertToHTML(text, metadata, src=True, display=False, useTemplateHTML=False, cancelEvent=cancelEvent)
+			if content is not None:
+				callAfter(cancelEvent, self.copyToClip, content, _("HTML source copied to clipboard"))
+		self.convertMarkdown("copyHTMLSrcToClip", convert)
 	script_copyHTMLSrcToClip.__doc__ = _("Markdown to HTML source conversion. The result is copied to clipboard")
 
 	def script_copyFormattedHTMLToClip(self, gesture):
-		text, err = getText()
-		if err:
-			return ui.message(err)
-		if not text:
-			return ui.message(_("No text"))
-		metadata, text = extractMetadata(text)
-		if copyToClipAsHTML(convertToHTML(text, metadata, src=True, display=False, save=False)):
-			return ui.message(_("Formatted HTML copied to clipboard"))
-		else:
-			ui.message(_("An error occured"))
+		def convert(text, metadata, cancelEvent):
+			content = convertToHTML(text, metadata, src=True, display=False, save=False, cancelEvent=cancelEvent)
+			if content is not None:
+				callAfter(cancelEvent, self.copyFormattedHTML, content)
+		self.convertMarkdown("copyFormattedHTMLToClip", convert)
 	script_copyFormattedHTMLToClip.__doc__ = _(
 		"Markdown to formatted HTML conversion. The result is copied to clipboard")
 
 	def script_copyMarkdownToClip(self, gesture):
-		metadata, text = getMetadataAndTextForMarkDown()
-		if not metadata:
-			return
-		if not text:
-			return ui.message(_("No text"))
-		res = convertToMD(text, metadata, display=False)
-		if res:
-			api.copyToClip(res)
-			ui.message(_("Markdown copied to clipboard"))
-		else:
-			ui.message(_("An error occured"))
+		def convert(text, metadata, cancelEvent):
+			res = convertToMD(text, metadata, display=False, cancelEvent=cancelEvent)
+			if res:
+				callAfter(cancelEvent, self.copyToClip, res, _("Markdown copied to clipboard"))
+			else:
+				callAfter(cancelEvent, ui.message, _("An error occured"))
+		self.convertHTML("copyMarkdownToClip", convert)
 	script_copyMarkdownToClip.__doc__ = _(
 		"HTML to Markdown conversion. The result is copied to clipboard")
 
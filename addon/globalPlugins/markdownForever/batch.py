@@ -0,0 +1,241 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Converts a whole folder of Markdown files to HTML.
+
+Worker processes cannot be spawned from NVDA itself, so this module does not
+depend on NVDA and is run with a regular Python 3 interpreter:
+	python batch.py <rootDir> [<outDir>] [--jobs N] [--config <NVDA config directory>] [--force]
+The documents are rendered by renderer, as when they are saved from the add-on,
+with the configuration and the language of NVDA read from the nvda.ini of the user.
+"""
+
+import argparse
+import hashlib
+import json
+import locale
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+baseDir = os.path.dirname(os.path.abspath(__file__))
+libDir = os.path.join(baseDir, "lib")
+for path in (baseDir, libDir):
+	if path not in sys.path:
+		sys.path.insert(0, path)
+
+import markdown2
+import renderer
+
+manifestFileName = ".markdownForever-build.json"
+markdownExtensions = (".md", ".markdown")
+
+
+def getDefaultConfigDir():
+	return os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "nvda")
+
+
+def readNVDAConfig(configDir):
+	"""Returns the sections of nvda.ini as {section path: {key: value}}, a section path being a tuple of section names."""
+	sections = {(): {}}
+	path = ()
+	fp = os.path.join(configDir, "nvda.ini")
+	if not os.path.isfile(fp):
+		return sections
+	with open(fp, encoding="UTF-8", errors="replace") as readFile:
+		for line in readFile:
+			line = line.strip()
+			if line.startswith('['):
+				depth = len(line) - len(line.lstrip('['))
+				path = path[:depth - 1] + (line.strip("[]").strip(),)
+				sections.setdefault(path, {})
+				continue
+			if line.startswith('#') or '=' not in line:
+				continue
+			key, value = [e.strip() for e in line.split('=', 1)]
+			if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+				value = value[1:-1]
+			sections[path][key] = value
+	return sections
+
+
+def readSettings(configDir):
+	"""Returns the configuration of the add-on in nvda.ini, completed with its default values, and the language of NVDA."""
+	sections = readNVDAConfig(configDir)
+	config = dict(renderer.defaultConfig)
+	for key, value in sections.get(("markdownForever",), {}).items():
+		if key not in config:
+			continue
+		config[key] = value == "True" if isinstance(config[key], bool) else value
+	config["HTMLTemplates"] = sections.get(("markdownForever", "HTMLTemplates"), {})
+	language = sections.get(("general",), {}).get("language", "Windows")
+	if language == "Windows":
+		language = locale.getdefaultlocale()[0] or "en"
+	return config, language
+
+
+def getBuildSettings(configDir):
+	config, language = readSettings(configDir)
+	return {
+		"config": config,
+		"configDir": os.path.join(configDir, "markdownForever"),
+		"language": language,
+	}
+
+
+def configureRenderer(settings):
+	"""Configures renderer in a worker process."""
+	renderer.configure(
+		getConfig=lambda: settings["config"],
+		configDir=settings["configDir"],
+		defaultLanguage=settings["language"],
+		addonVersion=getAddonVersion(),
+	)
+
+
+def getAddonVersion():
+	fp = os.path.join(baseDir, "..", "..", "manifest.ini")
+	try:
+		with open(fp, encoding="UTF-8") as readFile:
+			for line in readFile:
+				key, sep, value = line.partition('=')
+				if key.strip() == "version":
+					return value.strip().strip("\"")
+	except OSError:
+		pass
+	return ''
+
+
+def renderDocument(text):
+	"""Renders a document as the add-on saves it. Raises ValueError if its extra tags cannot be processed."""
+	metadata, text = renderer.extractMetadata(text)
+	ok, content = renderer.renderHTML(text, metadata, prettify=True)
+	if not ok:
+		raise ValueError(content)
+	return content
+
+
+def convertFile(job):
+	"""Worker: converts one file. Returns its hash, its size and the error raised, if any."""
+	src, dest = job
+	digest, size = None, 0
+	try:
+		with open(src, "rb") as readFile:
+			data = readFile.read()
+		digest = hashlib.sha256(data).hexdigest()
+		size = len(data)
+		html = renderDocument(data.decode("UTF-8-sig", "replace"))
+		os.makedirs(os.path.dirname(dest), exist_ok=True)
+		with open(dest, "wb") as writeFile:
+			writeFile.write(html.encode("UTF-8"))
+	except Exception as err:
+		return digest, size, repr(err)
+	return digest, size, None
+
+
+def getFileHash(fp):
+	h = hashlib.sha256()
+	with open(fp, "rb") as readFile:
+		for block in iter(lambda: readFile.read(1024 * 1024), b''):
+			h.update(block)
+	return h.hexdigest()
+
+
+def loadManifest(fp, settingsKey):
+	try:
+		with open(fp, encoding="UTF-8") as readFile:
+			manifest = json.load(readFile)
+	except (OSError, ValueError):
+		return {}
+	if manifest.get("settings") != settingsKey:
+		return {}
+	return manifest.get("files", {})
+
+
+def buildFolder(rootDir, outDir=None, settings=None, jobs=None, force=False, configDir=None):
+	"""Converts the Markdown files of rootDir (recursively) to HTML files in outDir.
+	Files whose modification time or content did not change since the last build are skipped.
+	Returns the statistics of the build."""
+	rootDir = os.path.abspath(rootDir)
+	outDir = os.path.abspath(outDir or rootDir)
+	if settings is None:
+		settings = getBuildSettings(configDir or getDefaultConfigDir())
+	configureRenderer(settings)
+	template = renderer.getHTMLTemplate()["content"]
+	settingsKey = hashlib.sha256(json.dumps(
+		[settings, template, markdown2.__version__, renderer.addonVersion], sort_keys=True).encode("UTF-8")).hexdigest()
+	manifestPath = os.path.join(outDir, manifestFileName)
+	previous = {} if force else loadManifest(manifestPath, settingsKey)
+	files = {}
+	pending = []
+	for dirPath, dirNames, fileNames in os.walk(rootDir):
+		dirNames[:] = [e for e in dirNames if not e.startswith('.')]
+		for fileName in fileNames:
+			if not fileName.lower().endswith(markdownExtensions):
+				continue
+			src = os.path.join(dirPath, fileName)
+			rel = os.path.relpath(src, rootDir).replace(os.sep, '/')
+			dest = os.path.join(outDir, os.path.splitext(rel)[0] + ".html")
+			st = os.stat(src)
+			entry = previous.get(rel)
+			if entry and os.path.exists(dest):
+				if entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+					files[rel] = entry
+					continue
+				if entry["size"] == st.st_size and entry["hash"] == getFileHash(src):
+					files[rel] = dict(entry, mtime=st.st_mtime_ns)
+					continue
+			files[rel] = {"mtime": st.st_mtime_ns, "size": st.st_size, "hash": None}
+			pending.append((rel, (src, dest)))
+	stats = {"converted": 0, "skipped": len(files) - len(pending), "errors": [], "bytes": 0}
+	start = time.perf_counter()
+	if pending:
+		workers = jobs or os.cpu_count() or 1
+		chunksize = max(1, len(pending) // (workers * 4))
+		with ProcessPoolExecutor(max_workers=workers, initializer=configureRenderer, initargs=(settings,)) as executor:
+			results = executor.map(convertFile, [job for rel, job in pending], chunksize=chunksize)
+			for (rel, job), (digest, size, error) in zip(pending, results):
+				stats["bytes"] += size
+				if error:
+					stats["errors"].append((rel, error))
+					del files[rel]
+					continue
+				stats["converted"] += 1
+				files[rel]["hash"] = digest
+	stats["seconds"] = time.perf_counter() - start
+	os.makedirs(outDir, exist_ok=True)
+	with open(manifestPath, "w", encoding="UTF-8") as writeFile:
+		json.dump({"settings": settingsKey, "files": files}, writeFile, indent=1, sort_keys=True)
+	return stats
+
+
+def printStats(stats):
+	seconds = stats["seconds"] or 1e-9
+	print("%d converted, %d skipped, %d errors in %.2f s" % (
+		stats["converted"], stats["skipped"], len(stats["errors"]), stats["seconds"]))
+	if stats["converted"]:
+		print("%.1f files/s, %.2f MB/s" % (
+			stats["converted"] / seconds, stats["bytes"] / seconds / 1000000))
+	for rel, error in stats["errors"]:
+		print(f"{rel}: {error}", file=sys.stderr)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Converts a folder of Markdown files to HTML.")
+	parser.add_argument("rootDir")
+	parser.add_argument("outDir", nargs='?', help="defaults to rootDir")
+	parser.add_argument("-j", "--jobs", type=int, help="number of worker processes (default: number of CPUs)")
+	parser.add_argument("--config", help="NVDA configuration directory (default: %%APPDATA%%\\nvda)")
+	parser.add_argument("--force", action="store_true", help="convert all files, even unchanged ones")
+	args = parser.parse_args(argv)
+	stats = buildFolder(args.rootDir, args.outDir, jobs=args.jobs, force=args.force, configDir=args.config)
+	printStats(stats)
+	return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,101 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import threading
+
+import ui
+import wx
+from logHandler import log
+import addonHandler
+addonHandler.initTranslation()
+
+
+def callAfter(cancelEvent, func, *args, **kwargs):
+	"""Runs func on the main thread, unless the job owning cancelEvent is cancelled by then.
+	cancelEvent may be None for calls made outside of a job."""
+	def run():
+		if cancelEvent is None or not cancelEvent.is_set():
+			func(*args, **kwargs)
+	wx.CallAfter(run)
+
+
+class Job:
+
+	def __init__(self, name, func, cancelEvent=None):
+		self.name = name
+		self.func = func
+		self.cancelEvent = cancelEvent or threading.Event()
+
+	def cancel(self):
+		self.cancelEvent.set()
+
+	def isCancelled(self):
+		return self.cancelEvent.is_set()
+
+
+class ConversionWorker(threading.Thread):
+	"""Runs the conversions one at a time, out of NVDA's main thread.
+	Jobs are functions called with their cancel event. They must marshal their UI work
+	back to the main thread (see callAfter).
+	The queue only keeps the newest job: submitting a job supersedes the one not started yet."""
+
+	def __init__(self):
+		super().__init__(name="markdownForever.conversionWorker", daemon=True)
+		self._condition = threading.Condition()
+		self._pending = None
+		self._current = None
+		self._shouldStop = False
+
+	def submit(self, name, func, cancelEvent=None):
+		"""Queues func(cancelEvent). cancelEvent is created if not given, e.g. when the job prepared its input under it."""
+		job = Job(name, func, cancelEvent)
+		with self._condition:
+			if self._pending:
+				log.debug(f"Job {self._pending.name} superseded by {name}")
+				self._pending.cancel()
+			self._pending = job
+			self._condition.notify()
+		return job
+
+	def cancel(self, name):
+		"""Cancels the job named name if it is queued or running. Returns True if there was one."""
+		cancelled = False
+		with self._condition:
+			if self._pending and self._pending.name == name:
+				self._pending.cancel()
+				self._pending = None
+				cancelled = True
+			if self._current and self._current.name == name and not self._current.isCancelled():
+				self._current.cancel()
+				cancelled = True
+		return cancelled
+
+	def stop(self):
+		with self._condition:
+			self._shouldStop = True
+			for job in (self._pending, self._current):
+				if job:
+					job.cancel()
+			self._pending = None
+			self._condition.notify()
+
+	def run(self):
+		while True:
+			with self._condition:
+				while not self._pending and not self._shouldStop:
+					self._condition.wait()
+				if self._shouldStop:
+					break
+				job = self._current = self._pending
+				self._pending = None
+			try:
+				job.func(job.cancelEvent)
+			except Exception:
+				log.error(f"Conversion job {job.name} failed", exc_info=True)
+				callAfter(job.cancelEvent, ui.message, _("An error occured"))
+			finally:
+				with self._condition:
+					self._current = None
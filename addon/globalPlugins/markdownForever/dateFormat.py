@@ -0,0 +1,143 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Localized dates for the extra tags, without changing the locale of the process.
+
+The Windows locale functions take the locale as a parameter: unlike
+locale.setlocale, they can be called from any thread. Day and month names are
+looked up once per language. Outside NVDA (see batch), they are called with
+ctypes; outside Windows, every language gets the names and formats of the C
+locale.
+"""
+
+import ctypes
+import datetime
+import threading
+try:
+	import winKernel
+except ImportError:
+	winKernel = None
+
+
+class UnknownLanguageError(ValueError):
+	pass
+
+
+DATE_SHORTDATE = 1
+# The C locale formats matching the Windows ones used here
+cFormats = {"dddd": "%A", "MMMM": "%B", None: "%x"}
+try:
+	kernel32 = ctypes.windll.kernel32 if not winKernel else None
+except AttributeError:
+	kernel32 = None
+
+
+_names = {}
+_lock = threading.Lock()
+
+
+# The language abbreviations of Windows, that locale.setlocale accepted too
+legacyAbbreviations = {
+	"afk": "af-ZA", "ara": "ar-SA", "bel": "be-BY", "bgr": "bg-BG", "cat": "ca-ES", "chs": "zh-CN", "cht": "zh-TW",
+	"csy": "cs-CZ", "dan": "da-DK", "dea": "de-AT", "des": "de-CH", "deu": "de-DE", "ell": "el-GR", "ena": "en-AU",
+	"enc": "en-CA", "eng": "en-GB", "eni": "en-IE", "ens": "en-ZA", "enu": "en-US", "enz": "en-NZ", "esm": "es-MX",
+	"esn": "es-ES", "esp": "es-ES", "eti": "et-EE", "euq": "eu-ES", "far": "fa-IR", "fin": "fi-FI", "fra": "fr-FR",
+	"frb": "fr-BE", "frc": "fr-CA", "frs": "fr-CH", "glc": "gl-ES", "heb": "he-IL", "hin": "hi-IN", "hrv": "hr-HR",
+	"hun": "hu-HU", "hye": "hy-AM", "ind": "id-ID", "isl": "is-IS", "ita": "it-IT", "its": "it-CH", "jpn": "ja-JP",
+	"kat": "ka-GE", "kor": "ko-KR", "lth": "lt-LT", "lvi": "lv-LV", "mki": "mk-MK", "nlb": "nl-BE", "nld": "nl-NL",
+	"non": "nn-NO", "nor": "nb-NO", "plk": "pl-PL", "ptb": "pt-BR", "ptg": "pt-PT", "rom": "ro-RO", "rus": "ru-RU",
+	"sky": "sk-SK", "slv": "sl-SI", "sqi": "sq-AL", "srb": "sr-Cyrl-CS", "srl": "sr-Latn-CS", "sve": "sv-SE",
+	"tam": "ta-IN", "tha": "th-TH", "trk": "tr-TR", "ukr": "uk-UA", "urd": "ur-PK", "vit": "vi-VN",
+}
+# The English language names accepted by locale.setlocale, alone or as in French_France.1252
+legacyNames = {
+	"arabic": "ar", "bulgarian": "bg", "catalan": "ca", "chinese": "zh", "croatian": "hr", "czech": "cs", "danish": "da",
+	"dutch": "nl", "english": "en", "finnish": "fi", "french": "fr", "german": "de", "greek": "el", "hebrew": "he",
+	"hungarian": "hu", "italian": "it", "japanese": "ja", "korean": "ko", "norwegian": "nb", "persian": "fa",
+	"polish": "pl", "portuguese": "pt", "romanian": "ro", "russian": "ru", "slovak": "sk", "slovenian": "sl",
+	"spanish": "es", "swedish": "sv", "thai": "th", "turkish": "tr", "ukrainian": "uk", "vietnamese": "vi",
+}
+
+
+def getLocaleName(lang):
+	"""Returns the Windows locale name of a language code such as fr or fr_FR.
+	The legacy values that locale.setlocale accepted, such as enu or French_France.1252, are mapped too."""
+	lang = lang.split('.', 1)[0]
+	legacy = lang.lower()
+	if legacy in legacyAbbreviations:
+		return legacyAbbreviations[legacy]
+	legacy = legacy.split('_', 1)[0]
+	if legacy in legacyNames:
+		return legacyNames[legacy]
+	return lang.replace('_', '-')
+
+
+class SYSTEMTIME(ctypes.Structure):
+	_fields_ = [(name, ctypes.c_ushort) for name in (
+		"wYear", "wMonth", "wDayOfWeek", "wDay", "wHour", "wMinute", "wSecond", "wMilliseconds")]
+
+
+def _callFormatFunction(func, localeName, flags, date, format, *args):
+	"""Calls GetDateFormatEx or GetTimeFormatEx of kernel32 as winKernel does. args follow the output buffer."""
+	systemTime = SYSTEMTIME(date.year, date.month, 0, date.day, date.hour, date.minute, date.second, 0)
+	bufferLength = func(localeName, flags, ctypes.byref(systemTime), format, None, 0, *args)
+	buffer = ctypes.create_unicode_buffer(bufferLength)
+	func(localeName, flags, ctypes.byref(systemTime), format, buffer, bufferLength, *args)
+	return buffer.value
+
+
+def getDateFormat(localeName, flags, date, format):
+	if winKernel:
+		return winKernel.GetDateFormatEx(localeName, flags, date, format)
+	if kernel32:
+		# The calendar argument is reserved
+		return _callFormatFunction(kernel32.GetDateFormatEx, localeName, flags, date, format, None)
+	return date.strftime(cFormats[format])
+
+
+def getTimeFormat(localeName, flags, date, format):
+	if winKernel:
+		return winKernel.GetTimeFormatEx(localeName, flags, date, format)
+	if kernel32:
+		return _callFormatFunction(kernel32.GetTimeFormatEx, localeName, flags, date, format)
+	return date.strftime("%X")
+
+
+def isKnownLanguage(lang):
+	if winKernel:
+		return bool(winKernel.kernel32.IsValidLocaleName(getLocaleName(lang)))
+	if kernel32:
+		return bool(kernel32.IsValidLocaleName(getLocaleName(lang)))
+	return True
+
+
+def getNames(lang):
+	"""Returns the names of the days (Monday first) and of the months of lang, as strftime gives them for %A and %B.
+	Raises UnknownLanguageError if Windows does not know lang."""
+	with _lock:
+		names = _names.get(lang)
+	if names:
+		return names
+	if not isKnownLanguage(lang):
+		raise UnknownLanguageError(lang)
+	localeName = getLocaleName(lang)
+	# January 1st, 2024 is a Monday. Month names alone are in the nominative case.
+	days = tuple(getDateFormat(localeName, 0, datetime.datetime(2024, 1, 1 + i), "dddd") for i in range(7))
+	months = tuple(getDateFormat(localeName, 0, datetime.datetime(2024, i, 1), "MMMM") for i in range(1, 13))
+	names = (days, months)
+	with _lock:
+		_names[lang] = names
+	return names
+
+
+def formatDate(lang, date):
+	"""Returns date in the short format of lang, as strftime gives it for %x."""
+	return getDateFormat(getLocaleName(lang), DATE_SHORTDATE, date, None)
+
+
+def formatTime(lang, date):
+	"""Returns the time of date in the format of lang, as strftime gives it for %X."""
+	return getTimeFormat(getLocaleName(lang), 0, date, None)
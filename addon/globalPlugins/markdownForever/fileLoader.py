@@ -0,0 +1,84 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Loads local files without intermediate copies.
+
+Files are memory-mapped: the BOM and the metadata block are found in the
+mapping, then the text is decoded from it in one go. This module does not
+depend on NVDA.
+"""
+
+import codecs
+import mmap
+import os
+
+# Bytes stripped around the body of a document, like str.strip does
+whitespace = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+
+def isASCIICompatible(encoding):
+	"""Returns True if the delimiters of the metadata block are encoded as in ASCII, so that they can be searched as bytes."""
+	try:
+		return "---\r\n".encode(encoding) == b"---\r\n"
+	except LookupError:
+		return False
+
+
+def getBOMLength(buffer, encoding):
+	if codecs.lookup(encoding).name in ("utf-8", "utf-8-sig") and buffer[:3] == codecs.BOM_UTF8:
+		return 3
+	return 0
+
+
+def readText(fp, encoding="UTF-8"):
+	"""Returns the content of the file fp decoded, without its UTF-8 BOM if any."""
+	with open(fp, "rb") as f:
+		if not os.fstat(f.fileno()).st_size:
+			return ''
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as buffer:
+			return str(buffer[getBOMLength(mm, encoding):], encoding)
+
+
+def findMetadataBlock(mm, start):
+	"""Returns the end of the metadata block starting at start (where the blank line following it begins), or -1.
+	The rules are the ones of common.extractMetadata."""
+	if len(mm) - start <= 4 or mm[start:start + 3] != b"---":
+		return -1
+	ln = mm[start + 3:start + 4]
+	if ln not in (b"\r", b"\n"):
+		return -1
+	if ln == b"\r" and mm[start + 4:start + 5] == b"\n":
+		ln = b"\r\n"
+	return mm.find(ln * 2, start)
+
+
+def loadMarkdown(fp, encoding="UTF-8"):
+	"""Returns the metadata block of a Markdown file (None if it has none or if it is malformed) and its text.
+	With a metadata block, the text is the body stripped then surrounded by line breaks, as extractMetadata hands it to the renderer.
+	It is then decoded from the mapping in one go whenever the file already has these line breaks around the body."""
+	with open(fp, "rb") as f:
+		size = os.fstat(f.fileno()).st_size
+		if not size:
+			return None, ''
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as buffer:
+			start = getBOMLength(mm, encoding)
+			end = findMetadataBlock(mm, start) if isASCIICompatible(encoding) else -1
+			if end < 0:
+				return None, str(buffer[start:], encoding)
+			metadataBlock = str(buffer[start:end], encoding)
+			bodyStart, bodyEnd = end, size
+			while bodyStart < bodyEnd and mm[bodyStart] in whitespace:
+				bodyStart += 1
+			while bodyEnd > bodyStart and mm[bodyEnd - 1] in whitespace:
+				bodyEnd -= 1
+			if mm[bodyStart - 1] == 0x0a and bodyEnd < size and mm[bodyEnd] == 0x0a:
+				text = str(buffer[bodyStart - 1:bodyEnd + 1], encoding)
+			else:
+				text = '\n' + str(buffer[bodyStart:bodyEnd], encoding) + '\n'
+	# Other Unicode spaces, rare, are stripped after decoding
+	if len(text) > 2 and (text[1].isspace() or text[-2].isspace()):
+		text = '\n' + text.strip() + '\n'
+	return metadataBlock, text
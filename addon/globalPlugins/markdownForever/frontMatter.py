@@ -0,0 +1,108 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Parses the simple metadata blocks without the vendored yaml package.
+
+Most metadata blocks are flat maps of `key: scalar` or `key: [list]` lines.
+parse returns what yaml.FullLoader would for them, and None for anything
+else (anchors, tags, nested or multi-line values, comments after a value,
+floats, dates…) so that the caller falls back to yaml. This module does not
+depend on NVDA.
+"""
+
+import re
+
+keyPattern = re.compile(r"([A-Za-z_][-\w]*):(?: +(.*))?$")
+itemPattern = re.compile(r"( *)- +(\S.*)$")
+intPattern = re.compile(r"[-+]?(?:0|[1-9][0-9]*)$")
+# Characters that can not start a plain scalar, or that give it another meaning
+indicators = frozenset("-?:,[]{}#&*!|>'\"%@`=~<.+0123456789")
+digits = frozenset("0123456789")
+# Characters of the numbers and dates that yaml resolves: a plain scalar starting with a digit and having others is a string
+numberCharacters = frozenset("0123456789_:.-+eExXbBoOaAcCdDfFtTzZ ")
+# Line breaks other than \n and characters that yaml rejects or handles specially
+unsafePattern = re.compile("[\x00-\x09\x0b-\x1f\x7f-\x9f\u2028\u2029\ud800-\udfff\ufeff\ufffe\uffff]")
+bools = {
+	"yes": True, "Yes": True, "YES": True, "true": True, "True": True, "TRUE": True, "on": True, "On": True, "ON": True,
+	"no": False, "No": False, "NO": False, "false": False, "False": False, "FALSE": False, "off": False, "Off": False, "OFF": False,
+}
+nulls = frozenset(("~", "null", "Null", "NULL"))
+
+
+class NotFlat(Exception):
+	pass
+
+
+def parseScalar(value, inFlow=False):
+	if value in bools:
+		return bools[value]
+	if value in nulls:
+		return None
+	if intPattern.match(value):
+		return int(value)
+	first = value[0]
+	if first == "'":
+		if len(value) < 2 or not value.endswith("'") or "'" in value[1:-1].replace("''", ''):
+			raise NotFlat
+		return value[1:-1].replace("''", "'")
+	if first == '"':
+		if len(value) < 2 or not value.endswith('"') or '"' in value[1:-1] or '\\' in value:
+			raise NotFlat
+		return value[1:-1]
+	if (first in indicators and (first not in digits or numberCharacters.issuperset(value))) or ": " in value or " #" in value or value.endswith(':') or (inFlow and ':' in value):
+		raise NotFlat
+	return value
+
+
+def parseValue(value):
+	if value.startswith('['):
+		if not value.endswith(']') or any(c in value[1:-1] for c in "[]{}"):
+			raise NotFlat
+		inner = value[1:-1].strip()
+		if not inner:
+			return []
+		items = [item.strip() for item in inner.split(',')]
+		if not all(items):
+			raise NotFlat
+		return [parseScalar(item, inFlow=True) for item in items]
+	return parseScalar(value)
+
+
+def parse(source):
+	"""Returns the map defined by source, or None if source is not a flat map of scalars and lists of scalars.
+	Lists can be written inline or one `- item` per line, as yaml.dump writes them."""
+	source = source.replace("\r\n", "\n")
+	if unsafePattern.search(source):
+		return None
+	metadata = {}
+	# Key of the last empty value, that the `- item` lines that follow turn into a list
+	listKey = None
+	listIndent = None
+	try:
+		for line in source.split("\n"):
+			if not line or line.startswith('#'):
+				continue
+			line = line.rstrip(' ')
+			match = itemPattern.match(line)
+			if match:
+				indent, value = match.groups()
+				if listKey is None or listIndent not in (None, indent):
+					raise NotFlat
+				if listIndent is None:
+					metadata[listKey] = []
+					listIndent = indent
+				metadata[listKey].append(parseScalar(value))
+				continue
+			match = keyPattern.match(line)
+			if not match or match.group(1) in bools or match.group(1) in nulls:
+				raise NotFlat
+			key, value = match.groups()
+			metadata[key] = parseValue(value) if value else None
+			listKey = None if value else key
+			listIndent = None
+	except NotFlat:
+		return None
+	return metadata
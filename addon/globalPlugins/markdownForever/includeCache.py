@@ -0,0 +1,115 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Keeps the content of the files included by include-before and include-after.
+
+An entry is valid as long as the modification time and the size of the file,
+and of every file it includes itself, are unchanged. The files being included
+are tracked per thread to detect recursive inclusions. This module does not
+depend on NVDA.
+"""
+
+import contextlib
+import os
+import threading
+
+
+class RecursiveInclusionError(Exception):
+	pass
+
+
+def getSignature(fp):
+	try:
+		st = os.stat(fp)
+	except OSError:
+		return None
+	return st.st_mtime_ns, st.st_size
+
+
+def normalize(fp):
+	return os.path.normcase(os.path.abspath(fp))
+
+
+class IncludeCache:
+
+	def __init__(self):
+		self.reads = 0
+		self.saved = 0
+		self._entries = {}
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def _getStack(self):
+		if not hasattr(self._local, "stack"):
+			self._local.stack = []
+		return self._local.stack
+
+	def get(self, fp, generation, load):
+		"""Returns the content of fp, calling load(fp) if it is not cached or if it changed.
+		Raises RecursiveInclusionError if fp is already being included by the current thread."""
+		key = normalize(fp)
+		stack = self._getStack()
+		if any(key == frame[0] for frame in stack):
+			# The content of the files of the loop depends on where the loop was entered: none of them is cached
+			for frame in stack:
+				frame[2] = False
+			raise RecursiveInclusionError(" > ".join([frame[0] for frame in stack] + [key]))
+		with self._lock:
+			entry = self._entries.get(key)
+		if entry and entry[0] == generation and all(getSignature(path) == signature for path, signature in entry[1]):
+			with self._lock:
+				self.saved += 1
+			dependencies = entry[1]
+			content = entry[2]
+		else:
+			signature = getSignature(key)
+			# Path, files the content depends on and whether it can be cached
+			frame = [key, [(key, signature)], signature is not None]
+			stack.append(frame)
+			try:
+				content = load(fp)
+			finally:
+				stack.pop()
+			dependencies = tuple(frame[1])
+			if stack and not frame[2]:
+				stack[-1][2] = False
+			with self._lock:
+				self.reads += 1
+				if frame[2] and getSignature(key) == signature:
+					self._entries[key] = (generation, dependencies, content)
+		if stack:
+			# The file including this one depends on it, and on what it includes
+			stack[-1][1].extend(dependencies)
+		return content
+
+	@contextlib.contextmanager
+	def including(self, fp):
+		"""Marks fp, a document read without this cache, as being included by the current thread while the block runs.
+		Yields a list that receives, when the block ends, the (path, signature) of fp and of every file it includes."""
+		key = normalize(fp)
+		frame = [key, [(key, getSignature(key))], True]
+		stack = self._getStack()
+		stack.append(frame)
+		dependencies = []
+		try:
+			yield dependencies
+		finally:
+			stack.pop()
+		dependencies.extend(frame[1])
+
+	def isIncluding(self):
+		return bool(self._getStack())
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self):
+		return {
+			"entries": len(self._entries),
+			"reads": self.reads,
+			"saved": self.saved,
+		}
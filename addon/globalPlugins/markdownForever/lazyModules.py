@@ -0,0 +1,62 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Deferred loading of the vendored libraries.
+
+Parsing bs4, yaml, markdown2, html2text and html2markdown takes a noticeable part
+of NVDA startup, although most sessions never convert anything. The objects
+below stand for these modules and only import them when one of their attributes
+is first read, e.g. ``markdown2.markdown(text)``.
+"""
+
+import importlib
+import os
+import sys
+import threading
+
+libDir = os.path.join(os.path.dirname(__file__), "lib")
+_lock = threading.Lock()
+
+
+class LazyModule:
+	"""Imports the module name on first attribute access, then forwards every access to it."""
+
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+
+	def load(self):
+		module = self._module
+		if module is None:
+			with _lock:
+				if self._module is None:
+					# The lib folder is only in the path while importing, so that other add-ons do not get our copies.
+					sys.path.append(libDir)
+					try:
+						self._module = importlib.import_module(self._name)
+					finally:
+						sys.path.remove(libDir)
+				module = self._module
+		return module
+
+	def isLoaded(self):
+		return self._module is not None
+
+	def __getattr__(self, attr):
+		return getattr(self.load(), attr)
+
+	def __repr__(self):
+		state = "loaded" if self._module else "not loaded"
+		return f"<lazy module {self._name!r} ({state})>"
+
+
+bs4 = LazyModule("bs4")
+yaml = LazyModule("yaml")
+markdown2 = LazyModule("markdown2")
+html2text = LazyModule("html2text")
+html2markdown = LazyModule("html2markdown")
+htmlParser = LazyModule("_html.parser")
+modules = (bs4, yaml, markdown2, html2text, html2markdown, htmlParser)
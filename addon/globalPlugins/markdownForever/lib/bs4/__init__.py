@@ -45,6 +45,7 @@ from .element import (
     ResultSet,
     SoupStrainer,
     Tag,
+    _slot_values,
     )
 
 # The very first thing we do is give a useful error if someone is
@@ -256,7 +257,6 @@ class BeautifulSoup(Tag):
                     
         self.builder = builder
         self.is_xml = builder.is_xml
-        self.known_xml = self.is_xml
         self._namespaces = dict()
         self.parse_only = parse_only
 
@@ -327,7 +327,8 @@ class BeautifulSoup(Tag):
         d = dict(self.__dict__)
         if 'builder' in d and not self.builder.picklable:
             d['builder'] = None
-        return d
+        # The attributes inherited from Tag are held in __slots__.
+        return d, _slot_values(self)
 
     @staticmethod
     def _check_markup_is_url(markup):
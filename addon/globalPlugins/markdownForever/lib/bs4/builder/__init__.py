@@ -7,6 +7,7 @@ import sys
 from bs4.element import (
     CharsetMetaAttributeValue,
     ContentMetaAttributeValue,
+    TreeSettings,
     nonwhitespace_re
     )
 
@@ -122,6 +123,24 @@ class TreeBuilder(object):
         if preserve_whitespace_tags is self.USE_DEFAULT:
             preserve_whitespace_tags = self.DEFAULT_PRESERVE_WHITESPACE_TAGS
         self.preserve_whitespace_tags = preserve_whitespace_tags
+        self._tree_settings = {}
+
+    def tree_settings(self, parser_class):
+        """The settings shared by the tags this builder creates for a
+        parser of the given class.
+
+        They are created again if the attributes of the builder they
+        come from were changed in the meantime.
+        """
+        settings = self._tree_settings.get(parser_class)
+        if (settings is None
+            or settings.known_xml != self.is_xml
+            or settings.cdata_list_attributes is not self.cdata_list_attributes
+            or settings.preserve_whitespace_tags is not self.preserve_whitespace_tags):
+            settings = self._tree_settings[parser_class] = TreeSettings(
+                parser_class, self.is_xml, self.cdata_list_attributes,
+                self.preserve_whitespace_tags)
+        return settings
             
     def initialize_soup(self, soup):
         """The BeautifulSoup object has been initialized and is now
@@ -5,6 +5,7 @@ try:
     from collections.abc import Callable # Python 3.6
 except ImportError as e:
     from collections import Callable
+from collections import namedtuple
 import re
 import sys
 import warnings
@@ -43,6 +44,39 @@ def _alias(attr):
     return alias
 
 
+# The settings that used to be copied onto every Tag. A TreeBuilder
+# creates them once and all the tags it builds hold a reference to them.
+TreeSettings = namedtuple(
+    "TreeSettings", ["parser_class", "known_xml", "cdata_list_attributes",
+                     "preserve_whitespace_tags"])
+
+# Settings of the tags created without a TreeBuilder, by (parser_class, known_xml).
+_builderless_settings = {}
+
+def _tree_setting(field):
+    """A Tag attribute read from the settings shared by its tree. Setting
+    it gives that tag its own copy of the settings."""
+    @property
+    def setting(self):
+        return getattr(self._settings, field)
+
+    @setting.setter
+    def setting(self, value):
+        self._settings = self._settings._replace(**{field: value})
+    return setting
+
+def _slot_values(element):
+    """Returns the attributes of element held in __slots__, by name."""
+    values = {}
+    for cls in type(element).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            try:
+                values[name] = object.__getattribute__(element, name)
+            except AttributeError:
+                pass
+    return values
+
+
 class NamespacedAttribute(str):
 
     def __new__(cls, prefix, name, namespace=None):
@@ -107,6 +141,10 @@ class ContentMetaAttributeValue(AttributeValueWithCharsetSubstitution):
 class PageElement(object):
     """Contains the navigational information for some part of the page
     (either a tag or a piece of text)"""
+
+    # The links themselves are slots of Tag and NavigableString: a str
+    # subclass cannot share a base class that has slots of its own.
+    __slots__ = ()
    
     def setup(self, parent=None, previous_element=None, next_element=None,
               previous_sibling=None, next_sibling=None):
@@ -602,6 +640,9 @@ class PageElement(object):
 
 class NavigableString(str, PageElement):
 
+    __slots__ = ('parent', 'previous_element', 'next_element',
+                 'next_sibling', 'previous_sibling')
+
     PREFIX = ''
     SUFFIX = ''
 
@@ -665,6 +706,8 @@ class PreformattedString(NavigableString):
     but the return value will be ignored.
     """
 
+    __slots__ = ()
+
     def output_ready(self, formatter=None):
         """CData strings are passed into the formatter, purely
         for any side effects. The return value is ignored.
@@ -675,33 +718,47 @@ class PreformattedString(NavigableString):
 
 class CData(PreformattedString):
 
+    __slots__ = ()
+
     PREFIX = '<![CDATA['
     SUFFIX = ']]>'
 
 class ProcessingInstruction(PreformattedString):
     """A SGML processing instruction."""
 
+    __slots__ = ()
+
     PREFIX = '<?'
     SUFFIX = '>'
 
 class XMLProcessingInstruction(ProcessingInstruction):
     """An XML processing instruction."""
+
+    __slots__ = ()
+
     PREFIX = '<?'
     SUFFIX = '?>'
 
 class Comment(PreformattedString):
 
+    __slots__ = ()
+
     PREFIX = '<!--'
     SUFFIX = '-->'
 
 
 class Declaration(PreformattedString):
+
+    __slots__ = ()
+
     PREFIX = '<?'
     SUFFIX = '?>'
 
 
 class Doctype(PreformattedString):
 
+    __slots__ = ()
+
     @classmethod
     def for_name_and_ids(cls, name, pub_id, system_id):
         value = name or ''
@@ -722,17 +779,31 @@ class Tag(PageElement):
 
     """Represents a found HTML tag with its attributes and contents."""
 
+    # A large document has a great many tags: they have no __dict__.
+    __slots__ = ('parent', 'previous_element', 'next_element',
+                 'next_sibling', 'previous_sibling', 'name', 'namespace',
+                 'prefix', 'attrs', 'contents', 'hidden',
+                 'can_be_empty_element', '_settings')
+
     def __init__(self, parser=None, builder=None, name=None, namespace=None,
                  prefix=None, attrs=None, parent=None, previous=None,
                  is_xml=None):
         "Basic constructor."
 
         if parser is None:
-            self.parser_class = None
+            parser_class = None
         else:
             # We don't actually store the parser object: that lets extracted
             # chunks be garbage-collected.
-            self.parser_class = parser.__class__
+            parser_class = parser.__class__
+        if builder is None:
+            settings = _builderless_settings.get((parser_class, is_xml))
+            if settings is None:
+                settings = _builderless_settings[(parser_class, is_xml)] = TreeSettings(
+                    parser_class, is_xml, None, None)
+        else:
+            settings = builder.tree_settings(parser_class)
+        self._settings = settings
         if name is None:
             raise ValueError("No value provided for new tag's name.")
         self.name = name
@@ -749,12 +820,6 @@ class Tag(PageElement):
         else:
             attrs = dict(attrs)
 
-        # If possible, determine ahead of time whether this tag is an
-        # XML tag.
-        if builder:
-            self.known_xml = builder.is_xml
-        else:
-            self.known_xml = is_xml
         self.attrs = attrs
         self.contents = []
         self.setup(parent, previous)
@@ -764,7 +829,6 @@ class Tag(PageElement):
             # In the absence of a TreeBuilder, assume this tag is nothing
             # special.
             self.can_be_empty_element = False
-            self.cdata_list_attributes = None
         else:
             # Set up any substitutions for this tag, such as the charset in a META tag.
             builder.set_up_substitutions(self)
@@ -772,20 +836,19 @@ class Tag(PageElement):
             # Ask the TreeBuilder whether this tag might be an empty-element tag.
             self.can_be_empty_element = builder.can_be_empty_element(name)
 
-            # Keep track of the list of attributes of this tag that
-            # might need to be treated as a list.
-            #
-            # For performance reasons, we store the whole data structure
-            # rather than asking the question of every tag. Asking would
-            # require building a new data structure every time, and
-            # (unlike can_be_empty_element), we almost never need
-            # to check this.
-            self.cdata_list_attributes = builder.cdata_list_attributes
-
-            # Keep track of the names that might cause this tag to be treated as a
-            # whitespace-preserved tag.
-            self.preserve_whitespace_tags = builder.preserve_whitespace_tags
-            
+    parser_class = _tree_setting("parser_class")
+
+    # Whether this is an XML tag, if it could be determined ahead of time.
+    known_xml = _tree_setting("known_xml")
+
+    # The list of attributes of this tag that might need to be treated
+    # as a list. We almost never need to check this.
+    cdata_list_attributes = _tree_setting("cdata_list_attributes")
+
+    # The names that might cause this tag to be treated as a
+    # whitespace-preserved tag.
+    preserve_whitespace_tags = _tree_setting("preserve_whitespace_tags")
+
     parserClass = _alias("parser_class")  # BS3
 
     def __copy__(self):
@@ -881,8 +944,12 @@ class Tag(PageElement):
         i = self
         while i is not None:
             next = i.next_element
-            i.__dict__.clear()
-            i.contents = []
+            for name in _slot_values(i):
+                delattr(i, name)
+            if hasattr(i, '__dict__'):
+                i.__dict__.clear()
+            if isinstance(i, Tag):
+                i.contents = []
             i = next
 
     def clear(self, decompose=False):
@@ -104,12 +104,13 @@ __version__ = '.'.join(map(str, __version_info__))
 __author__ = "Trent Mick"
 
 import argparse
+import bisect
 import codecs
+import itertools
 import logging
 import re
 import sys
 from collections import defaultdict
-from hashlib import sha256
 from random import randint, random
 
 # ---- globals
@@ -120,11 +121,17 @@ log = logging.getLogger("markdown")
 DEFAULT_TAB_WIDTH = 4
 
 
-SECRET_SALT = bytes(randint(0, 1000000))
-# MD5 function was previously used for this; the "md5" prefix was kept for
-# backwards compatibility.
+SECRET_SALT = '%016x' % randint(0, 0xffffffffffffffff)
+_hash_counter = itertools.count()
+# Placeholders are made of the salt, the same for the whole process, and of a
+# counter. MD5 then salted SHA-256 digests of the text were previously used;
+# the "md5" prefix and the length were kept for backwards compatibility.
 def _hash_text(s):
-    return 'md5-' + sha256(SECRET_SALT + s.encode("utf-8")).hexdigest()[32:]
+    return 'md5-%s%016x' % (SECRET_SALT, next(_hash_counter))
+
+# Matches any placeholder returned by `_hash_text()`, so that they can all be
+# swapped back in a single pass.
+_hash_re = re.compile(r'md5-%s[0-9a-f]{16}' % SECRET_SALT)
 
 # Table of hash values for escaped characters:
 g_escape_table = dict([(ch, _hash_text(ch))
@@ -135,6 +142,45 @@ g_escape_table = dict([(ch, _hash_text(ch))
 _AMPERSAND_RE = re.compile(r'&(?!#?[xX]?(?:[0-9a-fA-F]+|\w+);)')
 
 
+# ---- compiled regexes
+
+# Regexes that depend on the settings of a converter (tab width, list
+# nesting...) are compiled once per distinct key and kept here, instead of
+# going through `re.compile()` and the lookup in its cache on each call.
+_re_registry = {}
+
+
+def _get_re(key, build):
+    """Return the regex registered under `key`, calling `build()` to
+    compile it the first time `key` is seen.
+    """
+    try:
+        return _re_registry[key]
+    except KeyError:
+        regex = _re_registry[key] = build()
+        return regex
+
+
+class _lazy_re(object):
+    """Class attribute regex compiled on first access.
+
+    Used for the patterns of extras: most conversions never need them.
+    """
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        regex = re.compile(self.pattern, self.flags)
+        # Later lookups find the compiled regex rather than the descriptor.
+        setattr(self.owner, self.name, regex)
+        return regex
+
+
 # ---- exceptions
 class MarkdownError(Exception):
     pass
@@ -187,6 +233,7 @@ class Markdown(object):
     html_removed_text_compat = "[HTML_REMOVED]"  # for compat with markdown.py
 
     _toc = None
+    _incremental_cache = None
 
     # Used to track when we're inside an ordered or unordered list
     # (see _ProcessListItems() for details):
@@ -244,24 +291,32 @@ class Markdown(object):
         self.footnote_title = footnote_title
         self.footnote_return_symbol = footnote_return_symbol
         self.use_file_vars = use_file_vars
-        self._outdent_re = re.compile(r'^(\t|[ ]{1,%d})' % tab_width, re.M)
+        self._outdent_re = _get_re(("outdent", tab_width),
+            lambda: re.compile(r'^(\t|[ ]{1,%d})' % tab_width, re.M))
         self.cli = cli
 
+        self._reset_escape_tables()
+
+    def _reset_escape_tables(self):
         self._escape_table = g_escape_table.copy()
         self._code_table = {}
         if "smarty-pants" in self.extras:
             self._escape_table['"'] = _hash_text('"')
             self._escape_table["'"] = _hash_text("'")
+        # Reverse of `_escape_table` and `_code_table`.
+        self._unescape_table = dict((key, ch) for ch, key in self._escape_table.items())
 
     def reset(self):
         self.urls = {}
         self.titles = {}
         self.html_blocks = {}
         self.html_spans = {}
+        self._hashes = {}
         self.list_level = 0
         self.extras = self._instance_extras.copy()
         self._setup_extras()
         self._toc = None
+        self._incremental_cache = None
 
     def _setup_extras(self):
         if "footnotes" in self.extras:
@@ -278,7 +333,7 @@ class Markdown(object):
     # Opens the linked document in a new window or tab
     # should only used in <a> tags with an "href" attribute.
     # same with _a_nofollow
-    _a_nofollow_or_blank_links = re.compile(r"""
+    _a_nofollow_or_blank_links = _lazy_re(r"""
         <(a)
         (
             [^>]*
@@ -393,15 +448,10 @@ class Markdown(object):
             # return the removed text warning to its markdown.py compatible form
             text = text.replace(self.html_removed_text, self.html_removed_text_compat)
 
-        do_target_blank_links = "target-blank-links" in self.extras
-        do_nofollow_links = "nofollow" in self.extras
+        return self._attach_attrs(text)
 
-        if do_target_blank_links and do_nofollow_links:
-            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="nofollow noopener" target="_blank"\2', text)
-        elif do_target_blank_links:
-            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="noopener" target="_blank"\2', text)
-        elif do_nofollow_links:
-            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="nofollow"\2', text)
+    def _attach_attrs(self, text):
+        text = self._add_link_rels(text)
 
         if "toc" in self.extras and self._toc:
             self._toc_html = calculate_toc_html(self._toc)
@@ -416,12 +466,498 @@ class Markdown(object):
         rv = UnicodeWithAttrs(text)
 
         if "toc" in self.extras and self._toc:
+            rv.toc = self._toc
             rv.toc_html = self._toc_html
 
         if "metadata" in self.extras:
             rv.metadata = self.metadata
         return rv
 
+    def _add_link_rels(self, text):
+        do_target_blank_links = "target-blank-links" in self.extras
+        do_nofollow_links = "nofollow" in self.extras
+
+        if do_target_blank_links and do_nofollow_links:
+            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="nofollow noopener" target="_blank"\2', text)
+        elif do_target_blank_links:
+            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="noopener" target="_blank"\2', text)
+        elif do_nofollow_links:
+            text = self._a_nofollow_or_blank_links.sub(r'<\1 rel="nofollow"\2', text)
+        return text
+
+    def convert_incremental(self, text, cancelled=None):
+        """Convert the given text, re-rendering only the top-level blocks
+        that changed since the previous call on this instance.
+
+        The text is split into top-level blocks, never inside fenced code,
+        lists, blockquotes or HTML blocks. Link and footnote definitions are
+        gathered from every block before any block is rendered. Header ids,
+        footnote numbers and TOC entries of reused blocks are replayed in
+        document order, and a block is rendered again when the state it was
+        rendered with (definitions, header id counters, footnote numbers) no
+        longer matches, so the result is the same as `convert()`. When
+        `convert()` would pair fences or HTML tags across blocks, as happens
+        while they are unbalanced, the whole text is rendered as one block.
+
+        `cancelled`, if given, is called between blocks: once it returns
+        true, the conversion is abandoned and None is returned. The blocks
+        of the previous call are then kept for the next one.
+        """
+        if self.use_file_vars or "numbering" in self._instance_extras:
+            # These need the whole document at once.
+            return self.convert(text)
+        blocks = []
+        for html in self._iter_blocks(text):
+            if cancelled is not None and cancelled():
+                return None
+            blocks.append(html)
+        text = "\n\n".join(blocks)
+        if "footnotes" in self.extras and self.footnotes:
+            text += self._finish_block(self._add_footnotes(""))
+        return self._attach_attrs(text)
+
+    def convert_iter(self, text):
+        """Convert the given text, yielding the HTML of each top-level block
+        as soon as it is rendered.
+
+        Definitions are gathered from the whole text before the first block
+        is yielded. Footnotes come with the last chunk. The TOC, if the "toc"
+        extra is enabled, is only known once the generator is exhausted and
+        is then available as the `_toc_html` attribute, as with `convert()`.
+        Joining the chunks gives the result of `convert_incremental()`.
+        """
+        if self.use_file_vars or "numbering" in self._instance_extras:
+            yield self.convert(text)
+            return
+        separator = ""
+        for html in self._iter_blocks(text):
+            yield separator + self._add_link_rels(html)
+            separator = "\n\n"
+        footer = ""
+        if "footnotes" in self.extras and self.footnotes:
+            footer = self._add_link_rels(self._finish_block(self._add_footnotes("")))
+        self._toc_html = None
+        if "toc" in self.extras and self._toc:
+            self._toc_html = calculate_toc_html(self._toc)
+        yield footer + "\n"
+
+    def _iter_blocks(self, text):
+        """Yield the HTML of each top-level block of the given text,
+        reusing the blocks rendered by the previous call.
+        """
+        if self._incremental_cache is None:
+            self.reset()
+            self._incremental_cache = ({}, {})
+        prepared_cache, rendered_cache = self._incremental_cache
+
+        self.urls = {}
+        self.titles = {}
+        self.list_level = 0
+        self.extras = self._instance_extras.copy()
+        self._setup_extras()
+        self._toc = None
+
+        if not isinstance(text, str):
+            text = str(text, 'utf-8')
+        text = text.replace("\r\n", "\n")
+        text = text.replace("\r", "\n")
+        text += "\n\n"
+        text = self._detab(text)
+        text = self._ws_only_line_re.sub("", text)
+        if "metadata" in self.extras:
+            text = self._extract_metadata(text)
+        text = self.preprocess(text)
+
+        blocks = self._split_top_level_blocks(text)
+        if blocks is None:
+            # Rendered in one piece, as `convert()` does.
+            blocks = [text]
+        if not any(block in prepared_cache for block in blocks):
+            # Another document: drop what was kept for the previous one.
+            self.html_blocks = {}
+            self.html_spans = {}
+            self._hashes = {}
+            self._reset_escape_tables()
+            prepared_cache, rendered_cache = {}, {}
+
+        # First pass: definitions are global to the document.
+        new_prepared = {}
+        bodies = []
+        for block in blocks:
+            prepared = new_prepared.get(block) or prepared_cache.get(block)
+            if prepared is None:
+                prepared = self._prepare_block(block)
+            new_prepared[block] = prepared
+            body, urls, titles, footnotes = prepared
+            self.urls.update(urls)
+            self.titles.update(titles)
+            if "footnotes" in self.extras:
+                self.footnotes.update(footnotes)
+            body = body.lstrip("\n")
+            if not body:
+                continue
+            if bodies and (not bodies[-1].endswith("\n\n") or body[0] in " \t>"
+                           or self._block_continuation_re.match(body)):
+                # Stripped definitions made this block continue the previous
+                # one, or took the blank lines separating them.
+                bodies[-1] += body
+            else:
+                bodies.append(body)
+        if not bodies:
+            # convert() gives an empty paragraph for an empty document.
+            bodies.append("")
+        definitions = repr((
+            sorted(self.urls.items()),
+            sorted(self.titles.items()),
+            sorted(self.footnotes) if "footnotes" in self.extras else None))
+
+        # Second pass: render changed blocks, replay the others.
+        new_rendered = {}
+        for body in bodies:
+            key = (body, definitions if '[' in body else None)
+            entry = new_rendered.get(key) or rendered_cache.get(key)
+            if entry is None or not self._incremental_block_is_valid(entry):
+                entry = self._render_incremental_block(body)
+            new_rendered[key] = entry
+            if entry.header_ids:
+                self._count_from_header_id.update(entry.header_ids)
+            if entry.footnote_ids:
+                self.footnote_ids.extend(entry.footnote_ids)
+            if entry.toc:
+                if self._toc is None:
+                    self._toc = []
+                self._toc.extend(entry.toc)
+            yield entry.html
+        self._incremental_cache = (new_prepared, new_rendered)
+        self._prune_placeholders(new_prepared)
+
+    def _prune_placeholders(self, prepared_cache):
+        """Forget the placeholders that the kept blocks do not hold.
+
+        The rendered blocks are final HTML: only the prepared ones still
+        hold placeholders (HTML blocks, fenced code), possibly nested in the
+        text they stand for. Without this, an instance reused for document
+        after document would keep every URL and code span it ever saw, and
+        `_encode_backslash_escapes()` goes through all of them.
+        """
+        used = set()
+        pending = []
+        for body, urls, titles, footnotes in prepared_cache.values():
+            pending.append(body)
+            pending.extend(urls.values())
+            pending.extend(titles.values())
+            if footnotes:
+                pending.extend(footnotes.values())
+        tables = (self.html_blocks, self.html_spans, self._unescape_table)
+        while pending:
+            for key in _hash_re.findall(pending.pop()):
+                if key not in used:
+                    used.add(key)
+                    for table in tables:
+                        if key in table:
+                            pending.append(table[key])
+        base = set(g_escape_table.values())
+        if "smarty-pants" in self.extras:
+            base.update((self._escape_table['"'], self._escape_table["'"]))
+        self.html_blocks = dict((key, html) for key, html in self.html_blocks.items() if key in used)
+        self.html_spans = dict((key, html) for key, html in self.html_spans.items() if key in used)
+        self._hashes = dict((text, key) for text, key in self._hashes.items() if key in used)
+        self._code_table = dict((text, key) for text, key in self._code_table.items() if key in used)
+        self._escape_table = dict((ch, key) for ch, key in self._escape_table.items()
+                                  if key in used or key in base)
+        self._unescape_table = dict((key, ch) for key, ch in self._unescape_table.items()
+                                    if key in used or key in base)
+
+    def _split_top_level_blocks(self, text):
+        """Split normalized text into top-level blocks, or return None if
+        they would not render as the whole text does.
+
+        A new block only starts after a blank line, on an unindented line
+        that cannot continue the previous construct.
+
+        An indented code block swallows the blank lines around it, so a
+        blockquote before it lazily continues with the line after it:
+        no block starts there. A link definition is stripped with the blank
+        lines after it, so they do not separate blocks either, nor does the
+        blank line that the "tables" extra accepts after an underline row.
+        """
+        blocks = []
+        # Index of the first line of every block but the first one
+        boundaries = []
+        current = []
+        fence = None
+        html_tag = None
+        html_depth = 0
+        in_comment = False
+        link_def_re = self._link_def_line_re()
+        # Whether a blank line separates the line from the previous one,
+        # link definitions and the blank lines after them left out.
+        after_blank = False
+        after_link_def = False
+        # Whether the lines since the last blank line hold a blockquote,
+        # whether the last line may be in an indented code block and
+        # whether it may be the underline row of a table.
+        in_quote = False
+        in_code = False
+        in_table = False
+        lines = text.split("\n")
+        for index, line in enumerate(lines):
+            if fence is not None:
+                current.append(line)
+                if line.startswith(fence) and not line[len(fence):].strip():
+                    fence = None
+                continue
+            if in_comment or html_tag is not None:
+                current.append(line)
+                if in_comment:
+                    in_comment = "-->" not in line
+                else:
+                    html_depth += len(self._html_tag_start_re(html_tag).findall(line))
+                    html_depth -= line.count("</%s>" % html_tag)
+                    if html_depth <= 0:
+                        html_tag = None
+                continue
+            if not line:
+                if current:
+                    current.append(line)
+                    after_blank = after_blank or not after_link_def
+                continue
+            if link_def_re.match(line):
+                current.append(line)
+                after_link_def = True
+                continue
+            after_link_def = False
+            if (after_blank and not line.startswith(self.tab)
+                    and not (in_quote and in_code) and not in_table):
+                in_quote = False
+                if (line[0] not in " \t>"
+                        and not self._block_continuation_re.match(line)):
+                    blocks.append("\n".join(current) + "\n")
+                    boundaries.append(index)
+                    current = []
+            after_blank = False
+            if self._quote_line_re.match(line):
+                in_quote = True
+            in_code = line.startswith(self.tab)
+            in_table = bool(self._table_underline_re.match(line))
+            current.append(line)
+            match = self._fence_start_re.match(line)
+            if match:
+                fence = match.group(1)
+            elif line.startswith("<!--"):
+                in_comment = "-->" not in line[4:]
+            else:
+                match = self._html_block_start_re.match(line)
+                if match:
+                    html_tag = match.group(1)
+                    html_depth = (len(self._html_tag_start_re(html_tag).findall(line))
+                                  - line.count("</%s>" % html_tag))
+                    if html_depth <= 0:
+                        html_tag = None
+        if current:
+            blocks.append("\n".join(current) + "\n")
+        if (fence is not None or html_tag is not None or in_comment
+                or not self._pairs_within_blocks(lines, boundaries)):
+            # `convert()` pairs some fences or tags across blocks.
+            return None
+        return blocks
+
+    def _pairs_within_blocks(self, lines, boundaries):
+        """Return whether the fenced code blocks, HTML blocks and comments
+        that `convert()` would find in the given lines each lie within a
+        block, the blocks starting at the given line indexes.
+
+        The splitter pairs fences and tags on its own; while a document is
+        being edited they are often unbalanced, and the regexes of
+        `convert()` then pair them across blocks.
+        """
+        if not boundaries:
+            return True
+
+        def crosses(first, last):
+            i = bisect.bisect_right(boundaries, first)
+            return i < len(boundaries) and boundaries[i] <= last
+
+        line_starts = [0]
+        for line in lines:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+        # Lines hashed by an earlier pass, that the next ones do not see.
+        hashed = set()
+        text = "\n".join(lines)
+        if "fenced-code-blocks" in self.extras and "```" in text:
+            for match in self._fenced_code_block_re.finditer(text):
+                first = bisect.bisect_right(line_starts, match.start(1)) - 1
+                last = bisect.bisect_right(line_starts, match.end() - 1) - 1
+                if crosses(first, last):
+                    return False
+                hashed.update(range(first, last + 1))
+        if "<" not in text:
+            return True
+
+        # As `_strict_tag_block_sub()`: a block may only start where no tag
+        # is open.
+        tag_count = 0
+        current_tag = self._block_tags_a
+        start = 0
+        strict_hashed = []
+        next_boundary = iter(boundaries + [len(lines)])
+        boundary = next(next_boundary)
+        for index, line in enumerate(lines):
+            if index == boundary:
+                if tag_count:
+                    return False
+                boundary = next(next_boundary)
+            if index in hashed:
+                continue
+            match = self._strict_tag_line_re(current_tag).match(line)
+            if match:
+                if line.startswith("</"):
+                    tag_count -= 1
+                elif "</%s>" % match.group(2) in line[match.end():]:
+                    match = None
+                else:
+                    tag_count += 1
+                    current_tag = match.group(2)
+            if tag_count == 0:
+                if match:
+                    strict_hashed.append((start, index))
+                current_tag = self._block_tags_a
+                start = index + 1
+        for first, last in strict_hashed:
+            hashed.update(range(first, last + 1))
+
+        # As `_liberal_tag_block_re`: from a start tag at the beginning of a
+        # line to the first line ending with its end tag.
+        index = 0
+        while index < len(lines):
+            match = None
+            if index not in hashed:
+                match = self._liberal_tag_line_re().match(lines[index])
+            if match:
+                end_tag_re = self._end_tag_line_re(match.group(1))
+                for last in range(index, len(lines)):
+                    if last not in hashed and end_tag_re.search(lines[last]):
+                        if crosses(index, last):
+                            return False
+                        hashed.update(range(index, last + 1))
+                        index = last
+                        break
+            index += 1
+
+        # Comments: from "<!--" to the next "-->".
+        start = text.find("<!--")
+        while start >= 0:
+            end = text.find("-->", start)
+            if end < 0:
+                return False
+            first = bisect.bisect_right(line_starts, start) - 1
+            last = bisect.bisect_right(line_starts, end) - 1
+            if first not in hashed and crosses(first, last):
+                return False
+            start = text.find("<!--", end)
+        return True
+
+    _block_continuation_re = _lazy_re(r"(?:[*+-]|\d+\.)[ \t]")
+    _quote_line_re = _lazy_re(r"[ \t]*>")
+    _table_underline_re = _lazy_re(r"[ :|-]*(?:\|[ :|-]*-|-[ :|-]*\|)[ :|-]*$")
+    _fence_start_re = _lazy_re(r"([ \t]*(?:`{3,}|~{3,}))")
+
+    def _link_def_line_re(self):
+        # A link definition on a single line; footnotes span several lines.
+        return _get_re(("link-def-line", self.tab_width), lambda: re.compile(
+            r"[ ]{0,%d}\[(?!\^).+\]:[ \t]*\S" % (self.tab_width - 1)))
+
+    def _strict_tag_line_re(self, tags):
+        return _get_re(("strict-tag-line", tags), lambda: re.compile(
+            r"^(?:</code>(?=</pre>))?(</?(%s)\b>?)" % tags))
+
+    def _liberal_tag_line_re(self):
+        return _get_re("liberal-tag-line", lambda: re.compile(
+            r"<(%s)\b" % self._block_tags_b))
+
+    def _end_tag_line_re(self, tag):
+        return _get_re(("end-tag-line", tag), lambda: re.compile(r"</%s>[ \t]*$" % tag))
+
+    def _html_tag_start_re(self, tag):
+        return _get_re(("html-tag-start", tag), lambda: re.compile(r"<%s\b" % tag))
+
+    def _prepare_block(self, block):
+        """Run the document-level passes of `convert()` on one block and
+        return its body with the definitions found in it.
+        """
+        urls, self.urls = self.urls, {}
+        titles, self.titles = self.titles, {}
+        footnotes = None
+        if "footnotes" in self.extras:
+            footnotes, self.footnotes = self.footnotes, {}
+        try:
+            text = block
+            if 'wavedrom' in self.extras:
+                text = self._do_wavedrom_blocks(text)
+            if "fenced-code-blocks" in self.extras and not self.safe_mode:
+                text = self._do_fenced_code_blocks(text)
+            if self.safe_mode:
+                text = self._hash_html_spans(text)
+            text = self._hash_html_blocks(text, raw=True)
+            if "fenced-code-blocks" in self.extras and self.safe_mode:
+                text = self._do_fenced_code_blocks(text)
+            if 'admonitions' in self.extras:
+                text = self._do_admonitions(text)
+            if "footnotes" in self.extras:
+                text = self._strip_footnote_definitions(text)
+            text = self._strip_link_definitions(text)
+            return text, self.urls, self.titles, getattr(self, "footnotes", None)
+        finally:
+            self.urls = urls
+            self.titles = titles
+            if footnotes is not None:
+                self.footnotes = footnotes
+
+    def _incremental_block_is_valid(self, entry):
+        if entry.footnote_ids and entry.footnote_start != len(self.footnote_ids):
+            return False
+        if entry.header_id_start:
+            counts = self._count_from_header_id
+            for header_id, count in entry.header_id_start.items():
+                if counts.get(header_id, 0) != count:
+                    return False
+        return True
+
+    def _render_incremental_block(self, body):
+        header_counts = None
+        if "header-ids" in self.extras:
+            header_counts = self._count_from_header_id
+            self._count_from_header_id = _HeaderIdCounter(header_counts)
+        footnote_start = 0
+        if "footnotes" in self.extras:
+            footnote_start = len(self.footnote_ids)
+        toc, self._toc = self._toc, None
+        self.list_level = 0
+        try:
+            html = self._finish_block(self._run_block_gamut(body))
+            entry = _IncrementalBlock(html)
+            if header_counts is not None:
+                entry.header_id_start = self._count_from_header_id.start
+                entry.header_ids = dict(self._count_from_header_id)
+            if "footnotes" in self.extras:
+                entry.footnote_start = footnote_start
+                entry.footnote_ids = self.footnote_ids[footnote_start:]
+                del self.footnote_ids[footnote_start:]
+            entry.toc = self._toc
+            return entry
+        finally:
+            if header_counts is not None:
+                self._count_from_header_id = header_counts
+            self._toc = toc
+
+    def _finish_block(self, text):
+        text = self.postprocess(text)
+        text = self._unescape_special_chars(text)
+        if self.safe_mode:
+            text = self._unhash_html_spans(text)
+            text = text.replace(self.html_removed_text, self.html_removed_text_compat)
+        return text
+
     def postprocess(self, text):
         """A hook for subclasses to do some postprocessing of the html, if
         desired. This is called before unescaping of special chars and
@@ -448,7 +984,7 @@ class Markdown(object):
     #   another-var: blah blah
     #
     #   # header
-    _meta_data_pattern = re.compile(r'''
+    _meta_data_pattern = _lazy_re(r'''
         ^{0}(  # optional opening fence
             (?:
                 {1}:(?:\n+[ \t]+.*)+  # indented lists
@@ -462,15 +998,15 @@ class Markdown(object):
         '''.format(r'(?:---[\ \t]*\n)?', r'[\S \t]*\w[\S \t]*\s*'), re.MULTILINE | re.VERBOSE
     )
 
-    _key_val_list_pat = re.compile(
+    _key_val_list_pat = _lazy_re(
         r"^-(?:[ \t]*([^\n]*)(?:[ \t]*[:-][ \t]*(\S+))?)(?:\n((?:[ \t]+[^\n]+\n?)+))?",
         re.MULTILINE,
     )
-    _key_val_dict_pat = re.compile(
+    _key_val_dict_pat = _lazy_re(
         r"^([^:\n]+)[ \t]*:[ \t]*([^\n]*)(?:((?:\n[ \t]+[^\n]+)+))?", re.MULTILINE
     )  # grp0: key, grp1: value, grp2: multiline value
-    _meta_data_fence_pattern = re.compile(r'^---[\ \t]*\n', re.MULTILINE)
-    _meta_data_newline = re.compile("^\n", re.MULTILINE)
+    _meta_data_fence_pattern = _lazy_re(r'^---[\ \t]*\n', re.MULTILINE)
+    _meta_data_newline = _lazy_re("^\n", re.MULTILINE)
 
     def _extract_metadata(self, text):
         if text.startswith("---"):
@@ -543,7 +1079,7 @@ class Markdown(object):
 
         return tail
 
-    _emacs_oneliner_vars_pat = re.compile(r"((?:<!--)?\s*-\*-)\s*(?:(\S[^\r\n]*?)([\r\n]\s*)?)?(-\*-\s*(?:-->)?)", re.UNICODE)
+    _emacs_oneliner_vars_pat = _lazy_re(r"((?:<!--)?\s*-\*-)\s*(?:(\S[^\r\n]*?)([\r\n]\s*)?)?(-\*-\s*(?:-->)?)", re.UNICODE)
     # This regular expression is intended to match blocks like this:
     #    PREFIX Local Variables: SUFFIX
     #    PREFIX mode: Tcl SUFFIX
@@ -552,7 +1088,7 @@ class Markdown(object):
     # - "[ \t]" is used instead of "\s" to specifically exclude newlines
     # - "(\r\n|\n|\r)" is used instead of "$" because the sre engine does
     #   not like anything other than Unix-style line terminators.
-    _emacs_local_vars_pat = re.compile(r"""^
+    _emacs_local_vars_pat = _lazy_re(r"""^
         (?P<prefix>(?:[^\r\n|\n|\r])*?)
         [\ \t]*Local\ Variables:[\ \t]*
         (?P<suffix>.*?)(?:\r\n|\n|\r)
@@ -708,6 +1244,7 @@ class Markdown(object):
 
     _block_tags_a = 'p|div|h[1-6]|blockquote|pre|table|dl|ol|ul|script|noscript|form|fieldset|iframe|math|ins|del'
     _block_tags_a += _html5tags
+    _html_block_start_re = _lazy_re(r"<(%s)\b" % _block_tags_a)
 
     _strict_tag_block_re = re.compile(r"""
         (                       # save in \1
@@ -738,7 +1275,7 @@ class Markdown(object):
         """ % _block_tags_b,
         re.X | re.M)
 
-    _html_markdown_attr_re = re.compile(
+    _html_markdown_attr_re = _lazy_re(
         r'''\s+markdown=("1"|'1')''')
     def _hash_html_block_sub(self, match, raw=False):
         if isinstance(match, str):
@@ -756,14 +1293,14 @@ class Markdown(object):
                 middle = '\n'.join(lines[1:-1])
                 last_line = lines[-1]
                 first_line = first_line[:m.start()] + first_line[m.end():]
-                f_key = _hash_text(first_line)
+                f_key = self._get_hash(first_line)
                 self.html_blocks[f_key] = first_line
-                l_key = _hash_text(last_line)
+                l_key = self._get_hash(last_line)
                 self.html_blocks[l_key] = last_line
                 return ''.join(["\n\n", f_key,
                     "\n\n", middle, "\n\n",
                     l_key, "\n\n"])
-        key = _hash_text(html)
+        key = self._get_hash(html)
         self.html_blocks[key] = html
         return "\n\n" + key + "\n\n"
 
@@ -858,7 +1395,7 @@ class Markdown(object):
                 html = text[start_idx:end_idx]
                 if raw and self.safe_mode:
                     html = self._sanitize_html(html)
-                key = _hash_text(html)
+                key = self._get_hash(html)
                 self.html_blocks[key] = html
                 text = text[:start_idx] + "\n\n" + key + "\n\n" + text[end_idx:]
 
@@ -915,7 +1452,7 @@ class Markdown(object):
 
         # Link defs are in the form:
         #   [id]: url "optional title"
-        _link_def_re = re.compile(r"""
+        _link_def_re = _get_re(("link-def", less_than_tab), lambda: re.compile(r"""
             ^[ ]{0,%d}\[(.+)\]: # id = \1
               [ \t]*
               \n?               # maybe *one* newline
@@ -932,7 +1469,7 @@ class Markdown(object):
                 [ \t]*
             )?  # title is optional
             (?:\n+|\Z)
-            """ % less_than_tab, re.X | re.M | re.U)
+            """ % less_than_tab, re.X | re.M | re.U))
         return _link_def_re.sub(self._extract_link_def_sub, text)
 
     def _extract_link_def_sub(self, match):
@@ -948,13 +1485,13 @@ class Markdown(object):
             tables, figures etc.
         '''
         # First pass to define all the references
-        self.regex_defns = re.compile(r'''
+        self.regex_defns = _get_re("numbering-defns", lambda: re.compile(r'''
             \[\#(\w+) # the counter.  Open square plus hash plus a word \1
             ([^@]*)   # Some optional characters, that aren't an @. \2
             @(\w+)       # the id.  Should this be normed? \3
             ([^\]]*)\]   # The rest of the text up to the terminating ] \4
-            ''', re.VERBOSE)
-        self.regex_subs = re.compile(r"\[@(\w+)\s*\]")  # [@ref_id]
+            ''', re.VERBOSE))
+        self.regex_subs = _get_re("numbering-subs", lambda: re.compile(r"\[@(\w+)\s*\]"))  # [@ref_id]
         counters = {}
         references = {}
         replacements = []
@@ -1026,7 +1563,7 @@ class Markdown(object):
                 Text of the note.
         """
         less_than_tab = self.tab_width - 1
-        footnote_def_re = re.compile(r'''
+        footnote_def_re = _get_re(("footnote-def", self.tab_width), lambda: re.compile(r'''
             ^[ ]{0,%d}\[\^(.+)\]:   # id = \1
             [ \t]*
             (                       # footnote text = \2
@@ -1040,7 +1577,7 @@ class Markdown(object):
             # Lookahead for non-space at line-start, or end of doc.
             (?:(?=^[ ]{0,%d}\S)|\Z)
             ''' % (less_than_tab, self.tab_width, self.tab_width),
-            re.X | re.M)
+            re.X | re.M))
         return footnote_def_re.sub(self._extract_footnote_def_sub, text)
 
     _hr_re = re.compile(r'^[ ]{0,3}([-_*])[ ]{0,2}(\1[ ]{0,2}){2,}$', re.M)
@@ -1111,11 +1648,11 @@ class Markdown(object):
             return text
 
         less_than_tab = self.tab_width - 1
-        _pyshell_block_re = re.compile(r"""
+        _pyshell_block_re = _get_re(("pyshell", less_than_tab), lambda: re.compile(r"""
             ^([ ]{0,%d})>>>[ ].*\n  # first line
             ^(\1[^\S\n]*\S.*\n)*    # any number of subsequent lines with at least one character
             (?=^\1?\n|\Z)           # ends with a blank line or end of document
-            """ % less_than_tab, re.M | re.X)
+            """ % less_than_tab, re.M | re.X))
 
         return _pyshell_block_re.sub(self._pyshell_block_sub, text)
 
@@ -1170,7 +1707,7 @@ class Markdown(object):
         https://github.com/michelf/php-markdown/blob/lib/Michelf/Markdown.php#L2538
         """
         less_than_tab = self.tab_width - 1
-        table_re = re.compile(r'''
+        table_re = _get_re(("tables", less_than_tab), lambda: re.compile(r'''
                 (?:(?<=\n\n)|\A\n?)             # leading blank line
 
                 ^[ ]{0,%d}                      # allowed whitespace
@@ -1191,7 +1728,7 @@ class Markdown(object):
                         .*\|.*  \n
                     )+
                 )
-            ''' % (less_than_tab, less_than_tab, less_than_tab), re.M | re.X)
+            ''' % (less_than_tab, less_than_tab, less_than_tab), re.M | re.X))
         return table_re.sub(self._table_sub, text)
 
     def _wiki_table_sub(self, match):
@@ -1241,11 +1778,11 @@ class Markdown(object):
             return text
 
         less_than_tab = self.tab_width - 1
-        wiki_table_re = re.compile(r'''
+        wiki_table_re = _get_re(("wiki-tables", less_than_tab), lambda: re.compile(r'''
             (?:(?<=\n\n)|\A\n?)            # leading blank line
             ^([ ]{0,%d})\|\|.+?\|\|[ ]*\n  # first line
             (^\1\|\|.+?\|\|\n)*        # any number of subsequent lines
-            ''' % less_than_tab, re.M | re.X)
+            ''' % less_than_tab, re.M | re.X))
         return wiki_table_re.sub(self._wiki_table_sub, text)
 
     def _run_span_gamut(self, text):
@@ -1292,6 +1829,7 @@ class Markdown(object):
         return text
 
     # "Sorta" because auto-links are identified as "tag" tokens.
+    _lead_escape_re = re.compile(r'^((?:\\\\)*(?!\\))')
     _sorta_html_tokenize_re = re.compile(r"""
         (
             \\*  # escapes
@@ -1319,20 +1857,19 @@ class Markdown(object):
         # it isn't susceptible to unmatched '<' and '>' in HTML tags).
         # Note, however, that '>' is not allowed in an auto-link URL
         # here.
-        lead_escape_re = re.compile(r'^((?:\\\\)*(?!\\))')
         escaped = []
         is_html_markup = False
         for token in self._sorta_html_tokenize_re.split(text):
             # check token is preceded by 0 or more PAIRS of escapes, because escape pairs
             # escape themselves and don't affect the token
-            if is_html_markup and lead_escape_re.match(token):
+            if is_html_markup and self._lead_escape_re.match(token):
                 # Within tags/HTML-comments/auto-links, encode * and _
                 # so they don't conflict with their use in Markdown for
                 # italics and strong.  We're replacing each such
                 # character with its corresponding MD5 checksum value;
                 # this is likely overkill, but it should prevent us from
                 # colliding with the escape values by accident.
-                escape_seq, token = lead_escape_re.split(token)[1:] or ('', token)
+                escape_seq, token = self._lead_escape_re.split(token)[1:] or ('', token)
                 escaped.append(
                     escape_seq.replace('\\\\', self._escape_table['\\'])
                     + token.replace('*', self._escape_table['*'])
@@ -1372,7 +1909,7 @@ class Markdown(object):
         for index, token in enumerate(split_tokens):
             if is_html_markup and not _is_auto_link(token) and not _is_code_span(index, token):
                 sanitized = self._sanitize_html(token)
-                key = _hash_text(sanitized)
+                key = self._get_hash(sanitized)
                 self.html_spans[key] = sanitized
                 tokens.append(key)
             else:
@@ -1381,9 +1918,10 @@ class Markdown(object):
         return ''.join(tokens)
 
     def _unhash_html_spans(self, text):
-        for key, sanitized in list(self.html_spans.items()):
-            text = text.replace(key, sanitized)
-        return text
+        if not self.html_spans:
+            return text
+        return _hash_re.sub(
+            lambda match: self.html_spans.get(match.group(), match.group()), text)
 
     def _sanitize_html(self, s):
         if self.safe_mode == "replace":
@@ -1472,9 +2010,28 @@ class Markdown(object):
         with it (eg: escaping "&" in URL parameters)
         '''
         url = _html_escape_url(url, safe_mode=self.safe_mode)
-        key = _hash_text(url)
-        self._escape_table[url] = key
-        return key
+        return self._hash_special(self._escape_table, url)
+
+    def _get_hash(self, text):
+        """Return the placeholder of `text`, the same one each time during a
+        conversion.
+        """
+        try:
+            return self._hashes[text]
+        except KeyError:
+            key = self._hashes[text] = _hash_text(text)
+            return key
+
+    def _hash_special(self, table, text):
+        """Return the placeholder of `text` in `table` (`self._escape_table`
+        or `self._code_table`), which `_unescape_special_chars()` swaps back.
+        """
+        try:
+            return table[text]
+        except KeyError:
+            key = table[text] = self._get_hash(text)
+            self._unescape_table[key] = text
+            return key
 
     _safe_protocols = re.compile(r'(https?|ftp):', re.I)
     def _do_links(self, text):
@@ -1721,7 +2278,7 @@ class Markdown(object):
         '''
 
     _h_re = re.compile(_h_re_base % '*', re.X | re.M)
-    _h_re_tag_friendly = re.compile(_h_re_base % '+', re.X | re.M)
+    _h_re_tag_friendly = _lazy_re(_h_re_base % '+', re.X | re.M)
 
     def _h_sub(self, match):
         if match.group(1) is not None and match.group(3) == "-":
@@ -1791,6 +2348,41 @@ class Markdown(object):
         else:
             return "<%s%s>\n%s</%s>\n\n" % (lst_type, lst_opts, result, lst_type)
 
+    def _build_list_re(self, marker_pat):
+        less_than_tab = self.tab_width - 1
+        other_marker_pat = self._marker_ul if marker_pat == self._marker_ol else self._marker_ol
+        whole_list = r'''
+            (                   # \1 = whole list
+              (                 # \2
+                ([ ]{0,%d})     # \3 = the indentation level of the list item marker
+                (%s)            # \4 = first list item marker
+                [ \t]+
+                (?!\ *\4\ )     # '- - - ...' isn't a list. See 'not_quite_a_list' test case.
+              )
+              (?:.+?)
+              (                 # \5
+                  \Z
+                |
+                  \n{2,}
+                  (?=\S)
+                  (?!           # Negative lookahead for another list item marker
+                    [ \t]*
+                    %s[ \t]+
+                  )
+                |
+                  \n+
+                  (?=
+                    \3          # lookahead for a different style of list item marker
+                    %s[ \t]+
+                  )
+              )
+            )
+        ''' % (less_than_tab, marker_pat, marker_pat, other_marker_pat)
+        if self.list_level:  # sub-list
+            return re.compile("^"+whole_list, re.X | re.M | re.S)
+        return re.compile(r"(?:(?<=\n\n)|\A\n?)"+whole_list,
+                          re.X | re.M | re.S)
+
     def _do_lists(self, text):
         # Form HTML ordered (numbered) and unordered (bulleted) lists.
 
@@ -1802,40 +2394,9 @@ class Markdown(object):
             # types running into each other (see issue #16).
             hits = []
             for marker_pat in (self._marker_ul, self._marker_ol):
-                less_than_tab = self.tab_width - 1
-                other_marker_pat = self._marker_ul if marker_pat == self._marker_ol else self._marker_ol
-                whole_list = r'''
-                    (                   # \1 = whole list
-                      (                 # \2
-                        ([ ]{0,%d})     # \3 = the indentation level of the list item marker
-                        (%s)            # \4 = first list item marker
-                        [ \t]+
-                        (?!\ *\4\ )     # '- - - ...' isn't a list. See 'not_quite_a_list' test case.
-                      )
-                      (?:.+?)
-                      (                 # \5
-                          \Z
-                        |
-                          \n{2,}
-                          (?=\S)
-                          (?!           # Negative lookahead for another list item marker
-                            [ \t]*
-                            %s[ \t]+
-                          )
-                        |
-                          \n+
-                          (?=
-                            \3          # lookahead for a different style of list item marker
-                            %s[ \t]+
-                          )
-                      )
-                    )
-                ''' % (less_than_tab, marker_pat, marker_pat, other_marker_pat)
-                if self.list_level:  # sub-list
-                    list_re = re.compile("^"+whole_list, re.X | re.M | re.S)
-                else:
-                    list_re = re.compile(r"(?:(?<=\n\n)|\A\n?)"+whole_list,
-                                         re.X | re.M | re.S)
+                list_re = _get_re(
+                    ("lists", marker_pat, self.tab_width, bool(self.list_level)),
+                    lambda: self._build_list_re(marker_pat))
                 match = list_re.search(text, pos)
                 if match:
                     hits.append((match.start(), match))
@@ -1860,7 +2421,7 @@ class Markdown(object):
         ''' % (_marker_any, _marker_any),
         re.M | re.X | re.S)
 
-    _task_list_item_re = re.compile(r'''
+    _task_list_item_re = _lazy_re(r'''
         (\[[\ xX]\])[ \t]+       # tasklist marker = \1
         (.*)                   # list item text = \2
     ''', re.M | re.X | re.S)
@@ -2023,8 +2584,7 @@ class Markdown(object):
             formatter_opts = {}
 
         def unhash_code(codeblock):
-            for key, sanitized in list(self.html_spans.items()):
-                codeblock = codeblock.replace(key, sanitized)
+            codeblock = self._unhash_html_spans(codeblock)
             replacements = [
                 ("&amp;", "&"),
                 ("&lt;", "<"),
@@ -2061,7 +2621,7 @@ class Markdown(object):
 
     def _do_code_blocks(self, text):
         """Process Markdown `<pre><code>` blocks."""
-        code_block_re = re.compile(r'''
+        code_block_re = _get_re(("code-blocks", self.tab_width), lambda: re.compile(r'''
             (?:\n\n|\A\n?)
             (               # $1 = the code block -- one or more lines, starting with a space/tab
               (?:
@@ -2074,10 +2634,10 @@ class Markdown(object):
             # Needed when syntax highlighting is being used.
             (?!([^<]|<(/?)span)*\</code\>)
             ''' % (self.tab_width, self.tab_width),
-            re.M | re.X)
+            re.M | re.X))
         return code_block_re.sub(self._code_block_sub, text)
 
-    _fenced_code_block_re = re.compile(r'''
+    _fenced_code_block_re = _lazy_re(r'''
         (?:\n+|\A\n?|(?<=\n))
         (^[ \t]*`{3,})\s{0,99}?([\w+-]+)?\s{0,99}?\n  # $1 = opening fence (captured for back-referencing), $2 = optional lang
         (.*?)                             # $3 = code block content
@@ -2154,9 +2714,7 @@ class Markdown(object):
         ]
         for before, after in replacements:
             text = text.replace(before, after)
-        hashed = _hash_text(text)
-        self._code_table[text] = hashed
-        return hashed
+        return self._hash_special(self._code_table, text)
 
     def _wavedrom_block_sub(self, match):
         # if this isn't a wavedrom diagram block, exit now
@@ -2184,10 +2742,8 @@ class Markdown(object):
                 pass
 
         # hash SVG to prevent <> chars being messed with
-        self._escape_table[waves] = _hash_text(waves)
-
         return self._uniform_indent(
-            '\n%s%s%s\n' % (open_tag, self._escape_table[waves], close_tag),
+            '\n%s%s%s\n' % (open_tag, self._hash_special(self._escape_table, waves), close_tag),
             lead_indent, include_empty_lines=True
         )
 
@@ -2195,7 +2751,7 @@ class Markdown(object):
         return self._fenced_code_block_re.sub(self._wavedrom_block_sub, text)
 
     _admonitions = r'admonition|attention|caution|danger|error|hint|important|note|tip|warning'
-    _admonitions_re = re.compile(r'''
+    _admonitions_re = _lazy_re(r'''
         ^(\ *)\.\.\ (%s)::\ *                # $1 leading indent, $2 the admonition
         (.*)?                                # $3 admonition title
         ((?:\s*\n\1\ {3,}.*)+?)              # $4 admonition body (required)
@@ -2232,25 +2788,25 @@ class Markdown(object):
     def _do_admonitions(self, text):
         return self._admonitions_re.sub(self._do_admonitions_sub, text)
 
-    _strike_re = re.compile(r"~~(?=\S)(.+?)(?<=\S)~~", re.S)
+    _strike_re = _lazy_re(r"~~(?=\S)(.+?)(?<=\S)~~", re.S)
     def _do_strike(self, text):
         text = self._strike_re.sub(r"<s>\1</s>", text)
         return text
 
-    _underline_re = re.compile(r"(?<!<!)--(?!>)(?=\S)(.+?)(?<=\S)(?<!<!)--(?!>)", re.S)
+    _underline_re = _lazy_re(r"(?<!<!)--(?!>)(?=\S)(.+?)(?<=\S)(?<!<!)--(?!>)", re.S)
     def _do_underline(self, text):
         text = self._underline_re.sub(r"<u>\1</u>", text)
         return text
 
-    _tg_spoiler_re = re.compile(r"\|\|\s?(.+?)\s?\|\|", re.S)
+    _tg_spoiler_re = _lazy_re(r"\|\|\s?(.+?)\s?\|\|", re.S)
     def _do_tg_spoiler(self, text):
         text = self._tg_spoiler_re.sub(r"<tg-spoiler>\1</tg-spoiler>", text)
         return text
 
     _strong_re = re.compile(r"(\*\*|__)(?=\S)(.+?[*_]*)(?<=\S)\1", re.S)
     _em_re = re.compile(r"(\*|_)(?=\S)(.+?)(?<=\S)\1", re.S)
-    _code_friendly_strong_re = re.compile(r"\*\*(?=\S)(.+?[*_]*)(?<=\S)\*\*", re.S)
-    _code_friendly_em_re = re.compile(r"\*(?=\S)(.+?)(?<=\S)\*", re.S)
+    _code_friendly_strong_re = _lazy_re(r"\*\*(?=\S)(.+?[*_]*)(?<=\S)\*\*", re.S)
+    _code_friendly_em_re = _lazy_re(r"\*(?=\S)(.+?)(?<=\S)\*", re.S)
     def _do_italics_and_bold(self, text):
         # <strong> must go first:
         if "code-friendly" in self.extras:
@@ -2265,7 +2821,7 @@ class Markdown(object):
     # apostrophe; e.g. ignores the fact that "round", "bout", "twer", and
     # "twixt" can be written without an initial apostrophe. This is fine because
     # using scare quotes (single quotation marks) is rare.
-    _apostrophe_year_re = re.compile(r"'(\d\d)(?=(\s|,|;|\.|\?|!|$))")
+    _apostrophe_year_re = _lazy_re(r"'(\d\d)(?=(\s|,|;|\.|\?|!|$))")
     _contractions = ["tis", "twas", "twer", "neath", "o", "n",
         "round", "bout", "twixt", "nuff", "fraid", "sup"]
     def _do_smart_contractions(self, text):
@@ -2277,10 +2833,10 @@ class Markdown(object):
         return text
 
     # Substitute double-quotes before single-quotes.
-    _opening_single_quote_re = re.compile(r"(?<!\S)'(?=\S)")
-    _opening_double_quote_re = re.compile(r'(?<!\S)"(?=\S)')
-    _closing_single_quote_re = re.compile(r"(?<=\S)'")
-    _closing_double_quote_re = re.compile(r'(?<=\S)"(?=(\s|,|;|\.|\?|!|$))')
+    _opening_single_quote_re = _lazy_re(r"(?<!\S)'(?=\S)")
+    _opening_double_quote_re = _lazy_re(r'(?<!\S)"(?=\S)')
+    _closing_single_quote_re = _lazy_re(r"(?<=\S)'")
+    _closing_double_quote_re = _lazy_re(r'(?<=\S)"(?=(\s|,|;|\.|\?|!|$))')
     def _do_smart_punctuation(self, text):
         """Fancifies 'single quotes', "double quotes", and apostrophes.
         Converts --, ---, and ... into en dashes, em dashes, and ellipses.
@@ -2324,10 +2880,10 @@ class Markdown(object):
         )
     '''
     _block_quote_re = re.compile(_block_quote_base % '', re.M | re.X)
-    _block_quote_re_spoiler = re.compile(_block_quote_base % '[ \t]*?!?', re.M | re.X)
+    _block_quote_re_spoiler = _lazy_re(_block_quote_base % '[ \t]*?!?', re.M | re.X)
     _bq_one_level_re = re.compile('^[ \t]*>[ \t]?', re.M)
-    _bq_one_level_re_spoiler = re.compile('^[ \t]*>[ \t]*?![ \t]?', re.M)
-    _bq_all_lines_spoilers = re.compile(r'\A(?:^[ \t]*>[ \t]*?!.*[\n\r]*)+\Z', re.M)
+    _bq_one_level_re_spoiler = _lazy_re('^[ \t]*>[ \t]*?![ \t]?', re.M)
+    _bq_all_lines_spoilers = _lazy_re(r'\A(?:^[ \t]*>[ \t]*?!.*[\n\r]*)+\Z', re.M)
     _html_pre_block_re = re.compile(r'(\s*<pre>.+?</pre>)', re.S)
     def _dedent_two_spaces_sub(self, match):
         return re.sub(r'(?m)^  ', '', match.group(1))
@@ -2479,6 +3035,8 @@ class Markdown(object):
         return self._incomplete_tags_re.sub(incomplete_tags_sub, text)
 
     def _encode_backslash_escapes(self, text):
+        if "\\" not in text:
+            return text
         for ch, escape in list(self._escape_table.items()):
             text = text.replace("\\"+ch, escape)
         return text
@@ -2527,7 +3085,7 @@ class Markdown(object):
                % (''.join(chars), ''.join(chars[7:]))
         return addr
 
-    _basic_link_re = re.compile(r'!?\[.*?\]\(.*?\)')
+    _basic_link_re = _lazy_re(r'!?\[.*?\]\(.*?\)')
     def _do_link_patterns(self, text):
         link_from_hash = {}
         for regex, repl in self.link_patterns:
@@ -2575,22 +3133,25 @@ class Markdown(object):
                         .replace('*', self._escape_table['*'])
                         .replace('_', self._escape_table['_']))
                 link = '<a href="%s">%s</a>' % (escaped_href, text[start:end])
-                hash = _hash_text(link)
+                hash = self._get_hash(link)
                 link_from_hash[hash] = link
                 text = text[:start] + hash + text[end:]
-        for hash, link in list(link_from_hash.items()):
-            text = text.replace(hash, link)
+        if link_from_hash:
+            text = _hash_re.sub(
+                lambda match: link_from_hash.get(match.group(), match.group()), text)
         return text
 
     def _unescape_special_chars(self, text):
-        # Swap back in all the special characters we've hidden.
-        while True:
-            orig_text = text
-            for ch, hash in list(self._escape_table.items()) + list(self._code_table.items()):
-                text = text.replace(hash, ch)
-            if text == orig_text:
-                break
-        return text
+        # Swap back in all the special characters we've hidden, including
+        # those hidden in the text of a placeholder.
+        def unescape_sub(match):
+            ch = self._unescape_table.get(match.group())
+            if ch is None:
+                return match.group()
+            if 'md5-' in ch:
+                return _hash_re.sub(unescape_sub, ch)
+            return ch
+        return _hash_re.sub(unescape_sub, text)
 
     def _outdent(self, text):
         # Remove one level of line-leading tabs or spaces
@@ -2690,12 +3251,42 @@ def calculate_toc_html(toc):
     return '\n'.join(lines) + '\n'
 
 
+class _HeaderIdCounter(dict):
+    """Header id counter recording the document-wide count of each id at
+    the time a block first used it.
+    """
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+        self.start = {}
+
+    def __missing__(self, key):
+        count = self.start[key] = self.base.get(key, 0)
+        return count
+
+
+class _IncrementalBlock(object):
+    """A rendered top-level block and the document state it depends on."""
+    __slots__ = ("html", "header_id_start", "header_ids",
+                 "footnote_start", "footnote_ids", "toc")
+
+    def __init__(self, html):
+        self.html = html
+        self.header_id_start = None
+        self.header_ids = None
+        self.footnote_start = 0
+        self.footnote_ids = None
+        self.toc = None
+
+
 class UnicodeWithAttrs(str):
     """A subclass of unicode used for the return value of conversion to
     possibly attach some attributes. E.g. the "toc_html" attribute when
-    the "toc" extra is used.
+    the "toc" extra is used, and "toc", the (level, id, name) list it is
+    built from.
     """
     metadata = None
+    toc = None
     toc_html = None
 
 ## {{{ http://code.activestate.com/recipes/577257/ (r1)
@@ -2842,36 +3433,9 @@ def _dedent(text, tabsize=8, skip_first_line=False):
     return ''.join(lines)
 
 
-class _memoized(object):
-    """Decorator that caches a function's return value each time it is called.
-    If called later with the same arguments, the cached value is returned, and
-    not re-evaluated.
-
-    http://wiki.python.org/moin/PythonDecoratorLibrary
-    """
-    def __init__(self, func):
-        self.func = func
-        self.cache = {}
-
-    def __call__(self, *args):
-        try:
-            return self.cache[args]
-        except KeyError:
-            self.cache[args] = value = self.func(*args)
-            return value
-        except TypeError:
-            # uncachable -- for instance, passing a list as an argument.
-            # Better to not cache than to blow up entirely.
-            return self.func(*args)
-
-    def __repr__(self):
-        """Return the function's docstring."""
-        return self.func.__doc__
-
-
 def _xml_oneliner_re_from_tab_width(tab_width):
     """Standalone XML processing instruction regex."""
-    return re.compile(r"""
+    return _get_re(("xml-oneliner", tab_width), lambda: re.compile(r"""
         (?:
             (?<=\n\n)       # Starting after a blank line
             |               # or
@@ -2887,12 +3451,11 @@ def _xml_oneliner_re_from_tab_width(tab_width):
             [ \t]*
             (?=\n{2,}|\Z)       # followed by a blank line or end of document
         )
-        """ % (tab_width - 1), re.X)
-_xml_oneliner_re_from_tab_width = _memoized(_xml_oneliner_re_from_tab_width)
+        """ % (tab_width - 1), re.X))
 
 
 def _hr_tag_re_from_tab_width(tab_width):
-    return re.compile(r"""
+    return _get_re(("hr-tag", tab_width), lambda: re.compile(r"""
         (?:
             (?<=\n\n)       # Starting after a blank line
             |               # or
@@ -2907,8 +3470,7 @@ def _hr_tag_re_from_tab_width(tab_width):
             [ \t]*
             (?=\n{2,}|\Z)       # followed by a blank line or end of document
         )
-        """ % (tab_width - 1), re.X)
-_hr_tag_re_from_tab_width = _memoized(_hr_tag_re_from_tab_width)
+        """ % (tab_width - 1), re.X))
 
 
 def _xml_escape_attr(attr, skip_single_quote=True):
@@ -0,0 +1,202 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Fetches remote documents with timeouts, a size limit and connection reuse.
+
+This module does not depend on NVDA, so it can be exercised against a local
+HTTP server with a regular Python 3 interpreter.
+"""
+
+import codecs
+import http.client
+import re
+import ssl
+import threading
+import time
+import urllib.parse as urlParse
+
+connectTimeout = 5
+readTimeout = 15
+# Maximum size of a fetched document, in bytes
+maxSize = 16 * 1024 * 1024
+# Only the beginning of a document is searched for a <meta charset> declaration
+sniffSize = 4096
+maxRedirects = 5
+chunkSize = 65536
+redirectStatuses = (301, 302, 303, 307, 308)
+metaCharsetPattern = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([-\w.:]+)""", re.IGNORECASE)
+boms = (
+	(codecs.BOM_UTF8, "UTF-8-sig"),
+	(codecs.BOM_UTF32_LE, "UTF-32"),
+	(codecs.BOM_UTF32_BE, "UTF-32"),
+	(codecs.BOM_UTF16_LE, "UTF-16"),
+	(codecs.BOM_UTF16_BE, "UTF-16"),
+)
+
+
+class FetchError(Exception):
+	pass
+
+
+class TooLargeError(FetchError):
+	pass
+
+
+class EncodingError(FetchError):
+	pass
+
+
+def getSSLContext():
+	# Certificates are not checked: the Python of NVDA may lack the root certificates of some sites.
+	ctx = ssl.create_default_context()
+	ctx.check_hostname = False
+	ctx.verify_mode = ssl.CERT_NONE
+	return ctx
+
+
+class ConnectionPool:
+	"""Keeps the idle connections per (scheme, host, port) so that repeated fetches from the same host reuse them.
+	Connections idle for more than idleTimeout seconds are closed."""
+
+	def __init__(self, idleTimeout=60, maxPerHost=2, sslContext=None):
+		self.idleTimeout = idleTimeout
+		self.maxPerHost = maxPerHost
+		self.sslContext = sslContext
+		self._idle = {}
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		"""Returns an idle connection for key, or a new one (not connected yet) and whether it is reused."""
+		now = time.monotonic()
+		with self._lock:
+			connections = self._idle.get(key, [])
+			while connections:
+				connection, since = connections.pop()
+				if now - since < self.idleTimeout:
+					return connection, True
+				connection.close()
+		scheme, host, port = key
+		if scheme == "https":
+			if not self.sslContext:
+				self.sslContext = getSSLContext()
+			return http.client.HTTPSConnection(host, port, timeout=connectTimeout, context=self.sslContext), False
+		return http.client.HTTPConnection(host, port, timeout=connectTimeout), False
+
+	def put(self, key, connection):
+		with self._lock:
+			connections = self._idle.setdefault(key, [])
+			if len(connections) < self.maxPerHost:
+				connections.append((connection, time.monotonic()))
+				return
+		connection.close()
+
+	def clear(self):
+		with self._lock:
+			idle, self._idle = self._idle, {}
+		for connections in idle.values():
+			for connection, since in connections:
+				connection.close()
+
+
+pool = ConnectionPool()
+
+
+def readBody(response, limit):
+	"""Reads the body of response in chunks, raising TooLargeError beyond limit bytes."""
+	length = response.getheader("Content-Length")
+	if length and length.isdigit() and int(length) > limit:
+		raise TooLargeError(f"{length} bytes, maximum is {limit}")
+	buffer = bytearray()
+	while True:
+		chunk = response.read(min(chunkSize, limit + 1 - len(buffer)))
+		if not chunk:
+			break
+		buffer += chunk
+		if len(buffer) > limit:
+			raise TooLargeError(f"more than {limit} bytes")
+	return bytes(buffer)
+
+
+def request(url, headers, connectionPool, limit):
+	"""Sends one GET request. Returns the response, its body and whether its connection was reused."""
+	parts = urlParse.urlsplit(url)
+	if parts.scheme not in ("http", "https") or not parts.hostname:
+		raise FetchError(f"Unsupported URL: {url}")
+	port = parts.port or (443 if parts.scheme == "https" else 80)
+	key = (parts.scheme, parts.hostname, port)
+	path = parts.path or '/'
+	if parts.query:
+		path += '?' + parts.query
+	for attempt in range(2):
+		connection, reused = connectionPool.get(key)
+		try:
+			if not connection.sock:
+				connection.connect()
+			connection.sock.settimeout(readTimeout)
+			connection.request("GET", path, headers=headers)
+			response = connection.getresponse()
+			body = readBody(response, limit)
+		except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+			connection.close()
+			# The server may have closed an idle connection: retry once with a new one
+			if reused and not attempt:
+				continue
+			raise
+		except BaseException:
+			connection.close()
+			raise
+		if response.will_close:
+			connection.close()
+		else:
+			connectionPool.put(key, connection)
+		return response, body, reused
+
+
+def fetch(url, headers=None, connectionPool=None, limit=None):
+	"""Fetches url, following redirections. Returns the body, the charset given by the server (or None) and the final URL."""
+	headers = dict({"Accept": "text/html", "Accept-Encoding": "identity", "User-Agent": "MarkdownForever"}, **(headers or {}))
+	connectionPool = connectionPool or pool
+	limit = limit or maxSize
+	for i in range(maxRedirects + 1):
+		response, body, reused = request(url, headers, connectionPool, limit)
+		if response.status in redirectStatuses and response.getheader("Location"):
+			url = urlParse.urljoin(url, response.getheader("Location"))
+			continue
+		if response.status >= 400:
+			raise FetchError(f"HTTP Error {response.status}: {response.reason}")
+		return body, response.headers.get_content_charset(), url
+	raise FetchError("Too many redirections")
+
+
+def getPossibleEncodings(data, headerCharset=None):
+	"""Lists the encodings to try, from the most to the least likely: BOM, <meta charset> found at the beginning of the document, HTTP header, then UTF-8."""
+	encodings = []
+	for bom, encoding in boms:
+		if data.startswith(bom):
+			encodings.append(encoding)
+			break
+	match = metaCharsetPattern.search(data, 0, sniffSize)
+	if match:
+		encodings.append(match.group(1).decode("ascii", "replace"))
+	if headerCharset:
+		encodings.append(headerCharset)
+	encodings.append("UTF-8")
+	return encodings
+
+
+def decode(data, headerCharset=None):
+	for encoding in getPossibleEncodings(data, headerCharset):
+		try:
+			return data.decode(encoding)
+		except (LookupError, UnicodeDecodeError):
+			continue
+	raise EncodingError("Unable to guess the encoding")
+
+
+def fetchText(url, **kwargs):
+	"""Fetches url and returns it decoded. Raises FetchError, or OSError (socket.timeout included) on network errors."""
+	data, headerCharset, url = fetch(url, **kwargs)
+	return decode(data, headerCharset)
@@ -0,0 +1,79 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+defaultMaxSize = 32 * 1024 * 1024
+
+
+def getKey(*parts):
+	"""Returns a hash of the given parts. Parts that are not strings are serialized to JSON first,
+	or with repr if their mappings have keys that cannot be sorted or serialized."""
+	h = hashlib.sha256()
+	for part in parts:
+		if not isinstance(part, str):
+			try:
+				part = json.dumps(part, sort_keys=True, default=str)
+			except TypeError:
+				part = repr(part)
+		h.update(part.encode("UTF-8", "surrogatepass"))
+		h.update(b"\0")
+	return h.hexdigest()
+
+
+class RenderCache:
+	"""Least recently used cache of rendered documents, bounded by the size of its values in bytes."""
+
+	def __init__(self, maxSize=defaultMaxSize):
+		self.maxSize = maxSize
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			if key not in self._entries:
+				self.misses += 1
+				return default
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return self._entries[key][0]
+
+	def set(self, key, value, size=None):
+		"""Stores value. size is the number of bytes it takes, measured with sys.getsizeof if not given."""
+		valueSize = sys.getsizeof(value) if size is None else size
+		if valueSize > self.maxSize:
+			return
+		with self._lock:
+			if key in self._entries:
+				self.size -= self._entries.pop(key)[1]
+			self._entries[key] = (value, valueSize)
+			self.size += valueSize
+			while self.size > self.maxSize:
+				self.size -= self._entries.popitem(last=False)[1][1]
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.size = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def stats(self):
+		return {
+			"entries": len(self._entries),
+			"size": self.size,
+			"maxSize": self.maxSize,
+			"hits": self.hits,
+			"misses": self.misses,
+		}
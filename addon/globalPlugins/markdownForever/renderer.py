@@ -0,0 +1,801 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Markdown to HTML rendering: metadata, included files, extra tags, table of contents and HTML template.
+
+Nothing here depends on NVDA, so that batch renders documents exactly as the add-on does.
+The configuration is read through getConfig: the add-on points it to the NVDA configuration
+with configure (see common), batch to the configuration it reads from nvda.ini.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+try:
+	from . import dateFormat
+	from . import fileLoader
+	from . import frontMatter
+	from . import includeCache
+	from . import renderCache
+	from .lazyModules import bs4, yaml, markdown2, html2text, htmlParser
+except ImportError:
+	# Imported by batch, outside of the add-on package
+	import dateFormat
+	import fileLoader
+	import frontMatter
+	import includeCache
+	import renderCache
+	from lazyModules import bs4, yaml, markdown2, html2text, htmlParser
+try:
+	from logHandler import log
+	import addonHandler
+	addonHandler.initTranslation()
+except ImportError:
+	import logging
+	log = logging.getLogger(__name__)
+
+	def _(message):
+		return message
+
+EXTRAS = {
+	"break-on-newline": _("Replace single new line characters with <br> when True"),
+	"code-friendly": _("Disable _ and __ for em and strong"),
+	"cuddled-lists": _("Allow lists to be cuddled to the preceding paragraph"),
+	"fenced-code-blocks": _("Allows a code block to not have to be indented by fencing it with '```' on a line before and after"),
+	"footnotes": _("Support footnotes as in use on daringfireball.net and implemented in other Markdown processors (tho not in Markdown.pl v1.0.1)"),
+	"header-ids": _('Adds "id" attributes to headers. The id value is a slug of the header text'),
+	"html-classes": _('Takes a dict mapping html tag names (lowercase) to a string to use for a "class" tag attribute. Currently only supports "pre", "code", "table" and "img" tags'),
+	"link-patterns": _("Auto-link given regex patterns in text (e.g. bug number references, revision number references)"),
+	"markdown-in-html": _('Allow the use of markdown="1" in a block HTML tag to have markdown processing be done on its contents'),
+	"nofollow": _('Add rel="nofollow" to all <a> tags with an href.'),
+	"numbering": _("Create counters to number tables, figures, equations and graphs"),
+	"pyshell": _("Treats unindented Python interactive shell sessions as <code> blocks"),
+	"smarty-pants": _("Fancy quote, em-dash and ellipsis handling"),
+	"spoiler": _("A special kind of blockquote commonly hidden behind a click on SO"),
+	"strike": _("Parse ~~strikethrough~~ formatting"),
+	"target-blank-links": _('Add target="_blank" to all <a> tags with an href. This causes the link to be opened in a new tab upon a click'),
+	"tables": _("Tables using the same format as GFM and PHP-Markdown Extra"),
+	"tag-friendly": _("Requires atx style headers to have a space between the # and the header text. Useful for applications that require twitter style tags to pass through the parser"),
+	"task_list": _("Allows github-style task lists (i.e. check boxes)"),
+	"underline": _("Parse --underline-- formatting"),
+	"use-file-vars": _("Look for an Emacs-style markdown-extras file variable to turn on Extras"),
+	"wiki-tables": _("Google Code Wiki table syntax support"),
+	"xml": _("Passes one-liner processing instructions and namespaced XML tags"),
+}
+
+# Default values of the configuration keys used to render documents, as in the confSpecs of the add-on
+defaultConfig = {
+	"toc": False,
+	"toc-back": "",
+	"autonumber-headings": False,
+	"extratags": True,
+	"extratags-back": True,
+	"detectExtratags": True,
+	"genMetadata": True,
+	"defaultPath": r"%USERPROFILE%\documents",
+	"defaultFileName": "",
+	"HTMLTemplate": "default",
+	"markdown2Extras": "fenced-code-blocks,footnotes,header-ids,spoiler,strike,tables,task_list,underline,wiki-tables",
+	"HTMLTemplates": {},
+}
+# Set with configure
+configDir = ''
+defaultLanguage = "en"
+addonVersion = ''
+NVDAVersion = ''
+internalAutoNumber = r"\!"
+headingNames = ["h1", "h2", "h3", "h4", "h5", "h6"]
+extraTagClassPattern = re.compile(r"^extratag_%.+%$")
+internalTocTag = f":\\tableOfContent:{time.time()}/!$£:"
+curDir = os.path.dirname(__file__)
+addonPath = '\\'.join(curDir.split('\\')[0:-2])
+renderedHTMLCache = renderCache.RenderCache()
+# Metadata resolved from the metadata blocks, see resolveMetadata
+metadataCache = renderCache.RenderCache(1024 * 1024)
+# Incremented whenever the configuration may have changed, so that the metadata resolved before is not used anymore
+configGeneration = 0
+includesKeys = ["include-after", "include-before"]
+includedFiles = includeCache.IncludeCache()
+# Extra tags whose value does not change, see getStaticReplacements
+staticReplacements = None
+# Markdown instances reused by the incremental renders and their locks, per document and extras, see getMarkdowner
+markdowners = OrderedDict()
+markdownersLock = threading.Lock()
+maxMarkdowners = 16
+
+
+def getConfig():
+	"""Returns the markdownForever section of the configuration. Replaced with configure."""
+	return defaultConfig
+
+
+def configure(getConfig=None, configDir=None, defaultLanguage=None, addonVersion=None, NVDAVersion=None):
+	"""Sets what the rendering depends on, besides the documents. The values that are not given do not change.
+	getConfig returns the markdownForever section of the configuration, such as config.conf["markdownForever"];
+	configDir is the folder of the HTML templates of the user."""
+	global staticReplacements
+	values = {
+		"getConfig": getConfig,
+		"configDir": configDir,
+		"defaultLanguage": defaultLanguage,
+		"addonVersion": addonVersion,
+		"NVDAVersion": NVDAVersion,
+	}
+	globals().update({k: v for k, v in values.items() if v is not None})
+	staticReplacements = None
+	onConfigChanged()
+
+
+def onConfigChanged():
+	global configGeneration
+	configGeneration += 1
+	metadataCache.clear()
+	includedFiles.clear()
+
+
+def realpath(path):
+	path = path.lower()
+	vars = ["appdata", "tmp", "temp", "userprofile"]
+	for var in vars:
+		path = path.replace("%%%s%%" % var, os.environ.get(var, "%%%s%%" % var))
+	path = path.replace("%addondir%", addonPath)
+	return path
+
+
+def isPath(path):
+	path = realpath(path)
+	return os.path.exists(path) and os.path.isdir(path)
+
+
+def isValidFileName(filename):
+	return bool(re.match(r"^[^\\/:*?\"<>|]+$", filename))
+
+
+def get_default_file_name():
+	defaultFileName = getConfig()["defaultFileName"]
+	if defaultFileName.strip() and isValidFileName(defaultFileName):
+		return defaultFileName
+	return "MDF_%s" % time.strftime("%y-%m-%d_-_%H-%M-%S")
+
+
+def escapeHTML(text):
+	chars = {
+		"&": "&amp;",
+		'"': "&quot;",
+		"'": "&apos;",
+		"<": "&lt;",
+		">": "&gt;",
+	}
+	return "".join(chars.get(c, c) for c in text)
+
+
+def md2HTML(md, metadata=None, incremental=False, document=None, cancelEvent=None):
+	"""Converts Markdown to HTML. An incremental conversion returns None if cancelEvent gets set meanwhile."""
+	extras = getMarkdown2Extras()
+	if metadata and metadata["toc"]:
+		extras.append("toc")
+	if not incremental:
+		return markdown2.markdown(md, extras=extras)
+	with getMarkdowner(extras, document) as markdowner:
+		return markdowner.convert_incremental(md, cancelEvent.is_set if cancelEvent else None)
+
+
+@contextlib.contextmanager
+def getMarkdowner(extras, document=None):
+	"""Yields the Markdown instance that last rendered document (any hashable key, such as its path) with these extras,
+	so that its unchanged blocks are reused. While another thread renders the same document, a new instance is used:
+	renders never wait for each other."""
+	key = (document, tuple(extras))
+	with markdownersLock:
+		entry = markdowners.get(key)
+		if entry is None:
+			entry = markdowners[key] = (markdown2.Markdown(extras=extras), threading.Lock())
+			if len(markdowners) > maxMarkdowners:
+				markdowners.popitem(last=False)
+		markdowners.move_to_end(key)
+	markdowner, lock = entry
+	if not lock.acquire(blocking=False):
+		yield markdown2.Markdown(extras=extras)
+		return
+	try:
+		yield markdowner
+	finally:
+		lock.release()
+
+
+def loadIncludedFile(fp):
+	content = ""
+	try:
+		metadataBlock, text = fileLoader.loadMarkdown(fp)
+		metadata, content = extractMetadata(text, metadataBlock)
+	except BaseException as err:
+		msg = _("Unable to include “{filePath}”").format(filePath=fp)
+		content = f'<div class="MDF_err" role="complementary">{msg}: {escapeHTML(repr(err))}</div>'
+	return content
+
+
+def getFileContent(fp):
+	fp = realpath(fp)
+	fp_ = realpath(getConfig()["defaultPath"]) + '/' + fp
+	if not os.path.exists(fp) and os.path.exists(fp_):
+		fp = fp_
+	try:
+		return includedFiles.get(fp, configGeneration, loadIncludedFile)
+	except includeCache.RecursiveInclusionError as err:
+		msg = _("Recursive inclusion of “{filePath}”").format(filePath=fp)
+		return f'<div class="MDF_err" role="complementary">{msg}: {escapeHTML(str(err))}</div>'
+
+
+def resolveMetadata(metadataBlock):
+	"""Returns the metadata defined by a metadata block, completed with the configuration, and the YAML error if any.
+	The result is cached per block and configuration generation, unless the block holds extra tags giving the time.
+	The default file name, which depends on the time, is left to None, and the included files are not read."""
+	generation = configGeneration
+	key = (metadataBlock or '', generation)
+	# The title and the authors would keep the time of the first render
+	cacheable = '%' not in key[0] or not any(tag in key[0] for tag in timeExtraTags)
+	entry = metadataCache.get(key) if cacheable else None
+	if entry:
+		return entry
+	metadata = {}
+	error = None
+	if metadataBlock:
+		source = metadataBlock[3:-3].strip()
+		# Most blocks are flat maps: yaml is only used for the others
+		metadata = frontMatter.parse(source)
+		if metadata is None:
+			metadata = {}
+			try:
+				docs = yaml.load_all(source, Loader=yaml.FullLoader)
+				for doc in docs:
+					metadata = doc
+			except (ValueError, yaml.parser.ParserError, yaml.scanner.ScannerError) as err:
+				error = err
+	if not isinstance(metadata, dict):
+		metadata = {}
+	conf = getConfig()
+	HTMLHead = [
+		'<meta name="generator" content="MarkdownForever" />',
+		'<meta name="viewport" content="width=device-width, initial-scale=1.0, user-scalable=yes" />'
+	]
+	HTMLHeader = []
+	metadata = {k.lower(): v for k, v in metadata.items()}
+	if "language" in metadata.keys():
+		metadata["lang"] = metadata.pop("language")
+	if "authors" in metadata.keys():
+		metadata["author"] = metadata.pop("authors")
+	if not "template" in metadata.keys() or metadata["template"] not in (list(conf["HTMLTemplates"].keys())+["default", "minimal"]):
+		metadata["template"] = conf["HTMLTemplate"]
+	if not "autonumber-headings" in metadata.keys() or not isinstance(metadata["autonumber-headings"], (int, bool)):
+		metadata["autonumber-headings"] = conf["autonumber-headings"]
+	if not "title" in metadata.keys() or not isinstance(metadata["title"], (str, str)):
+		metadata["title"] = ""
+	if not "subtitle" in metadata.keys() or not isinstance(metadata["subtitle"], (str, str)):
+		metadata["subtitle"] = ""
+	metadata["title"] = str(processExtraTags(
+		bs4.BeautifulSoup(metadata["title"], "html.parser"))[-1].text)
+	if not "toc" in metadata.keys() or not isinstance(metadata["toc"], (int, bool)):
+		metadata["toc"] = conf["toc"]
+	if not "toc-back" in metadata.keys() or not isinstance(metadata["toc-back"], str):
+		metadata["toc-back"] = conf["toc-back"]
+	if not "extratags" in metadata.keys() or not isinstance(metadata["extratags"], (int, bool)):
+		metadata["extratags"] = conf["extratags"]
+	if not "extratags-back" in metadata.keys() or not isinstance(metadata["extratags-back"], (int, bool)):
+		metadata["extratags-back"] = conf["extratags-back"]
+	if not "detectExtratags" in metadata.keys() or not isinstance(metadata["detectExtratags"], (int, bool)):
+		metadata["detectExtratags"] = conf["detectExtratags"]
+	if not "genMetadata" in metadata.keys() or not isinstance(metadata["genMetadata"], (int, bool)):
+		metadata["genMetadata"] = conf["genMetadata"]
+	if not "lang" in metadata.keys() or not isinstance(metadata["lang"],  str):
+		metadata["lang"] = defaultLanguage
+	if not "mathjax" in metadata.keys() or not isinstance(metadata["mathjax"], (int, bool)):
+		metadata["mathjax"] = False
+	metadata["path"] = metadata["path"] if "path" in metadata.keys() and isPath(
+		metadata["path"]) else conf["defaultPath"]
+	metadata["filename"] = metadata["filename"] if "filename" in metadata.keys() and isValidFileName(metadata["filename"]) else None
+	if metadata["mathjax"]:
+		HTMLHead.append(
+			'<script src="http://cdn.mathjax.org/mathjax/latest/MathJax.js?config=TeX-AMS-MML_HTMLorMML" type="text/javascript"></script>')
+	if "title" in metadata.keys():
+		HTMLHead.append("<title>%s</title>" % escapeHTML(metadata["title"]))
+		HTMLHeader.append('<h1 class="title">%s</h1>' % escapeHTML(metadata["title"]))
+	if "subtitle" in metadata:
+		HTMLHeader.append('<p class="subtitle">%s</p>' % metadata["subtitle"])
+	if "keywords" in metadata.keys():
+		HTMLHead.append('<meta name="keywords" content="%s" />' %
+						metadata["keywords"])
+	if "author" in metadata.keys():
+		if isinstance(metadata["author"], (str, str)):
+			metadata["author"] = [metadata["author"]]
+		for author in metadata["author"]:
+			HTMLHeader.append('<p class="author">%s</p>' % md2HTML(author))
+			author_ = str(processExtraTags(
+				bs4.BeautifulSoup(author, "html.parser"))[-1].text)
+			HTMLHead.append('<meta name="author" content="%s" />' % author_)
+	if "css" in metadata.keys():
+		if isinstance(metadata["css"], (str, str)):
+			metadata["css"] = [metadata["css"]]
+		for css in metadata["css"]:
+			HTMLHead.append('<link rel="stylesheet" href="%s" />' %
+							realpath(css))
+	for include_key in includesKeys:
+		if include_key in metadata.keys():
+			if isinstance(metadata[include_key], (str, str)):
+				metadata[include_key] = [metadata[include_key]]
+	if "date" in metadata.keys():
+		HTMLHeader.append('<p class="date">%s</p>' % metadata["date"])
+		HTMLHead.append(
+			'<meta name="dcterms.date" content="%s" />' % metadata["date"])
+	metadata["HTMLHead"] = '\n'.join(HTMLHead)
+	if not HTMLHeader:
+		HTMLHeader = ""
+	else:
+		metadata["HTMLHeader"] = '\n'.join(HTMLHeader)
+	entry = (metadata, error)
+	if cacheable and generation == configGeneration:
+		metadataCache.set(key, entry, size=len(key[0]) + len(metadata["HTMLHead"]) + len(metadata.get("HTMLHeader", '')))
+	return entry
+
+
+def extractMetadata(text, metadataBlock=None):
+	"""Returns the metadata of a Markdown document and the text to render.
+	metadataBlock is given for documents already split by fileLoader.loadMarkdown:
+	text is then the body, surrounded by line breaks."""
+	o = {
+		"before": "",
+		"after": ""
+	}
+	end = 1
+	wrapped = metadataBlock is not None
+	if not wrapped and len(text) > 4 and text.startswith("---"):
+		ln = text[3]
+		if ln in ["\r", "\n"]:
+			if ln == "\r" and text[4] == "\n":
+				ln = "\r\n"
+			try:
+				end = (text.index(ln * 2)-3)
+				metadataBlock = text[0:end+3]
+				text = text[end+3:].strip()
+			except ValueError as err:
+				metadataBlock = text[0:end+3]
+				text = text[end+3:].strip()
+				text = f"! {err}\n\n```\n{metadataBlock}\n```\n\n{text}"
+				metadataBlock = None
+	metadata, error = resolveMetadata(metadataBlock)
+	metadata = metadata.copy()
+	if error:
+		text = f"! {error}\n\n```\n{metadataBlock}\n```\n\n{text.strip()}"
+		wrapped = False
+	if metadata["filename"] is None:
+		metadata["filename"] = get_default_file_name()
+	for include_key in includesKeys:
+		if include_key in metadata.keys():
+			for fp in metadata[include_key]:
+				o[include_key.split('-')[1]] += getFileContent(fp)
+	if (o["before"] or o["after"]) and not includedFiles.isIncluding():
+		stats = includedFiles.stats()
+		log.debug("Included files: %d read, %d reads saved" % (stats["reads"], stats["saved"]))
+	if wrapped:
+		return metadata, o["before"] + text + o["after"]
+	return metadata, o["before"] + '\n' + text + '\n' + o["after"]
+
+
+def getHTMLTemplate(name=None):
+	if not name:
+		name = getConfig()["HTMLTemplate"]
+	name = name.lower()
+	if name == "minimal":
+		return {
+			"name": "minimal",
+			"description": "",
+			"content": "{body}"
+		}
+	HTMLTemplateDir = realpath(f"{configDir}/{name}.tpl")
+	if name != "default" and os.path.isfile(HTMLTemplateDir):
+		fp = HTMLTemplateDir
+	else:
+		fp = os.path.join(curDir, "res", "default.tpl")
+	with open(fp) as readFile:
+		templateEntry = json.load(readFile)
+		return templateEntry
+
+
+def getStaticReplacements():
+	global staticReplacements
+	if not staticReplacements:
+		staticReplacements = [
+			("%addonVersion%", addonVersion, 1),
+			("%markdown2Version%", markdown2.__version__, 1),
+			("%html2textVersion%", '.'.join(map(str, html2text.__version__)), 1),
+			("%NVDAVersion%", NVDAVersion, 1),
+			("%toc%", internalTocTag, 0)
+		]
+	return staticReplacements
+
+
+# Extra tags whose value depends on the time of the render, see getReplacements
+timeExtraTags = ("%day%", "%Day%", "%dday%", "%month%", "%Month%", "%dmonth%", "%year%", "%Year%", "%date%", "%time%", "%now%")
+
+
+def getReplacements(lang):
+	"""Returns the extra tags, their values in lang (NVDA language if empty) and whether they are replaced when saving.
+	The locale of the process is not changed, so this can be called from any thread."""
+	if not lang:
+		lang = defaultLanguage
+	try:
+		days, months = dateFormat.getNames(lang)
+	except dateFormat.UnknownLanguageError as err:
+		log.error(f"Unknown language: {err}")
+		lang = defaultLanguage
+		days, months = dateFormat.getNames(lang)
+	now = datetime.datetime.now()
+	day = days[now.weekday()]
+	month = months[now.month - 1]
+	date = dateFormat.formatDate(lang, now)
+	time_ = dateFormat.formatTime(lang, now)
+	return [
+		("%day%", day, 1),
+		("%Day%", day.capitalize(), 1),
+		("%dday%", "%02d" % now.day, 1),
+		("%month%", month, 1),
+		("%Month%", month.capitalize(), 1),
+		("%dmonth%", "%02d" % now.month, 1),
+		("%year%", "%02d" % (now.year % 100), 1),
+		("%Year%", str(now.year), 1),
+		("%date%", date, 1),
+		("%time%", time_, 1),
+		("%now%", f"{date} {time_}", 1),
+	] + getStaticReplacements()
+
+
+def getExtraTagNodes(soup, text, pattern, values):
+	"""Splits text around the extra tags matched by pattern. Returns the text parts and an element per tag, holding its value."""
+	nodes = []
+	start = 0
+	for match in pattern.finditer(text):
+		if match.start() > start:
+			nodes.append(bs4.NavigableString(text[start:match.start()]))
+		toSearch = match.group()
+		tag = "div" if toSearch == "%toc%" else "span"
+		extraTag = soup.new_tag(tag, attrs={"class": "extratag_%s" % toSearch})
+		extraTag.string = values[toSearch]
+		nodes.append(extraTag)
+		start = match.end()
+	if start < len(text):
+		nodes.append(bs4.NavigableString(text[start:]))
+	return nodes
+
+
+def getExtraTagTextNodes(soup):
+	"""Returns the text nodes of soup that may contain extra tags, in document order. code and pre elements are skipped."""
+	nodes = []
+	stack = [iter(soup.contents)]
+	while stack:
+		for node in stack[-1]:
+			if isinstance(node, bs4.Tag):
+				if node.name not in ("code", "pre") and node.contents:
+					stack.append(iter(node.contents))
+					break
+			elif '%' in node and not isinstance(node, bs4.element.PreformattedString):
+				nodes.append(node)
+		else:
+			stack.pop()
+	return nodes
+
+
+def getExtraTagsError(lang):
+	"""Returns the message of the error preventing the extra tags from being processed in lang, None if there is none."""
+	if lang and not dateFormat.isKnownLanguage(lang):
+		log.error(f"Unknown language: {lang}")
+		return _(
+			"Metadata and extra tags error. '%s' value was not recognized for lang field." % lang)
+	return None
+
+
+def processExtraTags(soup, lang='', allRepl=True, allowBacktranslate=True):
+	msg = getExtraTagsError(lang)
+	if msg:
+		return False, msg
+	values = {toSearch: replaceBy for toSearch, replaceBy, replaceAlways in getReplacements(lang) if allRepl or replaceAlways}
+	# All the extra tags are searched at once, in a single walk of the document
+	pattern = re.compile('|'.join(re.escape(toSearch) for toSearch in values))
+	for node in getExtraTagTextNodes(soup):
+		if not pattern.search(node):
+			continue
+		if allowBacktranslate:
+			node.insert_before(*getExtraTagNodes(soup, str(node), pattern, values))
+			node.extract()
+		else:
+			node.replace_with(pattern.sub(lambda match: values[match.group()], str(node)))
+	return True, soup
+
+
+class ExtraTagsScanner:
+	"""Finds the extra tags rendered with back-translation in an HTML document, with the tokenizer of _html.parser.
+	No tree is built: the elements holding nothing but text are listed in matches as (start, end, extra tag),
+	the positions being the ones of their start and end tags in the document."""
+
+	def __init__(self, text):
+		self.text = text
+		self.matches = []
+		# Start position, name and extra tag of the element being scanned, and whether it holds text
+		self._current = None
+		self._lineStarts = None
+		parser = htmlParser.HTMLParser(convert_charrefs=True)
+		parser.handle_starttag = self.handleStartTag
+		parser.handle_endtag = self.handleEndTag
+		parser.handle_data = self.handleData
+		parser.handle_startendtag = parser.handle_comment = parser.handle_decl = parser.handle_pi = parser.unknown_decl = self.handleOther
+		self._parser = parser
+
+	def scan(self):
+		self._parser.feed(self.text)
+		self._parser.close()
+		return self.matches
+
+	def getPosition(self):
+		if self._lineStarts is None:
+			self._lineStarts = [0] + [match.end() for match in re.finditer('\n', self.text)]
+		line, offset = self._parser.getpos()
+		return self._lineStarts[line - 1] + offset
+
+	def handleStartTag(self, tag, attrs):
+		self._current = None
+		if tag not in ("span", "div"):
+			return
+		classes = dict(attrs).get("class") or ''
+		if any(extraTagClassPattern.match(value) for value in classes.split() + [classes]):
+			self._current = [self.getPosition(), tag, classes.split()[-1].split('_', 1)[-1], False]
+
+	def handleData(self, data):
+		if self._current:
+			self._current[3] = True
+
+	def handleEndTag(self, tag):
+		current, self._current = self._current, None
+		if current and current[1] == tag and current[3]:
+			start = self.getPosition()
+			self.matches.append((current[0], self.text.index('>', start) + 1, current[2]))
+
+	def handleOther(self, *args):
+		self._current = None
+
+
+def backTranslateExtraTags(text):
+	"""Replaces the elements rendered for the extra tags by the extra tags themselves. The rest of text is left as is."""
+	if "extratag_" not in text:
+		return text
+	out = []
+	end = 0
+	for start, matchEnd, extratag in ExtraTagsScanner(text).scan():
+		out.append(text[end:start])
+		out.append(extratag)
+		end = matchEnd
+	out.append(text[end:])
+	return ''.join(out)
+
+
+class Heading:
+	"""A heading of a rendered document. tocName is its name in the table of contents, None if it is not listed there."""
+
+	def __init__(self, position, node, tocName=None):
+		self.position = position
+		self.node = node
+		self.level = int(node.name[1])
+		self.id = node.get("id")
+		self.text = node.get_text()
+		self.tocName = tocName
+
+
+def getHeadingOutline(soup, toc=None):
+	"""Returns the headings of soup in document order, found in one search.
+	toc is the (level, id, name) list recorded by markdown2 while rendering: the headings it lists get their name."""
+	tocNames = {id: name for level, id, name in toc or []}
+	return [
+		Heading(position, node, tocNames.pop(node.get("id"), None))
+		for position, node in enumerate(soup.find_all(headingNames))
+	]
+
+
+def getTocHTML(outline, toc):
+	"""Returns the table of contents, as markdown2 writes it, of the headings of outline it lists."""
+	entries = [(heading.level, heading.id, heading.tocName) for heading in outline if heading.tocName is not None]
+	# A heading listed by markdown2 may have been left out of the document, by the safe mode for example
+	return markdown2.calculate_toc_html(entries if len(entries) == len(toc) else toc)
+
+
+def applyAutoNumberHeadings(soup, before="", outline=None):
+	if outline is None:
+		outline = getHeadingOutline(soup)
+	l = []
+	previousHeadingLevel = 0
+	for heading in outline:
+		match = heading.node
+		if heading.text.strip().startswith(internalAutoNumber):
+			first = match.find(string=True)
+			first.replaceWith(first.replace(internalAutoNumber, ""))
+			continue
+		currentHeadingLevel = heading.level
+		if currentHeadingLevel == previousHeadingLevel:
+			l[-1] += 1
+		elif currentHeadingLevel < previousHeadingLevel:
+			l = l[0:currentHeadingLevel]
+			l[-1] += 1
+		else:
+			diff = currentHeadingLevel-previousHeadingLevel
+			l += [0]*diff
+			l[-1] = 1
+		current = '.'.join([str(k) for k in l])
+		current = re.sub(r"^(0\.)+(.+)$", r"\2", current)
+		first = match.contents[0] if match.contents else None
+		if type(first) is bs4.NavigableString:
+			first.replaceWith("%s. %s" % (current, first))
+		else:
+			match.insert(0, bs4.NavigableString("%s. " % current))
+		previousHeadingLevel = currentHeadingLevel
+	return soup
+
+
+def translate_back_toc(s, idx=False):
+	t = ["b1", "a1", "b2", "a2", "b3", "a3", "b4", "a4", "b5", "a5", "b6", "a6"]
+	if isinstance(s, tuple):
+		out = []
+		for e in s:
+			if not isinstance(e, int): continue
+			out.append(t[e])
+		return ','.join(out)
+	s = s.replace(' ', '').lower()
+	l = s.split(',')
+	if idx:
+		out = []
+		for e in l:
+			if not e in t: continue
+			out.append(t.index(e))
+		return out
+	after = set()
+	before = set()
+	for e in l:
+		if e[-1] not in "123456":
+			continue
+		if e.startswith('b'):
+			before.add('h' + e[-1])
+		if e.startswith('a'):
+			after.add('h' + e[-1])
+	return before, after
+
+
+def add_back_toc(soup, before=["h1"], after=["h2"], outline=None):
+	if not before and not after:
+		return soup
+	if outline is None:
+		outline = getHeadingOutline(soup)
+	if before:
+		matches = [heading.node for heading in outline if heading.node.name in before]
+		for m in matches[1:]:
+			link_toc_back = soup.new_tag('a')
+			link_toc_back["href"] = "#doc-toc"
+			link_toc_back.string = _("Back to Table of Contents")
+			m.insert_before(link_toc_back)
+	if after:
+		matches = [heading.node for heading in outline if heading.node.name in after]
+		for m in matches:
+			link_toc_back = soup.new_tag('a')
+			link_toc_back["href"] = "#doc-toc"
+			link_toc_back.string = _("Back to Table of Contents")
+			m.insert_after(link_toc_back)
+	return soup
+
+
+def getRenderKey(text, metadata, prettify=False, useTemplateHTML=True, template=None):
+	"""template is the content of the HTML template of the document, read if not given."""
+	renderMetadata = {k: v for k, v in metadata.items() if k not in ["path", "filename"]}
+	if not useTemplateHTML:
+		template = ''
+	elif template is None:
+		template = getHTMLTemplate(metadata["template"])["content"]
+	extratagsValues = []
+	if metadata["extratags"] and '%' in text:
+		lang = metadata["langd"] if "langd" in metadata.keys() else ''
+		extratagsValues = [replaceBy for toSearch, replaceBy, replaceAlways in getReplacements(lang) if toSearch in text]
+	return renderCache.getKey(
+		text, renderMetadata, getMarkdown2Extras(), template, extratagsValues, prettify, useTemplateHTML)
+
+
+def fillHTMLTemplate(metadata, template=None):
+	content = getHTMLTemplate(metadata["template"])["content"] if template is None else template
+	content = content.replace("{lang}", metadata["lang"], 1)
+	content = content.replace("{head}", metadata["HTMLHead"], 1)
+	content = content.replace("{header}", metadata["HTMLHeader"], 1)
+	return content
+
+
+def renderHTML(text, metadata, prettify=False, useTemplateHTML=True, template=None, document=None, cancelEvent=None):
+	"""Returns True and the HTML of a document, or False and an error message, None if cancelEvent gets set meanwhile.
+	document identifies the document between renders, see getMarkdowner."""
+	extratags = metadata["extratags"]
+	res = md2HTML(text, metadata, incremental=True, document=document, cancelEvent=cancelEvent)
+	if res is None:
+		return False, None
+	toc = res.toc
+	body = str(res)
+	del res
+	content = bs4.BeautifulSoup(body, "html.parser")
+	# The headings are searched once, for the table of contents, the numbering and the links back to the table of contents
+	outline = getHeadingOutline(content, toc)
+	toc_html = None
+	if toc and len(toc) > 1:
+		toc_html = getTocHTML(outline, toc)
+	if metadata["autonumber-headings"]:
+		if toc_html:
+			toc_html = toc_html.replace("<ul>", "<ol>").replace("</ul>", "</ol>")
+		content = applyAutoNumberHeadings(content, outline=outline)
+	if extratags:
+		ok, content = processExtraTags(content, lang=metadata["langd"] if "langd" in metadata.keys(
+		) else '', allowBacktranslate=metadata["extratags-back"])
+		if not ok:
+			return False, content
+	if cancelEvent and cancelEvent.is_set():
+		return False, None
+	if toc_html and metadata["toc-back"]:
+		before, after = translate_back_toc(metadata["toc-back"])
+		content = add_back_toc(content, before, after, outline)
+	content = str(content.prettify()) if prettify else str(content)
+	if toc_html:
+		if internalTocTag not in content:
+			pre = '<h1 id="doc-toc-h1">%s</h1>' % _("Table of contents")
+			content = pre + internalTocTag + content
+		content = content.replace(internalTocTag, '<nav role="doc-toc" id="doc-toc">%s</nav>' % toc_html)
+	else:
+		content = content.replace(internalTocTag, '%toc%')
+	if useTemplateHTML:
+		useTemplateHTML = not re.search("</html>", body, re.IGNORECASE)
+	if useTemplateHTML:
+		content = fillHTMLTemplate(metadata, template).replace("{body}", content, 1)
+	return True, content
+
+
+def canStreamHTML(metadata):
+	return not metadata["toc"] and not metadata["autonumber-headings"]
+
+
+def iterHTML(text, metadata, useTemplateHTML=True, document=None):
+	"""Returns True and an iterator yielding the HTML of the document as its top-level blocks get rendered,
+	or False and an error message, as renderHTML.
+	Only for documents without whole-document passes, see canStreamHTML."""
+	lang = metadata["langd"] if "langd" in metadata.keys() else ''
+	if metadata["extratags"]:
+		msg = getExtraTagsError(lang)
+		if msg:
+			return False, msg
+	return True, iterHTMLChunks(text, metadata, useTemplateHTML, lang, document)
+
+
+def iterHTMLChunks(text, metadata, useTemplateHTML, lang, document):
+	head, tail = '', ''
+	if useTemplateHTML and not re.search("</html>", text, re.IGNORECASE):
+		head, sep, tail = fillHTMLTemplate(metadata).partition("{body}")
+	yield head
+	# The Markdown instance of renderHTML, so that the blocks rendered by one are reused by the other
+	with getMarkdowner(getMarkdown2Extras(), document) as markdowner:
+		for chunk in markdowner.convert_iter(text):
+			if metadata["extratags"] and '%' in chunk:
+				ok, soup = processExtraTags(bs4.BeautifulSoup(chunk, "html.parser"), lang=lang, allowBacktranslate=metadata["extratags-back"])
+				chunk = str(soup)
+			yield chunk.replace(internalTocTag, '%toc%')
+	yield tail
+
+
+def getMarkdown2Extras(index=False, extras=None):
+	if not extras:
+		extras = getConfig()["markdown2Extras"].split(',')
+	if index:
+		return tuple([list(EXTRAS.keys()).index(extra) for extra in extras if extra in EXTRAS.keys()])
+	return [extra for extra in extras if extra in EXTRAS.keys()]
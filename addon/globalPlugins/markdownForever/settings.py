@@ -15,6 +15,7 @@ import addonHandler
 import config
 
 from . import HTTPServer
+from . import updatecheck
 from .common import (addonSummary, configDir,
 	IM_actionLabels, IM_actions,
 	markdownEngines, markdownEngineLabels,
@@ -22,7 +23,7 @@ from .common import (addonSummary, configDir,
 	getHTMLTemplates, getHTMLTemplate,
 	getDefaultHTMLTemplateID, getHTMLTemplateFromID,
 	realpath, minCharTemplateName, maxCharTemplateName,
-	translate_back_toc)
+	translate_back_toc, onConfigChanged)
 
 addonHandler.initTranslation()
 
@@ -113,6 +114,14 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 			fileNameText, wx.TextCtrl)
 		self.fileNameTextCtrl.SetValue(config.conf["markdownForever"]["defaultFileName"])
 
+		virtualDocumentsConf = config.conf["markdownForever"]["virtualDocuments"]
+		self.maxNodes = sHelper.addLabeledControl(
+			_("Maximum number of elements captured from web pages (0 for no l&imit):"),
+			gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=10000000, initial=virtualDocumentsConf["maxNodes"])
+		self.maxTime = sHelper.addLabeledControl(
+			_("Maximum capture time of web pages in &seconds (0 for no limit):"),
+			gui.nvdaControls.SelectOnFocusSpinCtrl, min=0, max=3600, initial=virtualDocumentsConf["maxTime"])
+
 	def onManageHTMLTemplates(self, evt):
 		manageHTMLTemplatesDialog = ManageHTMLTemplatesDlg(self)
 		if manageHTMLTemplatesDialog.ShowModal() == wx.ID_OK:
@@ -132,6 +141,7 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 		size = len(self.updateChannels)
 		config.conf["markdownForever"]["autoCheckUpdate"] = updateCheckChoice < size
 		config.conf["markdownForever"]["updateChannel"] = self.updateChannels[updateCheckChoice % size]
+		updatecheck.reschedule()
 
 		tableOfContentsBackList = self.tableOfContentsBackList.CheckedItems
 		tableOfContentsBackList = translate_back_toc(tableOfContentsBackList)
@@ -139,6 +149,7 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 
 		defaultPath = self.defaultPath.GetValue()
 		if not os.path.exists(realpath(defaultPath)):
+			onConfigChanged()
 			return self.defaultPath.SetFocus()
 		config.conf["markdownForever"]["toc"] = self.tableOfContentsCheckBox.IsChecked()
 		config.conf["markdownForever"]["autonumber-headings"] = self.numberHeadingsCheckBox.IsChecked()
@@ -152,6 +163,9 @@ class GeneralDlg(gui.settingsDialogs.SettingsPanel):
 			config.conf["markdownForever"]["defaultFileName"] = ''.join([c for c in self.fileNameTextCtrl.GetValue() if c not in '\r\n	\/:*?"<>|']).strip()
 		config.conf["markdownForever"]["markdown2Extras"] = ','.join(
 			getMarkdown2ExtrasFromIndexes(self.markdown2Extras.CheckedItems))
+		config.conf["markdownForever"]["virtualDocuments"]["maxNodes"] = self.maxNodes.GetValue()
+		config.conf["markdownForever"]["virtualDocuments"]["maxTime"] = self.maxTime.GetValue()
+		onConfigChanged()
 
 
 class ManageHTMLTemplatesDlg(gui.settingsDialogs.SettingsPanel):
@@ -185,6 +199,7 @@ class ManageHTMLTemplatesDlg(gui.settingsDialogs.SettingsPanel):
 		sHelper.addItem(bHelper)
 
 	def refreshTemplatesList(self, name=None):
+		onConfigChanged()
 		self.HTMLTemplatesListBox.Set(getHTMLTemplates())
 		self.HTMLTemplatesListBox.SetSelection(getDefaultHTMLTemplateID(name))
 
@@ -204,6 +219,7 @@ class ManageHTMLTemplatesDlg(gui.settingsDialogs.SettingsPanel):
 		templateID = self.HTMLTemplatesListBox.GetSelection()
 		HTMLTemplate = getHTMLTemplateFromID(templateID)
 		config.conf["markdownForever"]["HTMLTemplate"] = HTMLTemplate
+		onConfigChanged()
 		self.onHTMLTemplatesListBox()
 		self.HTMLTemplatesListBox.SetFocus()
 
@@ -355,6 +371,11 @@ class WebServerDlg(gui.settingsDialogs.SettingsPanel):
 			config.conf["markdownForever"]["HTTPServer"]["port"]))
 		self.defaultEncoding = sHelper.addLabeledControl(
 			_("Default &encoding:"), wx.TextCtrl, value=config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"])
+		liveReloadText = _("&Reload pages when their file changes")
+		self.liveReloadCheckBox = sHelper.addItem(
+			wx.CheckBox(self, label=liveReloadText))
+		self.liveReloadCheckBox.SetValue(
+			config.conf["markdownForever"]["HTTPServer"]["liveReload"])
 		rootFoldersText = _("Root &folders:")
 		self.rootFoldersListBox = sHelper.addLabeledControl(
 			rootFoldersText, wx.Choice, choices=self.getRootFolders())
@@ -376,6 +397,7 @@ class WebServerDlg(gui.settingsDialogs.SettingsPanel):
 			config.conf["markdownForever"]["HTTPServer"]["port"] = port
 		if defaultEncoding:
 			config.conf["markdownForever"]["HTTPServer"]["defaultEncoding"] = defaultEncoding
+		config.conf["markdownForever"]["HTTPServer"]["liveReload"] = self.liveReloadCheckBox.IsChecked()
 
 
 class AddonSettingsDialog(gui.settingsDialogs.MultiCategorySettingsDialog):
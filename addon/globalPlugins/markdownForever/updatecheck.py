@@ -167,31 +167,71 @@ def SHA256Sum(fp):
 	return sha256_hash.hexdigest()
 
 
+# Set to make the update check thread compute its next due time again.
+rescheduleEvent = threading.Event()
+
+
+def reschedule():
+	"""Wakes the update check thread, e.g. after the update settings changed."""
+	rescheduleEvent.set()
+
+
+def getDelayChecking():
+	return 86400 if config.conf[sectionName]["updateChannel"] != "stable" else 604800
+
+
 class UpdateCheck(threading.Thread):
 
 	shouldStop = False
+	# Seconds before retrying while an update dialog is opened.
+	retryDelay = 60
+
+	def __init__(self):
+		super().__init__(daemon=True)
+
+	def getTimeout(self, checkingForced=False):
+		"""Returns the number of seconds until the next check is due, None when automatic checks are disabled."""
+		if not config.conf[sectionName]["autoCheckUpdate"]:
+			return None
+		if checkInProgress:
+			return self.retryDelay
+		if checkingForced:
+			return 0
+		nextCheck = config.conf[sectionName]["lastCheckUpdate"] + getDelayChecking()
+		return max(0, nextCheck - time.time())
 
 	def run(self):
 		if globalVars.appArgs.secure or config.isAppX or globalVars.appArgs.launcher:
 			return self.stop()
+		config.post_configProfileSwitch.register(reschedule)
+		config.post_configReset.register(reschedule)
 		checkingForced = False
-		delayChecking = 86400 if config.conf[sectionName]["updateChannel"] != "stable" else 604800
-		while not self.shouldStop:
-			if not checkInProgress and config.conf[sectionName][
-					"autoCheckUpdate"]:
-				if config.conf[sectionName]["lastNVDAVersion"] != versionInfo.version:
+		try:
+			while True:
+				rescheduleEvent.clear()
+				if self.shouldStop:
+					break
+				if config.conf[sectionName]["autoCheckUpdate"] and config.conf[sectionName]["lastNVDAVersion"] != versionInfo.version:
 					config.conf[sectionName]["lastNVDAVersion"] = versionInfo.version
 					checkingForced = True
-				if checkingForced or (
-						time.time() -
-						config.conf[sectionName]["lastCheckUpdate"]) > delayChecking:
-					log.info(
-						"Checking update... Forced: %s" %
-						("yes" if checkingForced else "no"))
-					checkUpdates(True)
-					config.conf[sectionName]["lastCheckUpdate"] = time.time()
+				timeout = self.getTimeout(checkingForced)
+				if timeout and rescheduleEvent.wait(timeout):
+					continue
+				if timeout is None:
+					rescheduleEvent.wait()
+					continue
+				if self.shouldStop or checkInProgress:
+					continue
+				log.info(
+					"Checking update... Forced: %s" %
+					("yes" if checkingForced else "no"))
+				checkUpdates(True)
+				config.conf[sectionName]["lastCheckUpdate"] = time.time()
 				checkingForced = False
-			time.sleep(0.01)
+		finally:
+			config.post_configProfileSwitch.unregister(reschedule)
+			config.post_configReset.unregister(reschedule)
 
 	def stop(self):
 		self.shouldStop = True
+		rescheduleEvent.set()
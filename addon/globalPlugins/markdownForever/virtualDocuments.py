@@ -7,13 +7,24 @@
 from logHandler import log
 import tones
 import time
+import wx
 import core
 import controlTypes
 import api
+import config
 import addonHandler
+from .renderer import escapeHTML
 addonHandler.initTranslation()
 
-lastSec = 0
+TRUNCATED_NODES = "nodes"
+TRUNCATED_TIME = "time"
+TRUNCATED_CANCELLED = "cancelled"
+# Seconds between two progress reports while walking a document
+progressInterval = 3.
+# Seconds during which the capture of a virtual document holds the main thread before giving the main loop a turn
+sliceTime = .05
+# Number of nodes visited between two checks of the clock and of the cancel event
+checkInterval = 64
 
 
 def isVirtualDocument():
@@ -21,58 +32,163 @@ def isVirtualDocument():
 	return hasattr(obj, "rootNVDAObject")
 
 
-def getHTML(obj, previousTag=None, pre=True):
-	global lastSec
-	try:
-		lastSec_ = int(time.strftime('%S'))
-		if lastSec_ != lastSec and not (lastSec_ % 3):
-			lastSec = lastSec_
-			tones.beep(250, 42)
-		if not obj:
-			return ''
-		out = []
-		tag = None
-		if hasattr(obj, "IA2Attributes") and "tag" in obj.IA2Attributes.keys():
-			tag = obj.IA2Attributes["tag"]
-		elif hasattr(obj, "HTMLNodeName"):
-			tag = obj.HTMLNodeName.lower()
-		if tag and pre:
-			if tag == 'a':
-				out.append('\n<a href="%s">' %
-						   (obj.value.strip() if obj.value else '#'))
+def beepProgress(count):
+	tones.beep(250, 42)
+
+
+def getNodeHTML(obj, previousTag, parentRole, parentName):
+	"""Reads the properties of obj once.
+	Returns the markup before and after its children, its children, its role and (for labels) its name."""
+	tag = None
+	attrs = getattr(obj, "IA2Attributes", None)
+	if attrs and "tag" in attrs:
+		tag = attrs["tag"]
+	else:
+		nodeName = getattr(obj, "HTMLNodeName", None)
+		if nodeName:
+			tag = nodeName.lower()
+	states = obj.states
+	role = obj.role
+	children = obj.children
+	before = []
+	if tag:
+		if tag == 'a':
+			value = obj.value
+			before.append('\n<a href="%s">' % (value.strip() if value else '#'))
+		else:
+			before.append("\n<%s>" % tag)
+	if controlTypes.STATE_CHECKED in states:
+		before.append("✓")
+	elif controlTypes.STATE_CHECKABLE in states:
+		before.append("◻")
+	if controlTypes.STATE_HALFCHECKED in states:
+		before.append("<->")
+	name = None
+	if not children or role == controlTypes.ROLE_LABEL:
+		name = obj.name
+	if not children and name and (previousTag != "li" or name != "• "):
+		if parentRole is None:
+			parent = obj.parent
+			parentRole = parent.role if parent else None
+			if parentRole == controlTypes.ROLE_LABEL:
+				parentName = parent.name
+		if parentRole != controlTypes.ROLE_LABEL or parentName != name:
+			before.append(name)
+	after = []
+	if role == controlTypes.ROLE_EDITABLETEXT:
+		after.append("………")
+		value = obj.value
+		if value:
+			if controlTypes.STATE_MULTILINE in states:
+				after.append("<pre>%s</pre>" % escapeHTML(value))
 			else:
-				out.append("\n<%s>" % tag)
-		if pre:
-			if controlTypes.STATE_CHECKED in obj.states:
-				out.append("✓")
-			elif controlTypes.STATE_CHECKABLE in obj.states:
-				out.append("◻")
-			if controlTypes.STATE_HALFCHECKED in obj.states:
-				out.append("<->")
-		if obj.children:
-			for child in obj.children:
-				try:
-					out.append(getHTML(child, tag))
-				except core.CallCancelled:
-					out.append(getHTML(child, tag, pre=False))
-		elif previousTag != "li" or (previousTag == "li" and obj.name not in ["• "]):
-			if obj.name and (obj.parent.role != controlTypes.ROLE_LABEL or (obj.parent.role == controlTypes.ROLE_LABEL and obj.parent.name != obj.name)):
-				out.append(obj.name)
-		if obj.role == controlTypes.ROLE_EDITABLETEXT:
-			out.append("………")
-			if obj.value:
-				beg = "<pre>" if controlTypes.STATE_MULTILINE in obj.states else '<code>'
-				end = "</pre>" if controlTypes.STATE_MULTILINE in obj.states else '</code>'
-				out.append(beg + escapeHTML(obj.value) + end)
-		if tag:
-			out.append("</%s>\n" % tag)
-	except core.CallCancelled:
-		log.debug("error!")
-	return ''.join(out)
-
-
-def getAllHTML():
+				after.append("<code>%s</code>" % escapeHTML(value))
+	if tag:
+		after.append("</%s>\n" % tag)
+	return ''.join(before), ''.join(after), tag, children, role, name
+
+
+def getHTML(obj, cancelEvent=None, onProgress=beepProgress, maxNodes=0, maxTime=0):
+	"""Returns the HTML of the tree rooted at obj, the number of visited nodes and the reason why the walk stopped early, if it did.
+	The tree is walked with an explicit stack, so deep documents cannot exceed the recursion limit.
+	The walk stops when cancelEvent is set, when a call to the document is cancelled
+	or when maxNodes nodes or maxTime seconds are exceeded (0 means no limit).
+	The HTML gathered so far is then returned with its open tags closed.
+	onProgress is called with the number of visited nodes every progressInterval seconds."""
+	walk = walkHTML(obj, cancelEvent, onProgress, maxNodes, maxTime)
+	try:
+		while True:
+			next(walk)
+	except StopIteration as stop:
+		return stop.value
+
+
+def walkHTML(obj, cancelEvent=None, onProgress=beepProgress, maxNodes=0, maxTime=0):
+	"""Generator walking the tree as getHTML does, pausing every checkInterval nodes. Returns what getHTML returns."""
+	out = []
+	# Items are either the closing markup of a node or the tuple (node, tag, role and name of its parent).
+	stack = [(obj, None, None, None)]
+	count = 0
+	truncated = None
+	now = time.monotonic()
+	nextProgress = now + progressInterval
+	deadline = now + maxTime if maxTime else None
+	while stack:
+		item = stack.pop()
+		if item.__class__ is str:
+			out.append(item)
+			continue
+		if count == maxNodes and maxNodes:
+			truncated = TRUNCATED_NODES
+			break
+		count += 1
+		if not count % checkInterval:
+			if cancelEvent and cancelEvent.is_set():
+				truncated = TRUNCATED_CANCELLED
+				break
+			now = time.monotonic()
+			if deadline and now >= deadline:
+				truncated = TRUNCATED_TIME
+				break
+			if now >= nextProgress:
+				nextProgress = now + progressInterval
+				if onProgress:
+					onProgress(count)
+			yield count
+		node = item[0]
+		if not node:
+			continue
+		try:
+			before, after, tag, children, role, name = getNodeHTML(*item)
+		except core.CallCancelled:
+			log.debugWarning("Call cancelled after %d nodes, capture stopped" % count)
+			truncated = TRUNCATED_CANCELLED
+			break
+		if not children:
+			out.append(before + after)
+			continue
+		out.append(before)
+		if after:
+			stack.append(after)
+		stack.extend([(child, tag, role, name) for child in reversed(children)])
+	out.extend([item for item in reversed(stack) if item.__class__ is str])
+	return ''.join(out), count, truncated
+
+
+def getTruncationMarker(count, truncated):
+	reasons = {
+		TRUNCATED_NODES: _("node limit reached"),
+		TRUNCATED_TIME: _("time limit reached"),
+		TRUNCATED_CANCELLED: _("capture cancelled"),
+	}
+	msg = _("Partial document: capture stopped after {count} elements ({reason})").format(
+		count=count, reason=reasons[truncated])
+	return '\n<p class="MDF_truncated" role="note">[%s]</p>\n' % msg
+
+
+def getAllHTML(onDone, cancelEvent=None):
+	"""Captures the HTML of the current virtual document, then calls onDone with it, an error flag and capture statistics.
+	The capture runs on the main thread, as it reads the document, but gives the main loop a turn every sliceTime seconds:
+	NVDA keeps responding meanwhile, and running the script again can set cancelEvent.
+	The capture is bounded by the virtualDocuments settings; a partial document ends with a truncation marker."""
 	if not isVirtualDocument():
-		return _("Invalid document"), True
+		return onDone(_("Invalid document"), True, None)
 	obj = api.getReviewPosition().obj
-	return ''.join(getHTML(obj.rootNVDAObject)), False
+	conf = config.conf["markdownForever"]["virtualDocuments"]
+	start = time.monotonic()
+	walk = walkHTML(obj.rootNVDAObject, cancelEvent, maxNodes=conf["maxNodes"], maxTime=conf["maxTime"])
+
+	def step():
+		sliceEnd = time.monotonic() + sliceTime
+		try:
+			while time.monotonic() < sliceEnd:
+				next(walk)
+		except StopIteration as stop:
+			html, count, truncated = stop.value
+			if truncated:
+				html += getTruncationMarker(count, truncated)
+			stats = {"nodes": count, "seconds": time.monotonic() - start, "truncated": truncated}
+			return onDone(html, False, stats)
+		# A timer rather than wx.CallAfter, so that the timers of NVDA (which run the scripts) are not starved
+		wx.CallLater(1, step)
+	step()
@@ -0,0 +1,78 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Load test of the preview HTTP server.
+
+Start the server from NVDA first, then run with any Python 3 interpreter:
+	python HTTPServerLoad.py http://127.0.0.1:8794/readme.md [--clients 8] [--requests 50] [--revalidate]
+Each client keeps its connection alive. With --revalidate, clients send the
+ETag they got back, as browsers do when reloading.
+"""
+
+import argparse
+import http.client
+import threading
+import time
+import urllib.parse as urlParse
+
+
+def client(url, count, revalidate, latencies, errors):
+	parts = urlParse.urlsplit(url)
+	path = parts.path or '/'
+	if parts.query:
+		path += '?' + parts.query
+	connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+	etag = None
+	for i in range(count):
+		headers = {"If-None-Match": etag} if revalidate and etag else {}
+		start = time.perf_counter()
+		try:
+			connection.request("GET", path, headers=headers)
+			response = connection.getresponse()
+			response.read()
+		except (OSError, http.client.HTTPException) as err:
+			errors.append(err)
+			connection.close()
+			continue
+		latencies.append(time.perf_counter() - start)
+		if response.status not in (200, 304):
+			errors.append(response.status)
+		etag = response.getheader("ETag") or etag
+	connection.close()
+
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("url")
+	parser.add_argument("--clients", type=int, default=8)
+	parser.add_argument("--requests", type=int, default=50, help="requests per client")
+	parser.add_argument("--revalidate", action="store_true")
+	args = parser.parse_args()
+	latencies = []
+	errors = []
+	threads = [
+		threading.Thread(target=client, args=(args.url, args.requests, args.revalidate, latencies, errors))
+		for i in range(args.clients)
+	]
+	start = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - start
+	print(f"{len(latencies)} requests in {elapsed:.2f} s, {len(errors)} errors")
+	if latencies:
+		print(f"{len(latencies) / elapsed:.1f} requests/s")
+		print(f"p50 {percentile(latencies, 50) * 1000:.2f} ms, p99 {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+	main()
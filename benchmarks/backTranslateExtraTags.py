@@ -0,0 +1,56 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Back-translation of the extra tags before an HTML to Markdown conversion.
+
+Compares backTranslateExtraTags, which scans the document with the tokenizer
+of _html.parser and only rewrites the extra tag elements, against the former
+way: a whole BeautifulSoup tree, searched then serialized back. Both results
+are checked to give the same Markdown.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+from globalPlugins.markdownForever import common
+from bs4 import BeautifulSoup
+
+
+def legacyBackTranslateExtraTags(text):
+	soup = BeautifulSoup(text, "html.parser")
+	matches = soup.findAll(["span", "div"], class_=re.compile(r"^extratag_%.+%$"))
+	for match in matches:
+		extratag = match["class"][-1].split('_', 1)[-1]
+		try:
+			match.string.replaceWith(extratag)
+			match.unwrap()
+		except AttributeError:
+			pass
+	return str(soup)
+
+
+def render(markdown):
+	metadata, text = common.extractMetadata(markdown)
+	metadata["extratags-back"] = True
+	return common.renderHTML(text, metadata, useTemplateHTML=False)[1]
+
+
+def main(sections=200):
+	for extratags in (True, False):
+		html = render(benchutils.sampleMarkdown(sections, extratags=extratags))
+		count = html.count("extratag_")
+		print(f"{len(html) / 1024:.0f} KiB of HTML, {count} extra tags")
+		assert common.html2text.html2text(legacyBackTranslateExtraTags(html)) == common.html2text.html2text(common.backTranslateExtraTags(html))
+		benchutils.report("  BeautifulSoup tree", *benchutils.measure(legacyBackTranslateExtraTags, html))
+		benchutils.report("  tokenizer scan", *benchutils.measure(common.backTranslateExtraTags, html))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,77 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks that only exercise the vendored libraries run with any Python 3
+interpreter. Those that need the add-on itself (NVDA modules, config) must be
+run from the NVDA Python console, for example:
+	import runpy; runpy.run_path(r"C:\\path\\to\\benchmarks\\convertToHTML.py", run_name="__main__")
+The results themselves are checked by the tests (see the tests folder): the
+scripts only measure.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+addonDir = os.path.join(benchDir, "..", "addon", "globalPlugins", "markdownForever")
+libDir = os.path.normpath(os.path.join(addonDir, "lib"))
+
+
+def addLibPath():
+	if libDir not in sys.path:
+		sys.path.insert(0, libDir)
+
+
+def addAddonPath():
+	"""Makes the modules of the add-on that do not depend on NVDA importable, with the vendored libraries."""
+	addLibPath()
+	if addonDir not in sys.path:
+		sys.path.insert(0, addonDir)
+
+
+def measure(func, *args, repeat=3, **kwargs):
+	"""Returns the best wall time (in seconds) and the peak traced memory (in bytes) of func."""
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		func(*args, **kwargs)
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	tracemalloc.start()
+	try:
+		func(*args, **kwargs)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return best, peak
+
+
+def report(label, seconds, peak=None):
+	line = f"{label:<40} {seconds * 1000:10.2f} ms"
+	if peak is not None:
+		line += f" {peak / 1048576:9.2f} MiB"
+	print(line)
+
+
+def sampleMarkdown(sections=200, extratags=True):
+	"""Generates a Markdown document looking like our manuals."""
+	tag = " %NVDAVersion% (%addonVersion%)" if extratags else ''
+	out = []
+	for i in range(sections):
+		out.append(f"# Chapter {i}\n")
+		out.append(f"Introduction of chapter {i}{tag}, with *emphasis*, `code` and a [link](https://example.com/{i}).\n")
+		for j in range(3):
+			out.append(f"## Section {i}.{j}\n")
+			out.append("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4 + tag + '\n')
+			out.append("- first item\n- second item with **bold**\n- third item\n")
+			out.append("```\nprint(\"%s\")\n```\n" % ("%day%" if extratags else "day"))
+			out.append("| Key | Value |\n|-----|-------|\n| a | 1 |\n| b | 2 |\n")
+	return '\n'.join(out)
@@ -0,0 +1,64 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Memory held by the BeautifulSoup tree of a document of 100,000 nodes.
+
+The tree is what convertToHTML keeps alive while the extra tags, the
+numbering of the headings and the table of contents are applied. Its size is
+traced with tracemalloc once the parse is over, then the parse itself is
+timed. Runs with any Python 3 interpreter.
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addLibPath()
+from bs4 import BeautifulSoup
+
+# Nodes (tags and strings) of one section, the line breaks included
+sectionNodes = 48
+
+
+def sampleHTML(nodes=100000):
+	out = []
+	for i in range(-(-nodes // sectionNodes)):
+		out.append(
+			f"<h2 id=\"section-{i}\">Section {i}</h2>\n"
+			f"<p>Introduction of section {i}, with <em>emphasis</em>, <code>code</code> and a <a href=\"https://example.com/{i}\">link</a>.</p>\n"
+			"<ul>\n<li>first item</li>\n<li>second item with <strong>bold</strong></li>\n<li>third item</li>\n</ul>\n"
+			"<pre><code>print(\"hello\")\n</code></pre>\n"
+			"<table>\n<tr><th>Key</th><th>Value</th></tr>\n<tr><td>a</td><td>1</td></tr>\n</table>\n"
+		)
+	return ''.join(out)
+
+
+def parse(html):
+	return BeautifulSoup(html, "html.parser")
+
+
+def main():
+	html = sampleHTML()
+	gc.collect()
+	tracemalloc.start()
+	try:
+		soup = parse(html)
+		gc.collect()
+		size = tracemalloc.get_traced_memory()[0]
+	finally:
+		tracemalloc.stop()
+	nodes = sum(1 for node in soup.descendants)
+	print(f"{len(html) / 1024:.0f} KiB of HTML, {nodes} nodes")
+	print(f"  tree: {size / 1048576:.2f} MiB, {size / nodes:.0f} bytes per node")
+	del soup
+	benchutils.report("  parse", *benchutils.measure(parse, html))
+
+
+if __name__ == "__main__":
+	main()
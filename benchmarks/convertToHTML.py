@@ -0,0 +1,144 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Wall time and peak memory of convertToHTML.
+
+Compares the single-parse pipeline against the former one, copied below, which
+parsed the document three times (plus once per extra tag match) and prettified
+the result. The caches of the renders are cleared before each run.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+from globalPlugins.markdownForever import common, renderer
+import markdown2
+from bs4 import BeautifulSoup
+
+
+# The former pipeline, as convertToHTML ran it with save, useTemplateHTML and display off, less the locale changes
+
+def legacyMd2HTML(md, metadata=None):
+	extras = common.getMarkdown2Extras()
+	if metadata and metadata["toc"]:
+		extras.append("toc")
+	return markdown2.markdown(md, extras=extras)
+
+
+def legacyProcessExtraTags(soup, lang='', allRepl=True, allowBacktranslate=True):
+	for toSearch, replaceBy, replaceAlways in common.getReplacements(lang):
+		if allRepl or replaceAlways:
+			matches = soup.findAll(text=re.compile(r".{0,}%s.{0,}" % toSearch))
+			for match in matches:
+				parents = [parent.name for parent in match.parents]
+				if "code" not in parents and "pre" not in parents:
+					if allowBacktranslate:
+						tag = "div" if "%toc%" in toSearch else "span"
+						newContent = str(match.string).replace(
+							toSearch, '<%s class="extratag_%s">%s</%s>' % (tag, toSearch, replaceBy, tag))
+						match.string.replaceWith(BeautifulSoup(newContent))
+					else:
+						match.string.replaceWith(match.string.replace(toSearch, replaceBy))
+	return True, soup
+
+
+def legacyApplyAutoNumberHeadings(soup):
+	matches = soup.findAll(re.compile(r"h[0-6]"), recursive=True)
+	l = []
+	previousHeadingLevel = 0
+	for match in matches:
+		if match.text.strip().startswith(renderer.internalAutoNumber):
+			match.string.replaceWith(match.string.replace(renderer.internalAutoNumber, ""))
+			continue
+		currentHeadingLevel = int(match.name[-1])
+		if currentHeadingLevel == previousHeadingLevel:
+			l[-1] += 1
+		elif currentHeadingLevel < previousHeadingLevel:
+			l = l[0:currentHeadingLevel]
+			l[-1] += 1
+		else:
+			l += [0] * (currentHeadingLevel - previousHeadingLevel)
+			l[-1] = 1
+		current = '.'.join([str(k) for k in l])
+		current = re.sub(r"^(0\.)+(.+)$", r"\2", current)
+		match.string.replaceWith("%s. %s" % (current, match.string))
+		previousHeadingLevel = currentHeadingLevel
+	return soup
+
+
+def legacyAddBackToc(content, before=["h1"], after=["h2"]):
+	if not before and not after:
+		return content
+	soup = BeautifulSoup(content, "html.parser")
+	if before:
+		for m in soup.find_all(before)[1:]:
+			link_toc_back = soup.new_tag('a')
+			link_toc_back["href"] = "#doc-toc"
+			link_toc_back.string = _("Back to Table of Contents")
+			m.insert_before(link_toc_back)
+	if after:
+		for m in soup.find_all(after):
+			link_toc_back = soup.new_tag('a')
+			link_toc_back["href"] = "#doc-toc"
+			link_toc_back.string = _("Back to Table of Contents")
+			m.insert_after(link_toc_back)
+	return soup.prettify()
+
+
+def legacyConvert(text, metadata):
+	res = legacyMd2HTML(text, metadata)
+	toc_html = None
+	if res.toc_html and res.toc_html.count("<li>") > 1:
+		toc_html = res.toc_html
+	body = str(res)
+	del res
+	content = BeautifulSoup(body, "html.parser")
+	if metadata["autonumber-headings"]:
+		if toc_html:
+			toc_html = toc_html.replace("<ul>", "<ol>").replace("</ul>", "</ol>")
+		content = legacyApplyAutoNumberHeadings(content)
+	if metadata["extratags"]:
+		ok, content = legacyProcessExtraTags(content, allowBacktranslate=metadata["extratags-back"])
+	content = str(content)
+	if toc_html:
+		if metadata["toc-back"]:
+			before, after = common.translate_back_toc(metadata["toc-back"])
+			content = legacyAddBackToc(content, before, after)
+		if renderer.internalTocTag not in content:
+			pre = '<h1 id="doc-toc-h1">%s</h1>' % _("Table of contents")
+			content = pre + renderer.internalTocTag + content
+		content = content.replace(renderer.internalTocTag, '<nav role="doc-toc" id="doc-toc">%s</nav>' % toc_html)
+	else:
+		content = content.replace(renderer.internalTocTag, '%toc%')
+	if metadata["lang"] != common.defaultLanguage:
+		content = "<div lang=\"%s\">%s</div>" % (metadata["lang"], content)
+	return content
+
+
+def convert(text, metadata):
+	# Each run renders the whole document, as the former pipeline does
+	renderer.renderedHTMLCache.clear()
+	with renderer.markdownersLock:
+		renderer.markdowners.clear()
+	return common.convertToHTML(text, metadata, useTemplateHTML=False, display=False)
+
+
+def main():
+	for sections in (25, 100, 400):
+		text = benchutils.sampleMarkdown(sections)
+		metadata, text = common.extractMetadata(text)
+		metadata.update({"toc": True, "toc-back": "b1,a2", "autonumber-headings": True, "extratags": True})
+		print(f"{sections} chapters, {len(text) / 1048576:.2f} MiB of Markdown")
+		benchutils.report("  former pipeline", *benchutils.measure(legacyConvert, text, metadata, repeat=1))
+		benchutils.report("  single-parse pipeline", *benchutils.measure(convert, text, metadata, repeat=1))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Substitution of the extra tags in a document holding thousands of them.
+
+Compares processExtraTags, which walks the document once with a pattern
+matching every extra tag, against the former way: a findAll over the whole
+document per extra tag, then a walk up the parents of each match to skip
+code and pre elements and, for the back-translation, a parse of each
+matching text once its extra tags are replaced. The outputs differ, the former
+way nesting a document per match, so they are not compared. Both include the
+parse and the serialization of the HTML, timed alone first.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+from globalPlugins.markdownForever import common
+from bs4 import BeautifulSoup
+
+
+def legacyProcessExtraTags(soup, lang='', allRepl=True, allowBacktranslate=True):
+	"""processExtraTags before the single pass, less the locale changes."""
+	for toSearch, replaceBy, replaceAlways in common.getReplacements(lang):
+		if allRepl or replaceAlways:
+			matches = soup.findAll(text=re.compile(r".{0,}%s.{0,}" % toSearch))
+			for match in matches:
+				parents = [parent.name for parent in match.parents]
+				if "code" not in parents and "pre" not in parents:
+					if allowBacktranslate:
+						tag = "div" if "%toc%" in toSearch else "span"
+						newContent = str(match.string).replace(
+							toSearch, '<%s class="extratag_%s">%s</%s>' % (tag, toSearch, replaceBy, tag))
+						match.string.replaceWith(BeautifulSoup(newContent))
+					else:
+						match.string.replaceWith(match.string.replace(toSearch, replaceBy))
+	return soup
+
+
+def parse(html):
+	return BeautifulSoup(html, "html.parser")
+
+
+def parseAndSerialize(html):
+	return str(parse(html))
+
+
+def legacy(html, allowBacktranslate):
+	return str(legacyProcessExtraTags(parse(html), allowBacktranslate=allowBacktranslate))
+
+
+def singlePass(html, allowBacktranslate):
+	return str(common.processExtraTags(parse(html), allowBacktranslate=allowBacktranslate)[1])
+
+
+def main(sections=500):
+	html = str(common.md2HTML(benchutils.sampleMarkdown(sections)))
+	count = len(re.findall(r"%\w+%", html))
+	print(f"{len(html) / 1024:.0f} KiB of HTML, {count} extra tags (some in code blocks)")
+	benchutils.report("  parse and serialization only", *benchutils.measure(parseAndSerialize, html))
+	for allowBacktranslate in (True, False):
+		print("With back-translation" if allowBacktranslate else "Without back-translation")
+		benchutils.report("  findAll per extra tag", *benchutils.measure(legacy, html, allowBacktranslate))
+		benchutils.report("  single pass", *benchutils.measure(singlePass, html, allowBacktranslate))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Parsing of metadata blocks: vendored yaml.FullLoader against frontMatter.parse.
+
+The blocks are the ones of the documentation, written by yaml.dump, and the
+kind of block users type by hand. A block that frontMatter can not handle is
+reported, as it would fall back to yaml. tests/test_frontMatter.py checks that
+both read the blocks alike.
+Runs with any Python 3 interpreter.
+"""
+
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addAddonPath()
+import frontMatter
+import yaml
+
+handWritten = """title: My notes %date%
+author: [Jane Doe, 'John ''JD'' Doe']
+lang: fr
+toc: yes
+autonumber-headings: 0
+css: style.css
+path: '%userprofile%/Documents'"""
+
+
+def getSamples():
+	samples = {"hand-written": handWritten}
+	for fp in sorted(glob.glob(os.path.join(benchutils.addonDir, "..", "..", "doc", "*.md"))):
+		with open(fp, encoding="UTF-8-sig") as f:
+			text = f.read()
+		if not text.startswith("---"):
+			continue
+		ln = "\r\n" if text[3] == "\r" else "\n"
+		block = text[0:text.index(ln * 2)]
+		samples[os.path.basename(fp)] = block[3:-3].strip()
+	return samples
+
+
+def yamlLoad(source, count):
+	for i in range(count):
+		metadata = {}
+		for doc in yaml.load_all(source, Loader=yaml.FullLoader):
+			metadata = doc
+	return metadata
+
+
+def fastLoad(source, count):
+	for i in range(count):
+		metadata = frontMatter.parse(source)
+	return metadata
+
+
+def main(count=200):
+	print(f"{count} parses of each block")
+	for name, source in getSamples().items():
+		metadata = frontMatter.parse(source)
+		if metadata is None:
+			print(f"{name}: not flat, parsed by yaml")
+			continue
+		print(f"{name}: {len(source)} characters, {len(metadata)} keys")
+		benchutils.report("  yaml.FullLoader", *benchutils.measure(yamlLoad, source, count))
+		benchutils.report("  frontMatter", *benchutils.measure(fastLoad, source, count))
+
+
+if __name__ == "__main__":
+	main()
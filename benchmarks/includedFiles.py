@@ -0,0 +1,68 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Pages sharing the same header and footer through include-before and include-after.
+
+The header includes a fragment of its own, as our documentation does with
+dependencies.md. Every page is run through extractMetadata, first with the
+include cache emptied before each page, as before it existed, then with it.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+from globalPlugins.markdownForever import common
+
+
+def writeFile(fp, text):
+	with open(fp, "w", encoding="UTF-8") as f:
+		f.write(text)
+
+
+def makePages(tmpDir, count):
+	header = os.path.join(tmpDir, "header.md")
+	footer = os.path.join(tmpDir, "footer.md")
+	links = os.path.join(tmpDir, "links.md")
+	writeFile(links, '\n'.join(f"- [Link {i}](https://example.com/{i})" for i in range(50)) + '\n')
+	writeFile(header, f"---\ntitle: Header\ninclude-after: '{links}'\n---\n\n" + benchutils.sampleMarkdown(2, extratags=False))
+	writeFile(footer, "---\nauthor: [Jane, John]\n---\n\n" + benchutils.sampleMarkdown(1, extratags=False))
+	return [
+		f"---\ntitle: Page {i}\ninclude-before: '{header}'\ninclude-after: '{footer}'\n---\n\n# Page {i}\n\nText of page {i}.\n"
+		for i in range(count)
+	]
+
+
+def extractAll(pages, cached):
+	for page in pages:
+		if not cached:
+			common.includedFiles.clear()
+		common.extractMetadata(page)
+
+
+def main(count=300):
+	tmpDir = tempfile.mkdtemp()
+	try:
+		pages = makePages(tmpDir, count)
+		print(f"{count} pages including a header (which includes a list of links) and a footer")
+		for cached in (False, True):
+			common.includedFiles.clear()
+			before = common.includedFiles.stats()
+			seconds, peak = benchutils.measure(extractAll, pages, cached, repeat=1)
+			stats = common.includedFiles.stats()
+			benchutils.report("  include cache" if cached else "  without include cache", seconds, peak)
+			# measure runs the pages twice: once timed, once traced
+			print(f"    {stats['reads'] - before['reads']} reads, {stats['saved'] - before['saved']} saved")
+	finally:
+		shutil.rmtree(tmpDir)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,70 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Peak memory of loading a large Markdown file, up to the text handed to the renderer.
+
+The former way read the file, sliced off the BOM, decoded everything, then
+extractMetadata sliced and stripped the body and concatenated it with the
+included files. fileLoader maps the file instead and decodes the body once.
+The mapped pages belong to the file cache, so they are not traced.
+Runs with any Python 3 interpreter.
+"""
+
+import codecs
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addAddonPath()
+import fileLoader
+
+
+def writeSample(fp, size):
+	section = benchutils.sampleMarkdown(10, extratags=False).encode("UTF-8")
+	with open(fp, "wb") as f:
+		f.write(codecs.BOM_UTF8 + b"---\ntitle: Big log\nlang: en\n---\n\n")
+		written = 0
+		while written < size:
+			f.write(section)
+			written += len(section)
+
+
+def legacyLoad(fp):
+	f = open(fp, "rb")
+	raw = f.read()
+	if raw.startswith(codecs.BOM_UTF8):
+		raw = raw[3:]
+	f.close()
+	text = raw.decode()
+	ln = text[3]
+	end = text.index(ln * 2) - 3
+	metadataBlock = text[0:end + 3]
+	text = text[end + 3:].strip()
+	return metadataBlock, '' + '\n' + text + '\n' + ''
+
+
+def load(fp):
+	metadataBlock, text = fileLoader.loadMarkdown(fp)
+	return metadataBlock, '' + text + ''
+
+
+def main(size=50 * 1024 * 1024):
+	fd, fp = tempfile.mkstemp(suffix=".md")
+	os.close(fd)
+	try:
+		writeSample(fp, size)
+		print(f"{os.path.getsize(fp) / 1048576:.0f} MiB file")
+		assert legacyLoad(fp) == load(fp)
+		benchutils.report("  read and decode", *benchutils.measure(legacyLoad, fp, repeat=1))
+		benchutils.report("  memory-mapped loader", *benchutils.measure(load, fp, repeat=1))
+	finally:
+		os.remove(fp)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,40 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Re-rendering time of markdown2 after editing one paragraph.
+
+Compares Markdown.convert with Markdown.convert_incremental. Runs with any
+Python 3 interpreter.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addLibPath()
+import markdown2
+
+extras = ["fenced-code-blocks", "footnotes", "header-ids", "spoiler", "strike", "tables", "task_list", "underline", "wiki-tables", "toc"]
+
+
+def main():
+	for sections in (25, 100, 400):
+		text = benchutils.sampleMarkdown(sections, extratags=False)
+		edited = text.replace("Introduction of chapter 1,", "Introduction of chapter 1 (edited),")
+		print(f"{sections} chapters, {text.count(chr(10))} lines")
+		benchutils.report("  convert", *benchutils.measure(
+			markdown2.Markdown(extras=extras).convert, edited, repeat=1))
+		markdowner = markdown2.Markdown(extras=extras)
+		benchutils.report("  convert_incremental, first call", *benchutils.measure(
+			lambda: markdown2.Markdown(extras=extras).convert_incremental(text), repeat=1))
+		markdowner.convert_incremental(text)
+		benchutils.report("  convert_incremental, edit then undo", *benchutils.measure(
+			lambda: (markdowner.convert_incremental(edited), markdowner.convert_incremental(text)), repeat=3))
+
+
+if __name__ == "__main__":
+	main()
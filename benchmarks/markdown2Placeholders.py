@@ -0,0 +1,44 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Scaling of markdown2 with the number of hashed spans.
+
+Code spans, inline HTML and links are replaced by placeholders during the
+conversion, then swapped back. The time per span should stay flat as the
+document grows. Runs with any Python 3 interpreter.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addLibPath()
+import markdown2
+
+extras = ["fenced-code-blocks", "footnotes", "header-ids", "tables"]
+
+
+def sampleSpans(paragraphs):
+	"""Generates paragraphs made of code spans, inline HTML and links (5 spans each)."""
+	return '\n\n'.join(
+		f"Press `key{i}` then <kbd>Enter</kbd>, see `doc_{i}()`, <span class=\"x\">note {i}</span> and [page](https://example.com/{i})."
+		for i in range(paragraphs))
+
+
+def main():
+	for paragraphs in (200, 1000, 5000):
+		text = sampleSpans(paragraphs)
+		spans = paragraphs * 5
+		print(f"{spans} spans, {len(text) / 1024:.0f} KiB of Markdown")
+		for safeMode in (None, "escape"):
+			seconds, peak = benchutils.measure(markdown2.markdown, text, extras=extras, safe_mode=safeMode, repeat=1)
+			benchutils.report(f"  safe_mode={safeMode}", seconds, peak)
+			benchutils.report("    per 1000 spans", seconds * 1000 / spans)
+
+
+if __name__ == "__main__":
+	main()
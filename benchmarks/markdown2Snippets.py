@@ -0,0 +1,48 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Per-conversion overhead of markdown2 on small snippets.
+
+Converting a selection or a short message is dominated by fixed costs
+(instance setup, regex lookups) rather than by the text itself. Runs with any
+Python 3 interpreter.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addLibPath()
+import markdown2
+
+extras = ["fenced-code-blocks", "footnotes", "header-ids", "spoiler", "strike", "tables", "task_list", "underline", "wiki-tables", "toc"]
+snippets = {
+	"one line": "Hello *world*, see [NVDA](https://www.nvaccess.org).",
+	"list": "- first item\n- second item with **bold**\n  - nested `code`\n1. one\n2. two\n",
+	"table": "| Key | Value |\n|-----|-------|\n| a | 1 |\n| b | 2 |\n",
+	"code": "Some text.\n\n```\nprint(\"hello\")\n```\n\n    indented code\n",
+}
+
+
+def perCall(func, text, count):
+	start = time.perf_counter()
+	for i in range(count):
+		func(text)
+	return (time.perf_counter() - start) / count
+
+
+def main(count=2000):
+	for label, text in snippets.items():
+		print(f"{label} ({len(text)} characters), {count} conversions")
+		benchutils.report("  markdown2.markdown", perCall(lambda text: markdown2.markdown(text, extras=extras), text, count))
+		markdowner = markdown2.Markdown(extras=extras)
+		benchutils.report("  Markdown.convert, shared instance", perCall(markdowner.convert, text, count))
+
+
+if __name__ == "__main__":
+	main()
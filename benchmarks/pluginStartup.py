@@ -0,0 +1,116 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Import time of the add-on at NVDA startup, broken down per module.
+
+The global plugin is imported again from scratch, with every module load timed,
+then the vendored libraries are loaded as on the first conversion. The modules
+of the running add-on are put back afterwards.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import importlib
+import importlib.abc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+
+packageName = "globalPlugins.markdownForever"
+vendored = ("bs4", "soupsieve", "yaml", "_yaml", "markdown2", "html2text", "html2markdown", "_html", "_markupbase", "winClipboard")
+
+
+class TimingLoader:
+	"""Wraps the loader of a module to time its execution."""
+
+	def __init__(self, loader, name, finder):
+		self._loader = loader
+		self._name = name
+		self._finder = finder
+
+	def create_module(self, spec):
+		return self._loader.create_module(spec)
+
+	def exec_module(self, module):
+		self._finder.stack.append(0.)
+		start = time.perf_counter()
+		try:
+			self._loader.exec_module(module)
+		finally:
+			elapsed = time.perf_counter() - start
+			children = self._finder.stack.pop()
+			if self._finder.stack:
+				self._finder.stack[-1] += elapsed
+			else:
+				self._finder.total += elapsed
+			self._finder.times[self._name] = (elapsed, elapsed - children)
+
+	def __getattr__(self, attr):
+		return getattr(self._loader, attr)
+
+
+class TimingFinder(importlib.abc.MetaPathFinder):
+
+	def __init__(self):
+		self.times = {}
+		self.stack = []
+		self.total = 0.
+
+	def find_spec(self, name, path, target=None):
+		for finder in sys.meta_path:
+			if finder is self or not hasattr(finder, "find_spec"):
+				continue
+			spec = finder.find_spec(name, path, target)
+			if spec is None:
+				continue
+			if spec.loader and hasattr(spec.loader, "exec_module"):
+				spec.loader = TimingLoader(spec.loader, name, self)
+			return spec
+		return None
+
+	def report(self, title):
+		print(f"{title}: {len(self.times)} modules, {self.total * 1000:.1f} ms")
+		for name, (inclusive, exclusive) in sorted(self.times.items(), key=lambda e: -e[1][0])[:25]:
+			benchutils.report(f"  {name}", inclusive)
+			if exclusive < inclusive:
+				benchutils.report("    itself", exclusive)
+		self.times.clear()
+		self.total = 0.
+
+
+def isAddonModule(name):
+	return name == packageName or name.startswith(packageName + '.') or name.split('.')[0] in vendored
+
+
+def main():
+	saved = {name: module for name, module in sys.modules.items() if isAddonModule(name)}
+	for name in saved:
+		del sys.modules[name]
+	parent = sys.modules[packageName.rpartition('.')[0]]
+	finder = TimingFinder()
+	sys.meta_path.insert(0, finder)
+	try:
+		importlib.import_module(packageName)
+		finder.report("Plugin import")
+		loaded = [name for name in vendored if name in sys.modules]
+		print("  vendored libraries loaded at startup:", ', '.join(loaded) or "none")
+		lazyModules = importlib.import_module(packageName + ".lazyModules")
+		for module in lazyModules.modules:
+			module.load()
+		finder.report("First conversion")
+	finally:
+		sys.meta_path.remove(finder)
+		for name in [name for name in sys.modules if isAddonModule(name)]:
+			del sys.modules[name]
+		sys.modules.update(saved)
+		if packageName in saved:
+			setattr(parent, packageName.rpartition('.')[2], saved[packageName])
+
+
+if __name__ == "__main__":
+	main()
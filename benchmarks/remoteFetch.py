@@ -0,0 +1,65 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Remote fetches against a local stub HTTP server.
+
+Compares repeated fetches from the same host with and without connection
+reuse. The redirections, time-outs, size cap and charsets are checked by
+tests/test_remoteFetch.py. Runs with any Python 3 interpreter.
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+benchutils.addAddonPath()
+import remoteFetch
+
+page = ("<html><head><meta charset=\"ISO-8859-1\"><title>Caf\xe9</title></head><body>"
+	+ "<p>Cr\xe8me br\xfbl\xe9e.</p>" * 200 + "</body></html>").encode("ISO-8859-1")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	disable_nagle_algorithm = True
+
+	def log_message(self, *args):
+		pass
+
+	def do_GET(self):
+		self.send_response(200)
+		self.send_header("Content-Type", "text/html")
+		self.send_header("Content-Length", str(len(page)))
+		self.end_headers()
+		self.wfile.write(page)
+
+
+class StubServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+
+def fetchAll(url, count, reuse):
+	for i in range(count):
+		pool = remoteFetch.pool if reuse else remoteFetch.ConnectionPool()
+		remoteFetch.fetchText(url, connectionPool=pool)
+
+
+def main(count=200):
+	server = StubServer(("127.0.0.1", 0), StubHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	base = "http://127.0.0.1:%d" % server.server_address[1]
+	print(f"{count} fetches of a {len(page) / 1024:.0f} KiB page")
+	for reuse in (False, True):
+		seconds, peak = benchutils.measure(fetchAll, base + "/page", count, reuse, repeat=1)
+		benchutils.report("  pooled connection" if reuse else "  new connection each time", seconds, peak)
+	server.shutdown()
+
+
+if __name__ == "__main__":
+	main()
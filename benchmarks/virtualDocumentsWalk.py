@@ -0,0 +1,180 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Walk of a synthetic accessibility tree by virtualDocuments.getHTML.
+
+The tree is made of stub objects exposing the properties read from NVDAObjects.
+Each property read is counted, since on a real web page every read is a
+cross-process call. Compares the explicit-stack walker against the former
+recursive one, walks a deeply nested tree the former one cannot handle, then
+captures a larger tree with a node budget.
+Must be run from the NVDA Python console (see benchutils).
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchutils
+import controlTypes
+import core
+from globalPlugins.markdownForever import virtualDocuments
+from globalPlugins.markdownForever.common import escapeHTML
+
+reads = [0]
+
+
+class StubObject:
+	"""Imitates an NVDAObject of a virtual buffer."""
+
+	def __init__(self, tag, role, name='', value=None, states=()):
+		self._attrs = {"tag": tag} if tag else {}
+		self._role = role
+		self._name = name
+		self._value = value
+		self._states = set(states)
+		self._children = []
+		self._parent = None
+
+	def append(self, child):
+		child._parent = self
+		self._children.append(child)
+		return child
+
+	def _read(attr):
+		def getter(self):
+			reads[0] += 1
+			return getattr(self, attr)
+		return property(getter)
+
+	IA2Attributes = _read("_attrs")
+	role = _read("_role")
+	name = _read("_name")
+	value = _read("_value")
+	states = _read("_states")
+	children = _read("_children")
+	parent = _read("_parent")
+
+
+def buildTree(nodes):
+	"""Generates a page of about nodes objects: sections of headings, paragraphs, links, lists and forms."""
+	root = StubObject("body", controlTypes.ROLE_DOCUMENT)
+	count = 1
+	i = 0
+	while count < nodes:
+		section = root.append(StubObject("div", controlTypes.ROLE_SECTION))
+		section.append(StubObject("h2", controlTypes.ROLE_HEADING)).append(
+			StubObject(None, controlTypes.ROLE_STATICTEXT, f"Heading {i}"))
+		p = section.append(StubObject("p", controlTypes.ROLE_PARAGRAPH))
+		p.append(StubObject(None, controlTypes.ROLE_STATICTEXT, f"Paragraph {i} with a "))
+		p.append(StubObject("a", controlTypes.ROLE_LINK, value=f"https://example.com/{i}")).append(
+			StubObject(None, controlTypes.ROLE_STATICTEXT, "link"))
+		ul = section.append(StubObject("ul", controlTypes.ROLE_LIST))
+		for j in range(3):
+			li = ul.append(StubObject("li", controlTypes.ROLE_LISTITEM))
+			li.append(StubObject(None, controlTypes.ROLE_STATICTEXT, "• "))
+			li.append(StubObject(None, controlTypes.ROLE_STATICTEXT, f"item {i}.{j}"))
+		form = section.append(StubObject("form", controlTypes.ROLE_FORM))
+		label = form.append(StubObject("label", controlTypes.ROLE_LABEL, "Accept"))
+		label.append(StubObject(None, controlTypes.ROLE_STATICTEXT, "Accept"))
+		form.append(StubObject("input", controlTypes.ROLE_CHECKBOX, "Accept",
+			states=(controlTypes.STATE_CHECKABLE,)))
+		form.append(StubObject("input", controlTypes.ROLE_EDITABLETEXT, "Comment", f"<comment {i}>",
+			states=(controlTypes.STATE_MULTILINE,)))
+		count += 19
+		i += 1
+	return root
+
+
+def buildDeepTree(depth):
+	root = obj = StubObject("body", controlTypes.ROLE_DOCUMENT)
+	for i in range(depth):
+		obj = obj.append(StubObject("div", controlTypes.ROLE_SECTION))
+	obj.append(StubObject(None, controlTypes.ROLE_STATICTEXT, "bottom"))
+	return root
+
+
+def legacyGetHTML(obj, previousTag=None, pre=True):
+	"""The former recursive walker, without its per node beep check."""
+	try:
+		if not obj:
+			return ''
+		out = []
+		tag = None
+		if hasattr(obj, "IA2Attributes") and "tag" in obj.IA2Attributes.keys():
+			tag = obj.IA2Attributes["tag"]
+		elif hasattr(obj, "HTMLNodeName"):
+			tag = obj.HTMLNodeName.lower()
+		if tag and pre:
+			if tag == 'a':
+				out.append('\n<a href="%s">' %
+						   (obj.value.strip() if obj.value else '#'))
+			else:
+				out.append("\n<%s>" % tag)
+		if pre:
+			if controlTypes.STATE_CHECKED in obj.states:
+				out.append("✓")
+			elif controlTypes.STATE_CHECKABLE in obj.states:
+				out.append("◻")
+			if controlTypes.STATE_HALFCHECKED in obj.states:
+				out.append("<->")
+		if obj.children:
+			for child in obj.children:
+				try:
+					out.append(legacyGetHTML(child, tag))
+				except core.CallCancelled:
+					out.append(legacyGetHTML(child, tag, pre=False))
+		elif previousTag != "li" or (previousTag == "li" and obj.name not in ["• "]):
+			if obj.name and (obj.parent.role != controlTypes.ROLE_LABEL or (obj.parent.role == controlTypes.ROLE_LABEL and obj.parent.name != obj.name)):
+				out.append(obj.name)
+		if obj.role == controlTypes.ROLE_EDITABLETEXT:
+			out.append("………")
+			if obj.value:
+				beg = "<pre>" if controlTypes.STATE_MULTILINE in obj.states else '<code>'
+				end = "</pre>" if controlTypes.STATE_MULTILINE in obj.states else '</code>'
+				out.append(beg + escapeHTML(obj.value) + end)
+		if tag:
+			out.append("</%s>\n" % tag)
+	except core.CallCancelled:
+		pass
+	return ''.join(out)
+
+
+def run(label, func, root, nodes):
+	reads[0] = 0
+	start = time.perf_counter()
+	html = func(root)
+	seconds = time.perf_counter() - start
+	benchutils.report(f"  {label}", seconds)
+	print(f"    {nodes / seconds:,.0f} nodes/s, {reads[0] / nodes:.2f} property reads per node")
+	return html
+
+
+def main(nodes=50000):
+	root = buildTree(nodes)
+	print(f"{nodes} nodes")
+	walk = lambda obj: virtualDocuments.getHTML(obj, onProgress=None)[0]
+	former = run("recursive walker", legacyGetHTML, root, nodes)
+	current = run("explicit-stack walker", walk, root, nodes)
+	print("  same HTML" if former == current else "  HTML differs!")
+	depth = sys.getrecursionlimit() * 2
+	root = buildDeepTree(depth)
+	print(f"{depth} nested nodes")
+	try:
+		legacyGetHTML(root)
+		print("  recursive walker: ok")
+	except RecursionError:
+		print("  recursive walker: RecursionError")
+	run("explicit-stack walker", walk, root, depth + 2)
+	root = buildTree(nodes * 4)
+	print(f"{nodes * 4} nodes, capture limited to {nodes} nodes")
+	html, count, truncated = virtualDocuments.getHTML(root, onProgress=None, maxNodes=nodes)
+	print(f"  {count} nodes captured ({truncated}), {len(html) / 1024:.0f} KiB of HTML")
+
+
+if __name__ == "__main__":
+	main()
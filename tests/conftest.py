@@ -0,0 +1,15 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+"""Tests of the modules of the add-on that do not need NVDA, run with pytest from the root of the repository."""
+
+import os
+import sys
+
+addonDir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addon", "globalPlugins", "markdownForever"))
+for path in (addonDir, os.path.join(addonDir, "lib")):
+	if path not in sys.path:
+		sys.path.insert(0, path)
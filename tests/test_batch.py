@@ -0,0 +1,85 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import json
+import os
+import tempfile
+import unittest
+
+import batch
+import renderer
+
+document = """---
+title: A <b>title</b> & more
+lang: fr
+css: style.css
+toc: true
+autonumber-headings: true
+---
+
+# One
+
+Year: %Year%.
+
+## Two
+
+text
+"""
+
+
+class TestBatch(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.configDir = self.tmp.name
+		with open(os.path.join(self.configDir, "nvda.ini"), "w", encoding="UTF-8") as writeFile:
+			writeFile.write('[general]\nlanguage = de\n[markdownForever]\ntoc-back = "a2"\nextratags-back = False\n[[HTMLTemplates]]\nmine = My template\n')
+		self.settings = batch.getBuildSettings(self.configDir)
+		batch.configureRenderer(self.settings)
+
+	def tearDown(self):
+		renderer.configure(getConfig=lambda: renderer.defaultConfig, defaultLanguage="en")
+		self.tmp.cleanup()
+
+	def test_readSettings(self):
+		config, language = batch.readSettings(self.configDir)
+		self.assertEqual(language, "de")
+		self.assertEqual(config["toc-back"], "a2")
+		self.assertIs(config["extratags-back"], False)
+		self.assertIs(config["extratags"], True)
+		self.assertEqual(config["HTMLTemplates"], {"mine": "My template"})
+
+	def test_renderDocumentAsTheAddon(self):
+		html = batch.renderDocument(document)
+		self.assertIn('<html lang="fr">', html)
+		self.assertIn("<title>A title &amp; more</title>", html)
+		self.assertIn('<link rel="stylesheet" href="style.css" />', html)
+		self.assertIn('<h1 id="doc-toc-h1">Table of contents</h1>', html)
+		self.assertIn("1.1. Two", html)
+		self.assertIn('<a href="#doc-toc">', html)
+		self.assertNotIn("%Year%", html)
+
+	def test_defaultLanguage(self):
+		self.assertIn('<html lang="de">', batch.renderDocument("# Title\n"))
+
+	def test_unreadableFile(self):
+		digest, size, error = batch.convertFile((os.path.join(self.configDir, "missing.md"), os.path.join(self.configDir, "missing.html")))
+		self.assertIsNone(digest)
+		self.assertIn("FileNotFoundError", error)
+
+	def test_buildFolder(self):
+		rootDir = os.path.join(self.configDir, "docs")
+		os.makedirs(os.path.join(rootDir, "sub"))
+		for name in ("a.md", os.path.join("sub", "b.md")):
+			with open(os.path.join(rootDir, name), "w", encoding="UTF-8") as writeFile:
+				writeFile.write(document)
+		stats = batch.buildFolder(rootDir, settings=self.settings, jobs=1)
+		self.assertEqual((stats["converted"], stats["skipped"], stats["errors"]), (2, 0, []))
+		self.assertTrue(os.path.isfile(os.path.join(rootDir, "sub", "b.html")))
+		with open(os.path.join(rootDir, batch.manifestFileName), encoding="UTF-8") as readFile:
+			self.assertEqual(sorted(json.load(readFile)["files"]), ["a.md", "sub/b.md"])
+		stats = batch.buildFolder(rootDir, settings=self.settings, jobs=1)
+		self.assertEqual((stats["converted"], stats["skipped"]), (0, 2))
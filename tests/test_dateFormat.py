@@ -0,0 +1,26 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import unittest
+
+import dateFormat
+
+
+class TestLocaleName(unittest.TestCase):
+
+	def test_languageCodes(self):
+		for lang, localeName in (("fr", "fr"), ("fr_FR", "fr-FR"), ("en-US", "en-US"), ("zh_TW", "zh-TW")):
+			with self.subTest(lang=lang):
+				self.assertEqual(dateFormat.getLocaleName(lang), localeName)
+
+	def test_legacyValues(self):
+		for lang, localeName in (
+			("enu", "en-US"), ("FRA", "fr-FR"), ("esp", "es-ES"), ("chs", "zh-CN"),
+			("french", "fr"), ("English_United States.1252", "en"), ("German_Germany", "de"),
+		):
+			with self.subTest(lang=lang):
+				self.assertEqual(dateFormat.getLocaleName(lang), localeName)
+
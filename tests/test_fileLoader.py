@@ -0,0 +1,57 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import os
+import tempfile
+import unittest
+
+import fileLoader
+import renderer
+
+documents = [
+	"# No metadata\n\ntext\n",
+	"---\ntitle: Title\ntoc: true\n---\n\n# One\n\ntext\n",
+	"---\r\ntitle: Windows line breaks\r\n---\r\n\r\n  text  \r\n\r\n",
+	"\ufeff---\ntitle: BOM\n---\n\n\n\ntext with trailing spaces   \n\n\n",
+	"---\ntitle: No body\n---\n\n",
+	"---\ntitle: Unicode spaces\n---\n\n\u00a0text\u2003\n",
+	"---\ntitle: Unterminated block\n---\ntext",
+	"---\n",
+	"",
+]
+
+
+class TestLoadMarkdown(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.fp = os.path.join(self.tmp.name, "document.md")
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def write(self, text):
+		with open(self.fp, "w", encoding="UTF-8", newline='') as f:
+			f.write(text)
+
+	def test_sameAsExtractMetadata(self):
+		for text in documents:
+			with self.subTest(text=text):
+				self.write(text)
+				metadata, body = renderer.extractMetadata(text.lstrip("\ufeff"))
+				metadataBlock, loadedText = fileLoader.loadMarkdown(self.fp)
+				loadedMetadata, loadedBody = renderer.extractMetadata(loadedText, metadataBlock)
+				# The default file name depends on the time
+				metadata.pop("filename")
+				loadedMetadata.pop("filename")
+				self.assertEqual(loadedMetadata, metadata)
+				self.assertEqual(loadedBody, body)
+
+	def test_readText(self):
+		self.write("\ufeffcafé\n")
+		self.assertEqual(fileLoader.readText(self.fp), "café\n")
+		self.write('')
+		self.assertEqual(fileLoader.readText(self.fp), '')
@@ -0,0 +1,64 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import unittest
+
+import frontMatter
+import yaml
+
+flatBlocks = [
+	"title: My notes %date%\nauthor: [Jane Doe, 'John ''JD'' Doe']\nlang: fr\ntoc: yes\nautonumber-headings: 0\ncss: style.css\npath: '%userprofile%/Documents'",
+	"title: \"Quoted title\"\ntoc: False\nextratags: ~\ncount: -12\nempty:",
+	"css:\n- style.css\n- print.css\ninclude-before: []\nkeywords: [a, 'b', 3, null]",
+	"subtitle: 'single # not a comment'\nlang: en-US\n# A comment line\nfilename: notes_2022",
+]
+# Blocks that parse may leave to yaml, but must not read differently
+otherBlocks = [
+	"title: \"Escaped \\\"quotes\\\"\"",
+	"keywords: [a, \"b, c\"]",
+	"title: A: colon",
+	"title: 0x1F",
+	"title: 012",
+	"toc: y",
+	"items:\n  - indented\n  - list",
+]
+notFlatBlocks = [
+	"base: &anchor value\ncopy: *anchor",
+	"title: !!str 12",
+	"nested:\n  key: value",
+	"description: |\n  two\n  lines",
+	"title: text # comment",
+	"version: 1.5",
+	"date: 2022-01-01",
+]
+
+
+class TestParse(unittest.TestCase):
+
+	def assertSameAsYAML(self, block):
+		self.assertEqual(frontMatter.parse(block), yaml.load(block, Loader=yaml.FullLoader))
+
+	def test_flatBlocks(self):
+		for block in flatBlocks:
+			with self.subTest(block=block):
+				self.assertIsNotNone(frontMatter.parse(block))
+				self.assertSameAsYAML(block)
+
+	def test_otherBlocks(self):
+		for block in otherBlocks:
+			with self.subTest(block=block):
+				metadata = frontMatter.parse(block)
+				if metadata is not None:
+					self.assertSameAsYAML(block)
+
+	def test_yamlDump(self):
+		metadata = {"title": "Markdown Forever", "toc": True, "authors": ["André", "Sof"], "level": 2, "css": None}
+		self.assertEqual(frontMatter.parse(yaml.dump(metadata, allow_unicode=True)), metadata)
+
+	def test_notFlatBlocksFallBack(self):
+		for block in notFlatBlocks:
+			with self.subTest(block=block):
+				self.assertIsNone(frontMatter.parse(block))
@@ -0,0 +1,107 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import os
+import tempfile
+import unittest
+
+import includeCache
+import renderer
+
+
+class TestIncludeCache(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.cache = includeCache.IncludeCache()
+		self.generation = 0
+		self.loads = []
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def write(self, name, text):
+		fp = os.path.join(self.tmp.name, name)
+		with open(fp, "w", encoding="UTF-8") as f:
+			f.write(text)
+		return fp
+
+	def load(self, fp):
+		"""Reads fp, then the files named on its lines starting with "include ", through the cache."""
+		self.loads.append(os.path.basename(fp))
+		with open(fp, encoding="UTF-8") as f:
+			lines = f.read().splitlines()
+		return ''.join(
+			self.cache.get(os.path.join(self.tmp.name, line[8:]), self.generation, self.load) if line.startswith("include ") else line
+			for line in lines
+		)
+
+	def test_cached(self):
+		fp = self.write("a.md", "A\ninclude b.md")
+		self.write("b.md", "B")
+		self.assertEqual(self.cache.get(fp, 0, self.load), "AB")
+		self.assertEqual(self.cache.get(fp, 0, self.load), "AB")
+		self.assertEqual(self.loads, ["a.md", "b.md"])
+		self.generation = 1
+		self.cache.get(fp, self.generation, self.load)
+		self.assertEqual(self.loads, ["a.md", "b.md", "a.md", "b.md"])
+
+	def test_changedDependency(self):
+		fp = self.write("a.md", "A\ninclude b.md")
+		self.write("b.md", "B")
+		self.cache.get(fp, 0, self.load)
+		self.write("b.md", "B2")
+		self.assertEqual(self.cache.get(fp, 0, self.load), "AB2")
+
+	def test_recursiveInclusion(self):
+		fp = self.write("a.md", "A\ninclude b.md")
+		self.write("b.md", "B\ninclude a.md")
+		with self.assertRaises(includeCache.RecursiveInclusionError) as context:
+			self.cache.get(fp, 0, self.load)
+		self.assertEqual(str(context.exception).count(includeCache.normalize(fp)), 2)
+		self.assertFalse(self.cache.isIncluding())
+		self.assertEqual(self.cache.stats()["entries"], 0)
+
+	def test_including(self):
+		fp = self.write("a.md", "A\ninclude b.md")
+		child = self.write("b.md", "B")
+		with self.cache.including(fp) as dependencies:
+			self.assertTrue(self.cache.isIncluding())
+			self.cache.get(child, 0, self.load)
+		self.assertEqual([path for path, signature in dependencies], [includeCache.normalize(fp), includeCache.normalize(child)])
+		self.assertEqual(dependencies[1][1], includeCache.getSignature(child))
+
+
+class TestIncludedFiles(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		renderer.includedFiles.clear()
+
+	def tearDown(self):
+		renderer.includedFiles.clear()
+		self.tmp.cleanup()
+
+	def write(self, name, text):
+		fp = os.path.join(self.tmp.name, name)
+		with open(fp, "w", encoding="UTF-8") as f:
+			f.write(text)
+		return fp
+
+	def test_includeBeforeAndAfter(self):
+		header = self.write("header.md", "Header\n")
+		footer = self.write("footer.md", "Footer\n")
+		metadata, text = renderer.extractMetadata(f"---\ninclude-before: ['{header}']\ninclude-after: ['{footer}']\n---\n\nBody\n")
+		self.assertEqual(text.split(), ["Header", "Body", "Footer"])
+
+	def test_recursiveInclusionError(self):
+		first = os.path.join(self.tmp.name, "first.md")
+		second = self.write("second.md", f"---\ninclude-before: ['{first}']\n---\n\nSecond\n")
+		self.write("first.md", f"---\ninclude-before: ['{second}']\n---\n\nFirst\n")
+		metadata, text = renderer.extractMetadata(f"---\ninclude-before: ['{first}']\n---\n\nDocument\n")
+		self.assertIn('<div class="MDF_err" role="complementary">Recursive inclusion of', text)
+		self.assertTrue(text.rstrip().endswith("Document"))
+		self.assertFalse(renderer.includedFiles.isIncluding())
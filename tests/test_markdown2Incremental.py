@@ -0,0 +1,80 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import unittest
+
+import markdown2
+
+extras = ["fenced-code-blocks", "footnotes", "tables", "header-ids", "cuddled-lists"]
+documents = [
+	"> * Lait\nVous pouvez\n\n    code\n\nce qui\n",
+	"# Title\n\nSome *text*.\n\n* a\n* b\n\n    code\n\nEnd.\n",
+	"See [the link][x].\n\n[x]: https://example.com\n\nNext paragraph.\n",
+	"| a | b |\n|---|---|\n| 1 | 2 |\n\nAfter.\n",
+	"```\nfenced\n\ncode\n```\n\n<div>\nblock\n</div>\n\ntext[^1]\n\n[^1]: note\n",
+	"",
+]
+
+
+class TestConvertIncremental(unittest.TestCase):
+
+	def assertSameAsConvert(self, text, extras=extras):
+		expected = markdown2.Markdown(extras=extras).convert(text)
+		markdowner = markdown2.Markdown(extras=extras)
+		self.assertEqual(markdowner.convert_incremental(text), expected)
+		self.assertEqual("".join(markdowner.convert_iter(text)), expected)
+
+	def test_documents(self):
+		for text in documents:
+			with self.subTest(text=text):
+				self.assertSameAsConvert(text)
+
+	def test_blockquoteContinuedAfterIndentedCode(self):
+		self.assertSameAsConvert("> * Lait\nVous pouvez\n\n    code\n\nce qui\n", ["fenced-code-blocks"])
+
+	def test_unbalancedFence(self):
+		# The closing fence of the first code block deleted: convert() pairs its opening fence with the next one
+		text = "<blockquote>\n\n```\n* Orange\n* Milk\n\n</blockquote>\n\nwhich appears as:\n\n> * Orange\n\n```\ncode\n```\n\nEnd.\n"
+		self.assertSameAsConvert(text)
+		self.assertSameAsConvert(text.replace("```\ncode", "code"))
+
+	def test_unbalancedHTMLBlock(self):
+		# An end tag left alone, then a balanced block
+		text = "Intro\n\n```\ncode\n```\n\n</blockquote>\n\nwhich appears as:\n\n* item\n\n<blockquote>\n\ntext\n\n</blockquote>\n\nEnd.\n"
+		self.assertSameAsConvert(text)
+		self.assertSameAsConvert(text.replace("</blockquote>\n\nEnd.", "End."))
+		self.assertSameAsConvert("<div>\n\ntext\n\n<div>\n\nmore\n\n</div>\n\nEnd.\n")
+
+	def test_editsUnbalancing(self):
+		text = documents[4] + "\n<blockquote>\n\n```\ncode\n```\n\n</blockquote>\n\nAfter.\n"
+		markdowner = markdown2.Markdown(extras=extras)
+		markdowner.convert_incremental(text)
+		for edited in (text.replace("```\n\n</b", "\n</b"), text.replace("<blockquote>", ''), text.replace("```\nfenced", "fenced")):
+			with self.subTest(text=edited):
+				self.assertEqual(markdowner.convert_incremental(edited), markdown2.Markdown(extras=extras).convert(edited))
+
+	def test_edits(self):
+		markdowner = markdown2.Markdown(extras=extras)
+		for text in documents + documents[::-1]:
+			with self.subTest(text=text):
+				self.assertEqual(markdowner.convert_incremental(text), markdown2.Markdown(extras=extras).convert(text))
+
+	def test_cancelled(self):
+		text = documents[1]
+		markdowner = markdown2.Markdown(extras=extras)
+		checks = []
+		self.assertIsNone(markdowner.convert_incremental(text, lambda: checks.append(None) or len(checks) > 1))
+		self.assertEqual(len(checks), 2)
+		self.assertEqual(markdowner.convert_incremental(text), markdown2.Markdown(extras=extras).convert(text))
+
+	def test_placeholdersForgotten(self):
+		markdowner = markdown2.Markdown(extras=extras)
+		for i in range(50):
+			text = "Doc %d [link](https://example.com/%d) `code %d`\n\n```\nfenced %d\n```\n\n<div>\nblock %d\n</div>\n" % ((i,) * 5)
+			self.assertEqual(markdowner.convert_incremental(text), markdown2.Markdown(extras=extras).convert(text))
+		self.assertLessEqual(len(markdowner._escape_table), len(markdown2.g_escape_table) + 5)
+		self.assertLessEqual(len(markdowner._hashes), 5)
+		self.assertLessEqual(len(markdowner._code_table), 5)
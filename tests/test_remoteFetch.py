@@ -0,0 +1,126 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import codecs
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import remoteFetch
+
+page = "<html><head><meta charset=\"ISO-8859-1\"><title>Café</title></head><body><p>Crème brûlée.</p></body></html>".encode("ISO-8859-1")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, *args):
+		pass
+
+	def send(self, body, status=200, headers=()):
+		self.send_response(status)
+		self.send_header("Content-Type", "text/html")
+		self.send_header("Content-Length", str(len(body)))
+		for header in headers:
+			self.send_header(*header)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if self.path == "/page":
+			self.send(page)
+		elif self.path == "/redirect":
+			self.send(b'', 302, [("Location", "/page")])
+		elif self.path == "/loop":
+			self.send(b'', 302, [("Location", "/loop")])
+		elif self.path == "/slow":
+			time.sleep(1)
+			self.send(page)
+		elif self.path == "/big":
+			self.send(b'x' * 2048)
+		else:
+			self.send(b"Not found", 404)
+
+
+class StubServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def handle_error(self, request, clientAddress):
+		# The client drops the connections of the slow and oversized documents on purpose
+		pass
+
+
+class TestFetch(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.server = StubServer(("127.0.0.1", 0), StubHandler)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.base = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+
+	def setUp(self):
+		self.pool = remoteFetch.ConnectionPool()
+
+	def tearDown(self):
+		self.pool.clear()
+
+	def test_charsetSniffed(self):
+		self.assertIn("Crème brûlée", remoteFetch.fetchText(self.base + "/page", connectionPool=self.pool))
+
+	def test_connectionReused(self):
+		headers = {"User-Agent": "test"}
+		self.assertFalse(remoteFetch.request(self.base + "/page", headers, self.pool, remoteFetch.maxSize)[2])
+		self.assertTrue(remoteFetch.request(self.base + "/page", headers, self.pool, remoteFetch.maxSize)[2])
+
+	def test_redirect(self):
+		body, charset, url = remoteFetch.fetch(self.base + "/redirect", connectionPool=self.pool)
+		self.assertEqual((body, url), (page, self.base + "/page"))
+		with self.assertRaises(remoteFetch.FetchError):
+			remoteFetch.fetch(self.base + "/loop", connectionPool=self.pool)
+
+	def test_errors(self):
+		with self.assertRaisesRegex(remoteFetch.FetchError, "404"):
+			remoteFetch.fetch(self.base + "/missing", connectionPool=self.pool)
+		with self.assertRaises(remoteFetch.FetchError):
+			remoteFetch.fetch("ftp://127.0.0.1/page", connectionPool=self.pool)
+
+	def test_tooLarge(self):
+		with self.assertRaises(remoteFetch.TooLargeError):
+			remoteFetch.fetch(self.base + "/big", connectionPool=self.pool, limit=1024)
+
+	def test_timeout(self):
+		readTimeout = remoteFetch.readTimeout
+		remoteFetch.readTimeout = 0.2
+		try:
+			with self.assertRaises(OSError):
+				remoteFetch.fetch(self.base + "/slow", connectionPool=self.pool)
+		finally:
+			remoteFetch.readTimeout = readTimeout
+
+
+class TestDecode(unittest.TestCase):
+
+	def test_bom(self):
+		self.assertEqual(remoteFetch.decode(codecs.BOM_UTF8 + "café".encode("UTF-8"), "ISO-8859-1"), "café")
+		self.assertEqual(remoteFetch.decode(codecs.BOM_UTF16_LE + "café".encode("UTF-16-LE")), "café")
+
+	def test_metaCharsetBeforeHeader(self):
+		self.assertEqual(remoteFetch.getPossibleEncodings(page, "UTF-8"), ["ISO-8859-1", "UTF-8", "UTF-8"])
+		self.assertIn("Café", remoteFetch.decode(page, "UTF-8"))
+
+	def test_headerCharset(self):
+		self.assertEqual(remoteFetch.decode("café".encode("cp1252"), "cp1252"), "café")
+
+	def test_fallBackToUTF8(self):
+		self.assertEqual(remoteFetch.decode("café".encode("UTF-8"), "unknown-charset"), "café")
+		with self.assertRaises(remoteFetch.EncodingError):
+			remoteFetch.decode(b"caf\xe9")
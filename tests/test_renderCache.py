@@ -0,0 +1,43 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import unittest
+
+import renderCache
+
+
+class TestGetKey(unittest.TestCase):
+
+	def test_keyOrderDoesNotMatter(self):
+		self.assertEqual(renderCache.getKey({"a": 1, "b": 2}), renderCache.getKey({"b": 2, "a": 1}))
+
+	def test_partsAreSeparated(self):
+		self.assertNotEqual(renderCache.getKey("ab", "c"), renderCache.getKey("a", "bc"))
+
+	def test_mixedKeyTypes(self):
+		# Front matter such as "extra:\\n  1: a\\n  b: c"
+		metadata = {"extra": {1: "a", "b": "c"}}
+		self.assertEqual(renderCache.getKey("text", metadata), renderCache.getKey("text", {"extra": {1: "a", "b": "c"}}))
+		self.assertNotEqual(renderCache.getKey("text", metadata), renderCache.getKey("text", {"extra": {1: "a", "b": "d"}}))
+		self.assertIsInstance(renderCache.getKey({(1, 2): "tuple key"}), str)
+
+
+class TestRenderCache(unittest.TestCase):
+
+	def test_leastRecentlyUsedEvicted(self):
+		cache = renderCache.RenderCache(maxSize=10)
+		cache.set("a", "A", size=4)
+		cache.set("b", "B", size=4)
+		self.assertEqual(cache.get("a"), "A")
+		cache.set("c", "C", size=4)
+		self.assertIsNone(cache.get("b"))
+		self.assertEqual(cache.get("a"), "A")
+		self.assertEqual(cache.size, 8)
+
+	def test_tooLargeNotStored(self):
+		cache = renderCache.RenderCache(maxSize=10)
+		cache.set("a", "A", size=11)
+		self.assertEqual(len(cache), 0)
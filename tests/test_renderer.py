@@ -0,0 +1,75 @@
+# Part of Markdown Forever Add-on for NVDA
+# This file is covered by the GNU General Public License.
+# See the file LICENSE for more details.
+# Copyright 2019-2022 André-Abush Clause, Sof and other contributors. Released under GPL.
+# <https://github.com/aaclause/nvda-markdownForever>
+
+import threading
+import unittest
+
+import renderer
+from lazyModules import bs4
+
+
+class TestExtraTags(unittest.TestCase):
+
+	def render(self, markdown, allowBacktranslate=True):
+		soup = bs4.BeautifulSoup(renderer.md2HTML(markdown), "html.parser")
+		ok, soup = renderer.processExtraTags(soup, "en", allowBacktranslate=allowBacktranslate)
+		self.assertTrue(ok)
+		return str(soup)
+
+	def test_codeLeftAsIs(self):
+		html = self.render("%addonVersion% `%addonVersion%`\n\n    %addonVersion%\n")
+		self.assertEqual(html.count("%addonVersion%"), 3)
+		self.assertEqual(html.count('class="extratag_%addonVersion%"'), 1)
+
+	def test_backTranslation(self):
+		markdown = "Today is %day%, `%day%` in code.\n\n%toc%\n\n* %date% and %time%\n"
+		html = self.render(markdown)
+		self.assertNotIn("Today is %day%", html)
+		self.assertEqual(renderer.backTranslateExtraTags(html), str(bs4.BeautifulSoup(renderer.md2HTML(markdown), "html.parser")))
+
+	def test_scanner(self):
+		html = '<p>A <span class="extratag_%day%">Monday</span> <span class="extratag_%day%"><b>bold</b></span> <span class="other">x</span></p>'
+		matches = renderer.ExtraTagsScanner(html).scan()
+		self.assertEqual(matches, [(html.index("<span"), html.index("</span>") + 7, "%day%")])
+		self.assertEqual(renderer.backTranslateExtraTags(html), html.replace('<span class="extratag_%day%">Monday</span>', "%day%"))
+
+
+class TestRender(unittest.TestCase):
+
+	def test_markdownerReused(self):
+		extras = ["tables"]
+		with renderer.getMarkdowner(extras, "document") as markdowner:
+			# Another render of the same document meanwhile gets its own instance
+			with renderer.getMarkdowner(extras, "document") as other:
+				self.assertIsNot(other, markdowner)
+		with renderer.getMarkdowner(extras, "document") as again:
+			self.assertIs(again, markdowner)
+		with renderer.getMarkdowner(extras, "other document") as other:
+			self.assertIsNot(other, markdowner)
+
+	def test_incrementalSameAsFull(self):
+		text = "# Title\n\n* one\n* two\n\n> quote\ncontinued\n"
+		metadata, text = renderer.extractMetadata(text)
+		self.assertEqual(renderer.md2HTML(text, metadata, incremental=True, document="test"), renderer.md2HTML(text, metadata))
+		edited = text.replace("two", "three")
+		self.assertEqual(renderer.md2HTML(edited, metadata, incremental=True, document="test"), renderer.md2HTML(edited, metadata))
+
+	def test_cancelled(self):
+		metadata, text = renderer.extractMetadata("# Title\n\ntext\n")
+		cancelEvent = threading.Event()
+		cancelEvent.set()
+		self.assertEqual(renderer.renderHTML(text, metadata, cancelEvent=cancelEvent), (False, None))
+		ok, html = renderer.renderHTML(text, metadata, cancelEvent=threading.Event())
+		self.assertTrue(ok)
+		self.assertIn("<h1", html)
+
+	def test_timeInTitleNotCached(self):
+		for title, cached in (("Report at %time%", False), ("Version %addonVersion%", True)):
+			with self.subTest(title=title):
+				metadataBlock = "---\ntitle: %s\n---" % title
+				metadata, error = renderer.resolveMetadata(metadataBlock)
+				self.assertNotIn('%', metadata["title"])
+				self.assertEqual(renderer.metadataCache.get((metadataBlock, renderer.configGeneration)) is not None, cached)